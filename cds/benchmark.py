@@ -0,0 +1,280 @@
+"""Benchmark of the storage backends, query engines and CSV ingest of CDS.
+
+Builds the SQLite and Parquet backends from the CSV in a temporary folder
+and loads the CSV into the DuckDB engine, then measures the load time, the
+size on disk, the memory taken by the first round of queries and the cold
+(first call) and warm (median) latency of every cds.database getter. The
+query cache is bypassed, so every call reads the storage.
+
+The ingest is measured on a synthetic CSV of --ingest-rows rows, the source
+repeated with later years, loaded into a new database in a fresh process
+per chunk size: the whole file at once, then each of --chunk-sizes, with
+the load time and the peak resident memory of the process.
+
+Usage (from the project root):
+    python -m cds.benchmark --repeat 20 --ingest-rows 1000000 --output bench.json
+"""
+
+import argparse
+import inspect
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sqlite3
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+from concurrent.futures import ProcessPoolExecutor
+
+import duckdb
+import pandas as pd
+import pyarrow as pa
+
+import cds.columnar as columnar
+import cds.database as database
+from cds.query_plans import QUERY_FUNCTION_ARGS
+from common.migrations import apply_migrations
+
+QUERY_REPEAT = 20
+INGEST_ROWS = 1_000_000
+
+
+def directory_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(
+        os.path.getsize(os.path.join(folder, name))
+        for folder, _, names in os.walk(path)
+        for name in names
+    )
+
+
+def resident_bytes():
+    """Current resident set size of the process (Linux only, else None)."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+def peak_resident_bytes():
+    """Peak resident set size of the process so far (Linux reports KiB)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def write_synthetic_csv(path, rows):
+    """Write a CSV of rows rows, repeating the source with later years."""
+    source = pd.read_csv(database.CSV_PATH, dtype=database.CSV_DTYPES)
+    span = int(source["ano"].max() - source["ano"].min()) + 1
+    written = 0
+    with open(path, "w", newline="") as csv_file:
+        while written < rows:
+            chunk = source.head(rows - written).copy()
+            chunk["ano"] += span * (written // len(source))
+            chunk.to_csv(csv_file, header=written == 0, index=False)
+            written += len(chunk)
+
+
+def measure_ingest(csv_path, db_path, chunk_size):
+    """Load csv_path into a new database at db_path and return its costs.
+
+    Run in a fresh process, so the peak resident memory is the load's own.
+    """
+    connection = sqlite3.connect(db_path)
+    with open(database.INIT_SQL_PATH, "r") as sql_file:
+        connection.executescript(sql_file.read())
+    apply_migrations(connection, database.MIGRATIONS_PATH)
+    connection.close()
+    database.use_database(db_path)
+
+    resident_before = resident_bytes()
+    chunks = []
+    started_at = time.perf_counter()
+    rows = database.load_csv_to_database(
+        path=csv_path,
+        chunk_size=chunk_size,
+        progress=lambda rows_read, *_: chunks.append(rows_read),
+    )
+    elapsed = time.perf_counter() - started_at
+    return {
+        "chunk_size": chunk_size,
+        "chunks": len(chunks),
+        "rows": rows,
+        "load_seconds": round(elapsed, 3),
+        "rows_per_second": round(rows / elapsed),
+        "resident_before_bytes": resident_before,
+        "peak_resident_bytes": peak_resident_bytes(),
+        "disk_bytes": directory_size(db_path),
+    }
+
+
+def benchmark_ingest(folder, rows, chunk_sizes):
+    """Compare the peak memory of loading the whole CSV and of each chunk size."""
+    csv_path = os.path.join(folder, "ingest.csv")
+    write_synthetic_csv(csv_path, rows)
+    results = {"rows": rows, "csv_bytes": os.path.getsize(csv_path), "runs": []}
+    context = multiprocessing.get_context("spawn")
+    for chunk_size in [None, *chunk_sizes]:
+        db_path = os.path.join(folder, f"ingest-{chunk_size or 'whole'}.db")
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            run = executor.submit(measure_ingest, csv_path, db_path, chunk_size)
+            results["runs"].append(run.result())
+        os.remove(db_path)
+    return results
+
+
+def get_query_functions():
+    """The getters of cds.database, without the instrumentation and query cache."""
+    # Unwrapped down to the storage_backend routing, which the benchmark selects
+    return {
+        name: function.__wrapped__.__wrapped__
+        for name, function in inspect.getmembers(database, inspect.isfunction)
+        if name.startswith("get_") and function.__module__ == database.__name__
+    }
+
+
+def time_queries(repeat):
+    """Return {getter: {cold_ms, median_ms}} and the memory of the first round."""
+    tracemalloc.start()
+    resident_before = resident_bytes()
+    arrow_before = pa.total_allocated_bytes()
+    timings = {}
+    for name, function in sorted(get_query_functions().items()):
+        started_at = time.perf_counter()
+        function(*QUERY_FUNCTION_ARGS[name])
+        timings[name] = {"cold_ms": (time.perf_counter() - started_at) * 1000}
+    memory = {
+        "python_peak_bytes": tracemalloc.get_traced_memory()[1],
+        "arrow_bytes": pa.total_allocated_bytes() - arrow_before,
+        "resident_delta_bytes": (
+            resident_bytes() - resident_before if resident_before else None
+        ),
+    }
+    tracemalloc.stop()
+
+    for name, function in sorted(get_query_functions().items()):
+        samples = []
+        for _ in range(repeat):
+            started_at = time.perf_counter()
+            function(*QUERY_FUNCTION_ARGS[name])
+            samples.append((time.perf_counter() - started_at) * 1000)
+        timings[name]["median_ms"] = statistics.median(samples)
+    for timing in timings.values():
+        for key in timing:
+            timing[key] = round(timing[key], 3)
+    return timings, memory
+
+
+def benchmark_sqlite(folder, repeat):
+    database.use_storage_backend("sqlite")
+    db_path = os.path.join(folder, "benchmark.db")
+    database.use_database(db_path)
+    started_at = time.perf_counter()
+    database.connect().close()  # Creates the database and loads the CSV
+    load_seconds = time.perf_counter() - started_at
+    queries, memory = time_queries(repeat)
+    database.POOL.dispose()
+    return {
+        "load_seconds": round(load_seconds, 3),
+        "disk_bytes": directory_size(db_path),
+        "memory": memory,
+        "queries": queries,
+    }
+
+
+def benchmark_parquet(folder, repeat):
+    database.use_storage_backend("parquet")
+    store_path = os.path.join(folder, "parquet")
+    columnar.use_store(store_path)
+    started_at = time.perf_counter()
+    columnar.ensure_store()  # Exports the CSV
+    load_seconds = time.perf_counter() - started_at
+    queries, memory = time_queries(repeat)
+    return {
+        "load_seconds": round(load_seconds, 3),
+        "disk_bytes": directory_size(store_path),
+        "memory": memory,
+        "queries": queries,
+    }
+
+
+def benchmark_duckdb(repeat):
+    database.use_storage_backend("sqlite")
+    database.use_query_engine("duckdb")
+    database.DUCKDB_ENGINE.reset()
+    started_at = time.perf_counter()
+    database.DUCKDB_ENGINE.fetchall("SELECT 1;")  # Loads the CSV
+    load_seconds = time.perf_counter() - started_at
+    queries, memory = time_queries(repeat)
+    database.DUCKDB_ENGINE.reset()
+    return {
+        "load_seconds": round(load_seconds, 3),
+        "disk_bytes": 0,  # In-memory database
+        "memory": memory,
+        "queries": queries,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the storage backends and query engines of CDS."
+    )
+    parser.add_argument("--repeat", type=int, default=QUERY_REPEAT)
+    parser.add_argument(
+        "--ingest-rows",
+        type=int,
+        default=INGEST_ROWS,
+        help="rows of the synthetic CSV of the ingest benchmark, 0 to skip it",
+    )
+    parser.add_argument(
+        "--chunk-sizes",
+        type=int,
+        nargs="+",
+        default=[database.INGEST_CHUNK_SIZE],
+        help="chunk sizes of the ingest benchmark, besides the whole file",
+    )
+    parser.add_argument("--output", help="write the JSON results to this file")
+    args = parser.parse_args()
+
+    db_path, store_path = database.DB_PATH, columnar.STORE_PATH
+    backend, engine = database.STORAGE_BACKEND, database.QUERY_ENGINE
+    results = {
+        "environment": {
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "pyarrow": pa.__version__,
+            "duckdb": duckdb.__version__,
+            "platform": platform.platform(),
+        },
+        "csv_bytes": os.path.getsize(database.CSV_PATH),
+    }
+    try:
+        with tempfile.TemporaryDirectory() as folder:
+            results["sqlite"] = benchmark_sqlite(folder, args.repeat)
+            results["parquet"] = benchmark_parquet(folder, args.repeat)
+            if args.ingest_rows:
+                results["ingest"] = benchmark_ingest(
+                    folder, args.ingest_rows, args.chunk_sizes
+                )
+        results["duckdb"] = benchmark_duckdb(args.repeat)
+    finally:
+        database.use_database(db_path)
+        columnar.use_store(store_path)
+        database.use_storage_backend(backend)
+        database.use_query_engine(engine)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
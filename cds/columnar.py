@@ -0,0 +1,268 @@
+"""Columnar storage backend of the CDS data: Parquet files partitioned by year.
+
+The CSV history is exported to one Parquet file per year, with dictionary
+encoded names and compact integer types, and read back as a single
+memory-mapped Arrow table that the getters aggregate with pyarrow.compute.
+Only the years whose rows changed are rewritten when the CSV changes.
+Selected with cds.database.STORAGE_BACKEND = "parquet".
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from cds.database import CSV_PATH, fingerprint_source
+
+STORE_PATH = "./cds/database/parquet"
+MANIFEST_FILE = "_manifest.json"  # Ignored by the Parquet reader, as "_" files are
+COMPRESSION = "zstd"
+SCHEMA = pa.schema(
+    [
+        ("month", pa.int8()),
+        ("state_code", pa.dictionary(pa.int8(), pa.string())),
+        ("state_name", pa.dictionary(pa.int8(), pa.string())),
+        ("consumption_type", pa.dictionary(pa.int8(), pa.string())),
+        ("consumption", pa.int64()),
+        ("consumer_count", pa.int64()),
+    ]
+)
+PARTITIONING = pa.schema([("year", pa.int16())])
+
+_lock = threading.Lock()
+_manifest = None
+_table = None
+
+
+def use_store(path):
+    """Point the backend at another store folder, e.g. for benchmarks."""
+    global STORE_PATH, _manifest, _table
+    with _lock:
+        STORE_PATH = path
+        _manifest = None
+        _table = None
+
+
+def partition_path(year):
+    return os.path.join(STORE_PATH, f"year={year}", "part-0.parquet")
+
+
+def load_manifest():
+    try:
+        with open(os.path.join(STORE_PATH, MANIFEST_FILE), "r") as manifest_file:
+            return json.load(manifest_file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {"source": None, "partitions": {}}
+
+
+def save_manifest(manifest):
+    path = os.path.join(STORE_PATH, MANIFEST_FILE)
+    with open(path + ".tmp", "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+def is_source_unchanged(manifest, path=CSV_PATH):
+    """Check the CSV against the fingerprint of its last export.
+
+    As for the SQLite backend, the hash is only computed when the size or
+    mtime changed; a touched but identical file just gets its mtime refreshed.
+    """
+    stored = manifest["source"]
+    if stored is None:
+        return False
+    stat = os.stat(path)
+    if (stat.st_size, stat.st_mtime) == (stored["size"], stored["mtime"]):
+        return True
+    fingerprint = fingerprint_source(path)
+    if fingerprint["sha256"] != stored["sha256"]:
+        return False
+    manifest["source"] = fingerprint
+    save_manifest(manifest)
+    return True
+
+
+def read_source(path=CSV_PATH):
+    """Read the CSV into the columns of SCHEMA, plus the year."""
+    data = pd.read_csv(path)
+    return pd.DataFrame(
+        {
+            "year": data["ano"].astype("int16"),
+            "month": data["mes"].astype("int8"),
+            "state_code": data["sigla_uf"],
+            "state_name": data["sigla_uf_nome"],
+            "consumption_type": data["tipo_consumo"],
+            "consumption": data["consumo"].astype("Int64"),
+            "consumer_count": data["numero_consumidores"].astype("Int64"),
+        }
+    )
+
+
+def partition_hash(rows):
+    digest = hashlib.sha256(pd.util.hash_pandas_object(rows, index=False).to_numpy())
+    return digest.hexdigest()
+
+
+def write_partition(year, rows):
+    path = partition_path(year)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    table = pa.Table.from_pandas(rows, schema=SCHEMA, preserve_index=False)
+    pq.write_table(table, path + ".tmp", compression=COMPRESSION)
+    os.replace(path + ".tmp", path)
+
+
+def build_store(path=CSV_PATH):
+    """Export the CSV to the store, rewriting only the years whose rows changed.
+
+    Returns the number of partitions written.
+    """
+    started_at = time.perf_counter()
+    os.makedirs(STORE_PATH, exist_ok=True)
+    manifest = load_manifest()
+    data = read_source(path)
+    partitions = {}
+    written = 0
+    for year, rows in data.groupby("year", sort=True):
+        rows = rows.drop(columns="year")
+        partitions[str(year)] = partition_hash(rows)
+        if manifest["partitions"].get(str(year)) != partitions[str(year)]:
+            write_partition(year, rows)
+            written += 1
+    for year in set(manifest["partitions"]) - set(partitions):
+        shutil.rmtree(os.path.dirname(partition_path(year)), ignore_errors=True)
+    save_manifest(
+        {
+            "source": fingerprint_source(path),
+            "partitions": partitions,
+            "built_at": time.time(),
+        }
+    )
+
+    elapsed = time.perf_counter() - started_at
+    print(
+        f"Exported {len(data)} rows to {written} of {len(partitions)} Parquet "
+        f"partitions in {elapsed:.2f}s"
+    )
+    return written
+
+
+def ensure_store():
+    """Build or refresh the store when the CSV changed, returning its manifest."""
+    global _manifest, _table
+    with _lock:
+        if _manifest is None:
+            _manifest = load_manifest()
+        if not is_source_unchanged(_manifest):
+            build_store()
+            _manifest = load_manifest()
+            _table = None
+        return _manifest
+
+
+def data_version():
+    """Fingerprint of the exported partitions, which change with the data."""
+    partitions = json.dumps(ensure_store()["partitions"], sort_keys=True)
+    return hashlib.sha256(partitions.encode("utf-8")).hexdigest()[:16]
+
+
+def load_table():
+    """Return the whole store as one Arrow table, read once through mmap."""
+    global _table
+    ensure_store()
+    with _lock:
+        if _table is None:
+            _table = pq.read_table(
+                STORE_PATH,
+                partitioning=ds.partitioning(PARTITIONING, flavor="hive"),
+                memory_map=True,
+            )
+        return _table
+
+
+def aggregate(table, key, sort, ascending):
+    """SUM(consumption) by key as (key, total_consumption), sorted like the SQL."""
+    sums = table.group_by(key).aggregate([("consumption", "sum")])
+    result = pa.table({key: sums[key], "total_consumption": sums["consumption_sum"]})
+    order = "ascending" if ascending else "descending"
+    return result.sort_by([(sort, order)])
+
+
+def to_frame(table, **columns):
+    """Convert to pandas, renaming columns and decoding dictionaries like SQLite."""
+    frame = table.to_pandas()
+    for column in frame.columns:
+        if isinstance(frame[column].dtype, pd.CategoricalDtype):
+            frame[column] = frame[column].astype(object)
+        elif pd.api.types.is_integer_dtype(frame[column].dtype):
+            frame[column] = frame[column].astype("int64")
+    return frame.rename(columns=columns)
+
+
+def get_total_consumption_by_year():
+    result = aggregate(load_table(), "year", "year", ascending=True)
+    return to_frame(result)
+
+
+def get_consumption_by_state(year):
+    table = load_table()
+    table = table.filter(pc.equal(table["year"], year))
+    result = aggregate(table, "state_name", "total_consumption", ascending=False)
+    return to_frame(result, state_name="state")
+
+
+def get_consumption_by_type():
+    result = aggregate(
+        load_table(), "consumption_type", "total_consumption", ascending=False
+    )
+    return to_frame(result)
+
+
+def get_avg_consumption_per_capita():
+    table = load_table()
+    table = table.filter(pc.is_valid(table["consumer_count"]))
+    sums = table.group_by("state_name").aggregate(
+        [("consumption", "sum"), ("consumer_count", "sum")]
+    )
+    average = pc.divide(
+        pc.cast(sums["consumption_sum"], pa.float64()), sums["consumer_count_sum"]
+    )
+    # ROUND() of SQLite rounds halves away from zero
+    average = pc.round(average, 2, round_mode="half_towards_infinity")
+    result = pa.table(
+        {"state": sums["state_name"], "avg_consumption_per_capita": average}
+    ).sort_by([("avg_consumption_per_capita", "descending")])
+    return to_frame(result)
+
+
+def get_trends_by_state(state_code):
+    table = load_table()
+    table = table.filter(pc.equal(table["state_code"], state_code))
+    return to_frame(aggregate(table, "year", "year", ascending=True))
+
+
+def get_all_states():
+    """Retrieve all states from the store."""
+    table = load_table()
+    states = table.group_by(["state_code", "state_name"]).aggregate([])
+    states = pa.table(
+        {
+            "code": states["state_code"].cast(pa.string()),
+            "name": states["state_name"].cast(pa.string()),
+        }
+    )
+    return to_frame(states.sort_by([("name", "ascending")]))
+
+
+def get_total_consumption_by_month(year):
+    """Retrieve total energy consumption by month for a specific year."""
+    table = load_table()
+    table = table.filter(pc.equal(table["year"], year))
+    return to_frame(aggregate(table, "month", "month", ascending=True))
@@ -1,176 +1,644 @@
 import sqlite3
 import os
+import hashlib
+import time
+from functools import wraps
+
 import pandas as pd
+from common.cache import QueryCache
+from common.engines import DuckDBEngine, SQLiteEngine, attach_sqlite
+from common.instrumentation import instrumented
+from common.migrations import apply_migrations
+from common.pool import ConnectionPool
 
 DB_PATH = "./cds/database/data.db"
 INIT_SQL_PATH = "./cds/database/init.sql"
+MIGRATIONS_PATH = "./cds/database/migrations"
 CSV_PATH = "./cds/data-source/br_mme_consumo_energia_eletrica.csv"
-DB_INITIALIZED = False
+# Re-ingest new or changed rows when the CSV changes on an existing database
+INCREMENTAL_INGEST = True
+ENERGY_DATA_KEY = ["year", "month", "state_id", "consumption_type_id"]
+# The history only changes when the CSV is re-ingested, see data_version
+QUERY_CACHE_TTL = 3600.0
+# Storage queried by the getters: "sqlite" or "parquet" (see cds/columnar.py)
+STORAGE_BACKEND = "sqlite"
+STORAGE_BACKENDS = ("sqlite", "parquet")
+# Engine running the SQL of the getters: "sqlite" or "duckdb" (common/engines.py)
+QUERY_ENGINE = "sqlite"
+QUERY_ENGINES = ("sqlite", "duckdb")
+# Source of the DuckDB tables: "csv" scans CSV_PATH, "sqlite" reads DB_PATH
+DUCKDB_SOURCE = "csv"
+DUCKDB_SQL_PATH = "./cds/database/duckdb.sql"
+# Tables of DB_PATH read by the getters, mirrored by the "sqlite" DuckDB source
+REPORT_TABLES = (
+    "state",
+    "consumption_type",
+    "rollup_year_state_type",
+    "rollup_year_month",
+    "rollup_state_type",
+)
+# Rows of the CSV read and written at a time, which bounds the ingest memory
+INGEST_CHUNK_SIZE = 50_000
+HASH_BLOCK_SIZE = 1024 * 1024  # Bytes of the CSV read at a time when hashing it
+CSV_DTYPES = {
+    "ano": "int32",
+    "mes": "int32",
+    "sigla_uf": "category",
+    "sigla_uf_nome": "category",
+    "tipo_consumo": "category",
+    "numero_consumidores": "Int64",
+    "consumo": "Int64",
+}
+INGEST_PRAGMAS = (
+    "PRAGMA journal_mode = MEMORY;",
+    "PRAGMA synchronous = OFF;",
+    # The rollup sorts spill to disk past cache_size, bounding the ingest memory
+    "PRAGMA temp_store = FILE;",
+    "PRAGMA cache_size = -65536;",
+)
 
 
-def load_csv_to_database():
-    connection = connect()
-    cursor = connection.cursor()
+def apply_ingest_pragmas(cursor):
+    """Trade durability for speed while the database is being (re)built."""
+    for pragma in INGEST_PRAGMAS:
+        cursor.execute(pragma)
 
-    data = pd.read_csv(CSV_PATH)
 
-    states = data[["sigla_uf", "sigla_uf_nome"]].drop_duplicates()
-    for _, row in states.iterrows():
+def fingerprint_source(path=CSV_PATH, prefix_size=None):
+    """Return the size, mtime and SHA-256 of a source file.
+
+    With prefix_size, prefix_sha256 is the SHA-256 of the file's first
+    prefix_size bytes, computed in the same read.
+    """
+    stat = os.stat(path)
+    digest = hashlib.sha256()
+    fingerprint = {"path": path, "size": stat.st_size, "mtime": stat.st_mtime}
+    with open(path, "rb") as source_file:
+        if prefix_size is not None:
+            remaining = prefix_size
+            while remaining > 0:
+                block = source_file.read(min(HASH_BLOCK_SIZE, remaining))
+                if not block:
+                    break
+                digest.update(block)
+                remaining -= len(block)
+            fingerprint["prefix_sha256"] = digest.hexdigest()
+        for block in iter(lambda: source_file.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    fingerprint["sha256"] = digest.hexdigest()
+    return fingerprint
+
+
+def ends_at_row_boundary(path, size):
+    """Check that the first size bytes of a file end with a whole CSV row."""
+    with open(path, "rb") as source_file:
+        source_file.seek(size - 1)
+        # Either the prefix ends a line or the bytes after it start a new one
+        return any(byte in b"\r\n" for byte in source_file.read(2))
+
+
+def check_source(cursor, path=CSV_PATH):
+    """Compare the source file with the fingerprint of its last ingest.
+
+    Returns (fingerprint, offset, row_count). The fingerprint is None when the
+    file is unchanged. When rows were only appended since, offset and
+    row_count are the bytes and rows already ingested, so the ingest resumes
+    past them; otherwise both are 0 and every row is compared. The file is
+    hashed once, and only when its size or mtime changed; a touched but
+    identical file just gets its mtime refreshed.
+    """
+    stored = cursor.execute(
+        "SELECT size, mtime, sha256, row_count FROM ingest_source WHERE path = ?;",
+        (path,),
+    ).fetchone()
+    if stored is None:
+        return fingerprint_source(path), 0, 0
+
+    size, mtime, sha256, row_count = stored
+    stat = os.stat(path)
+    if (stat.st_size, stat.st_mtime) == (size, mtime):
+        return None, 0, 0
+
+    # The hash of the ingested file is the hash of the prefix it left, if the
+    # new file only had rows appended
+    appended = 0 < size < stat.st_size
+    fingerprint = fingerprint_source(path, size if appended else None)
+    if fingerprint["sha256"] == sha256:
         cursor.execute(
-            "INSERT OR IGNORE INTO state (code, name) VALUES (?, ?);",
-            (row["sigla_uf"], row["sigla_uf_nome"]),
+            "UPDATE ingest_source SET mtime = ? WHERE path = ?;",
+            (fingerprint["mtime"], path),
         )
+        return None, 0, 0
+    if (
+        appended
+        and fingerprint["prefix_sha256"] == sha256
+        and ends_at_row_boundary(path, size)
+    ):
+        return fingerprint, size, row_count
+    return fingerprint, 0, 0
 
-    consumption_types = data["tipo_consumo"].drop_duplicates()
-    for consumption_type in consumption_types:
-        cursor.execute(
-            "INSERT OR IGNORE INTO consumption_type (name) VALUES (?);",
-            (consumption_type,),
+
+def record_source_fingerprint(cursor, fingerprint, row_count):
+    cursor.execute(
+        """
+        INSERT OR REPLACE INTO ingest_source (path, size, mtime, sha256, row_count)
+        VALUES (?, ?, ?, ?, ?);
+        """,
+        (
+            fingerprint["path"],
+            fingerprint["size"],
+            fingerprint["mtime"],
+            fingerprint["sha256"],
+            row_count,
+        ),
+    )
+
+
+def read_csv_chunks(source_file, chunk_size=INGEST_CHUNK_SIZE, names=None):
+    """Read the CSV with the compact CSV_DTYPES, in chunks of chunk_size rows.
+
+    A chunk_size of None reads the whole file as a single chunk. names, if
+    given, are the columns of a file read from past its header line.
+    """
+    chunks = pd.read_csv(
+        source_file,
+        dtype=CSV_DTYPES,
+        chunksize=chunk_size,
+        names=names,
+        header=None if names else "infer",
+    )
+    return [chunks] if chunk_size is None else chunks
+
+
+def prepare_ingest_chunk(cursor):
+    """Create the temporary table holding a chunk during an incremental load."""
+    cursor.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS ingest_chunk (
+            year INTEGER, month INTEGER, state_id INTEGER,
+            consumption_type_id INTEGER, consumption INTEGER, consumer_count INTEGER
+        );
+        """)
+    cursor.execute("DELETE FROM ingest_chunk;")
+
+
+def upsert_changed_rows(cursor, rows):
+    """Upsert only the rows whose key is new or whose values differ.
+
+    The chunk is compared with energy_data in SQLite, through the natural key
+    index, so the stored rows are never loaded into memory. Returns the number
+    of rows written and their years.
+    """
+    prepare_ingest_chunk(cursor)
+    cursor.executemany(
+        "INSERT INTO ingest_chunk VALUES (?, ?, ?, ?, ?, ?);", _to_records(rows)
+    )
+    changed = f"""
+        FROM ingest_chunk c
+        LEFT JOIN energy_data e USING ({", ".join(ENERGY_DATA_KEY)})
+        WHERE e.id IS NULL
+           OR e.consumption IS NOT c.consumption
+           OR e.consumer_count IS NOT c.consumer_count
+    """
+    years = [year for (year,) in cursor.execute(f"SELECT DISTINCT c.year {changed};")]
+    cursor.execute(f"""
+        INSERT INTO energy_data (
+            year, month, state_id, consumption_type_id, consumption, consumer_count
         )
+        SELECT c.year, c.month, c.state_id, c.consumption_type_id,
+               c.consumption, c.consumer_count
+        {changed}
+        ON CONFLICT (year, month, state_id, consumption_type_id) DO UPDATE SET
+            consumption = excluded.consumption,
+            consumer_count = excluded.consumer_count;
+        """)
+    return cursor.rowcount, years
 
-    for _, row in data.iterrows():
-        cursor.execute(
-            """
-            INSERT INTO energy_data (
-                year, month, state_id, consumption_type_id, consumption, consumer_count
-            )
-            VALUES (
-                ?, ?, 
-                (SELECT id FROM state WHERE code = ?), 
-                (SELECT id FROM consumption_type WHERE name = ?), 
-                ?, ?
-            );
-            """,
-            (
-                row["ano"],
-                row["mes"],
-                row["sigla_uf"],
-                row["tipo_consumo"],
-                row["consumo"],
-                row["numero_consumidores"],
-            ),
+
+def refresh_rollups(cursor, years=None):
+    """Rebuild the rollup tables from energy_data, only for the given years if any.
+
+    The state x type totals are re-derived from the yearly rollup, which holds a
+    few thousand rows at most.
+    """
+    if years is None:
+        year_filter, params = "", ()
+    else:
+        years = sorted({int(year) for year in years})
+        if not years:
+            return
+        year_filter = f"WHERE year IN ({', '.join('?' * len(years))})"
+        params = tuple(years)
+
+    cursor.execute(f"DELETE FROM rollup_year_state_type {year_filter};", params)
+    cursor.execute(
+        f"""
+        INSERT INTO rollup_year_state_type (
+            year, state_id, consumption_type_id,
+            consumption, consumer_count, metered_consumption
+        )
+        SELECT year, state_id, consumption_type_id,
+               SUM(consumption),
+               SUM(consumer_count),
+               SUM(CASE WHEN consumer_count IS NOT NULL THEN consumption END)
+        FROM energy_data
+        {year_filter}
+        GROUP BY year, state_id, consumption_type_id;
+        """,
+        params,
+    )
+
+    cursor.execute(f"DELETE FROM rollup_year_month {year_filter};", params)
+    cursor.execute(
+        f"""
+        INSERT INTO rollup_year_month (year, month, consumption)
+        SELECT year, month, SUM(consumption)
+        FROM energy_data
+        {year_filter}
+        GROUP BY year, month;
+        """,
+        params,
+    )
+
+    cursor.execute("DELETE FROM rollup_state_type;")
+    cursor.execute("""
+        INSERT INTO rollup_state_type (
+            state_id, consumption_type_id,
+            consumption, consumer_count, metered_consumption
         )
+        SELECT state_id, consumption_type_id,
+               SUM(consumption), SUM(consumer_count), SUM(metered_consumption)
+        FROM rollup_year_state_type
+        GROUP BY state_id, consumption_type_id;
+        """)
+
+
+def load_csv_to_database(
+    incremental=False, path=CSV_PATH, chunk_size=INGEST_CHUNK_SIZE, progress=None
+):
+    """Stream the CSV into the database inside a single transaction.
+
+    The file is read in chunks of chunk_size rows, each written before the
+    next is read, so the memory taken stays bounded whatever the file size.
+    A full load bulk inserts every row into an empty database. An incremental
+    load is skipped when the source fingerprint is unchanged. When rows were
+    only appended to the file since its last ingest, only those are parsed
+    and upserted; otherwise every row is compared and only the new or changed
+    ones are upserted through the energy_data natural key. Either way only
+    the rollups of the affected years are rebuilt. progress, if given, is
+    called after each chunk with the rows read, the position in the file and
+    its size.
+    """
+    started_at = time.perf_counter()
+    connection = sqlite3.connect(DB_PATH)
+    cursor = connection.cursor()
+    if incremental:
+        fingerprint, offset, row_count = check_source(cursor, path)
+        if fingerprint is None:
+            connection.commit()
+            connection.close()
+            print("CSV source unchanged, skipping ingest")
+            return 0
+    else:
+        apply_ingest_pragmas(cursor)
+        fingerprint, offset, row_count = fingerprint_source(path), 0, 0
+
+    cursor.execute("BEGIN;")
+    total_bytes = os.path.getsize(path)
+    rows_read, rows_written, changed_years = 0, 0, set()
+    with open(path, "rb") as source_file:
+        names = None
+        if offset:
+            # Parse only the rows past the ingested part, under the file's header
+            names = pd.read_csv(source_file, nrows=0).columns.tolist()
+            source_file.seek(offset)
+            print(f"CSV source appended, ingesting past row {row_count}")
+        for data in read_csv_chunks(source_file, chunk_size, names):
+            rows = resolve_chunk(cursor, data)
+            if incremental:
+                written, years = upsert_changed_rows(cursor, rows)
+                changed_years.update(years)
+            else:
+                cursor.executemany(
+                    """
+                    INSERT INTO energy_data (
+                        year, month, state_id, consumption_type_id,
+                        consumption, consumer_count
+                    )
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (year, month, state_id, consumption_type_id) DO UPDATE SET
+                        consumption = excluded.consumption,
+                        consumer_count = excluded.consumer_count;
+                    """,
+                    _to_records(rows),
+                )
+                written = len(rows)
+            rows_read += len(data)
+            rows_written += written
+            if progress is not None:
+                progress(rows_read, source_file.tell(), total_bytes)
+
+    refresh_rollups(cursor, changed_years if incremental else None)
+    record_source_fingerprint(cursor, fingerprint, row_count + rows_read)
+    if incremental:
+        cursor.execute("DROP TABLE IF EXISTS temp.ingest_chunk;")
 
     connection.commit()
     connection.close()
 
+    elapsed = time.perf_counter() - started_at
+    print(
+        f"Loaded {rows_written} rows into energy_data in {elapsed:.2f}s "
+        f"({rows_written / elapsed:.0f} rows/s)"
+    )
+    return rows_written
+
+
+def resolve_chunk(cursor, data):
+    """Insert the chunk's new states and types, returning its energy_data rows."""
+    states = data[["sigla_uf", "sigla_uf_nome"]].drop_duplicates()
+    cursor.executemany(
+        "INSERT OR IGNORE INTO state (code, name) VALUES (?, ?);",
+        states.itertuples(index=False, name=None),
+    )
+
+    consumption_types = data["tipo_consumo"].drop_duplicates()
+    cursor.executemany(
+        "INSERT OR IGNORE INTO consumption_type (name) VALUES (?);",
+        ((consumption_type,) for consumption_type in consumption_types),
+    )
+
+    # Resolve the foreign keys once per chunk instead of two subqueries per row
+    state_ids = dict(cursor.execute("SELECT code, id FROM state;"))
+    consumption_type_ids = dict(
+        cursor.execute("SELECT name, id FROM consumption_type;")
+    )
+
+    return pd.DataFrame(
+        {
+            "year": data["ano"],
+            "month": data["mes"],
+            "state_id": data["sigla_uf"].map(state_ids).astype("int32"),
+            "consumption_type_id": data["tipo_consumo"]
+            .map(consumption_type_ids)
+            .astype("int32"),
+            "consumption": data["consumo"],
+            "consumer_count": data["numero_consumidores"],
+        }
+    )
+
+
+def _to_records(frame):
+    """Convert a DataFrame into plain Python tuples, with NULL for missing values."""
+    columns = [
+        frame[column].astype(object).where(frame[column].notna(), None).tolist()
+        for column in frame.columns
+    ]
+    return zip(*columns)
+
 
 def initialize_database():
-    if not os.path.exists(DB_PATH) or os.stat(DB_PATH).st_size == 0:
+    is_new = not os.path.exists(DB_PATH) or os.stat(DB_PATH).st_size == 0
+    connection = sqlite3.connect(DB_PATH)
+    if is_new:
         with open(INIT_SQL_PATH, "r") as sql_file:
             sql_script = sql_file.read()
-        connection = sqlite3.connect(DB_PATH)
         cursor = connection.cursor()
         cursor.executescript(sql_script)
         connection.commit()
-        connection.close()
+    apply_migrations(connection, MIGRATIONS_PATH)
+    connection.close()
+
+    if is_new:
         load_csv_to_database()
+    elif INCREMENTAL_INGEST:
+        load_csv_to_database(incremental=True)
+
+
+POOL = ConnectionPool(DB_PATH, initializer=initialize_database, name="cds")
 
 
 def connect():
-    global DB_INITIALIZED
-    if not DB_INITIALIZED:
-        initialize_database()
-        DB_INITIALIZED = True
-    return sqlite3.connect(DB_PATH)
+    """Check out a pooled connection; close() returns it to the pool."""
+    return POOL.connect()
 
 
-def get_total_consumption_by_year():
+def use_database(path):
+    """Point the pool at another database file, e.g. for benchmarks.
+
+    The file is created and loaded from the CSV on first use.
+    """
+    global DB_PATH, POOL
+    POOL.dispose()
+    QUERY_CACHE.clear()
+    DB_PATH = path
+    POOL = ConnectionPool(DB_PATH, initializer=initialize_database, name="cds")
+
+
+def use_storage_backend(backend):
+    """Switch the getters to another entry of STORAGE_BACKENDS."""
+    global STORAGE_BACKEND
+    if backend not in STORAGE_BACKENDS:
+        raise ValueError(f"Unknown storage backend: {backend}")
+    STORAGE_BACKEND = backend
+    QUERY_CACHE.clear()
+
+
+def use_query_engine(engine):
+    """Switch the SQL of the getters to another entry of QUERY_ENGINES."""
+    global QUERY_ENGINE
+    if engine not in QUERY_ENGINES:
+        raise ValueError(f"Unknown query engine: {engine}")
+    QUERY_ENGINE = engine
+    QUERY_CACHE.clear()
+
+
+def csv_version():
+    stat = os.stat(CSV_PATH)
+    return (stat.st_size, stat.st_mtime)
+
+
+def load_duckdb(connection, state):
+    """Create the tables of the getters in DuckDB, from DUCKDB_SOURCE.
+
+    The "sqlite" source attaches DB_PATH when DuckDB's sqlite extension is
+    installed and copies the REPORT_TABLES otherwise.
+    """
+    if DUCKDB_SOURCE == "csv":
+        with open(DUCKDB_SQL_PATH, "r") as sql_file:
+            sql_script = sql_file.read()
+        connection.execute(sql_script.format(csv_path=CSV_PATH.replace("'", "''")))
+        return {"source": "csv"}
+
+    if state is not None and state.get("attached"):
+        return state  # The views read the attached file directly
+    if attach_sqlite(connection, DB_PATH, "cds"):
+        for table in REPORT_TABLES:
+            connection.execute(
+                f"CREATE OR REPLACE VIEW {table} AS SELECT * FROM cds.{table};"
+            )
+        return {"source": "sqlite", "attached": True}
+
+    sqlite_connection = connect()
+    try:
+        for table in REPORT_TABLES:
+            rows = pd.read_sql_query(f"SELECT * FROM {table};", sqlite_connection)
+            connection.register("sqlite_rows", rows)
+            connection.execute(
+                f"CREATE OR REPLACE TABLE {table} AS SELECT * FROM sqlite_rows;"
+            )
+            connection.unregister("sqlite_rows")
+    finally:
+        sqlite_connection.close()
+    return {"source": "sqlite", "attached": False}
+
+
+def duckdb_version():
+    return csv_version() if DUCKDB_SOURCE == "csv" else data_version()
+
+
+DUCKDB_ENGINE = DuckDBEngine(load_duckdb, duckdb_version, name="cds")
+
+
+def query_engine():
+    """Return the engine selected by QUERY_ENGINE."""
+    if QUERY_ENGINE == "duckdb":
+        return DUCKDB_ENGINE
+    return SQLiteEngine(connect)
+
+
+def read_report(query, params=()):
+    """Run a getter's query on the selected engine, returning a DataFrame."""
+    return query_engine().frame(query, params)
+
+
+def storage_backend(function):
+    """Route a getter to the function of the same name of the columnar backend."""
+
+    @wraps(function)
+    def wrapper(*args):
+        if STORAGE_BACKEND == "parquet":
+            import cds.columnar as columnar
+
+            return getattr(columnar, function.__name__)(*args)
+        return function(*args)
+
+    return wrapper
+
+
+def data_version():
+    """Fingerprints of the ingested sources, which change with the data."""
+    if STORAGE_BACKEND == "parquet":
+        import cds.columnar as columnar
+
+        return columnar.data_version()
+    if QUERY_ENGINE == "duckdb" and DUCKDB_SOURCE == "csv":
+        return csv_version()
     connection = connect()
+    rows = connection.execute(
+        "SELECT path, sha256, ingested_at FROM ingest_source ORDER BY path;"
+    ).fetchall()
+    connection.close()
+    return tuple(rows)
+
+
+QUERY_CACHE = QueryCache(data_version, ttl=QUERY_CACHE_TTL, name="cds")
+
+
+@instrumented
+@QUERY_CACHE.cached
+@storage_backend
+def get_total_consumption_by_year():
     query = """
     SELECT year, SUM(consumption) AS total_consumption
-    FROM energy_data
+    FROM rollup_year_month
     GROUP BY year
     ORDER BY year;
     """
-    result = pd.read_sql_query(query, connection)
-    connection.close()
-    return result
+    return read_report(query)
 
 
+@instrumented
+@QUERY_CACHE.cached
+@storage_backend
 def get_consumption_by_state(year):
-    connection = connect()
     query = """
-    SELECT s.name AS state, SUM(e.consumption) AS total_consumption
-    FROM energy_data e
-    JOIN state s ON e.state_id = s.id
-    WHERE e.year = ?
+    SELECT s.name AS state, SUM(r.consumption) AS total_consumption
+    FROM rollup_year_state_type r
+    JOIN state s ON r.state_id = s.id
+    WHERE r.year = ?
     GROUP BY s.name
     ORDER BY total_consumption DESC;
     """
-    result = pd.read_sql_query(query, connection, params=(year,))
-    connection.close()
-    return result
+    return read_report(query, (year,))
 
 
+@instrumented
+@QUERY_CACHE.cached
+@storage_backend
 def get_consumption_by_type():
-    connection = connect()
     query = """
-    SELECT c.name AS consumption_type, SUM(e.consumption) AS total_consumption
-    FROM energy_data e
-    JOIN consumption_type c ON e.consumption_type_id = c.id
+    SELECT c.name AS consumption_type, SUM(r.consumption) AS total_consumption
+    FROM rollup_state_type r
+    JOIN consumption_type c ON r.consumption_type_id = c.id
     GROUP BY c.name
     ORDER BY total_consumption DESC;
     """
-    result = pd.read_sql_query(query, connection)
-    connection.close()
-    return result
+    return read_report(query)
 
 
+@instrumented
+@QUERY_CACHE.cached
+@storage_backend
 def get_avg_consumption_per_capita():
-    connection = connect()
     query = """
     SELECT s.name AS state, 
-           ROUND(SUM(e.consumption) * 1.0 / SUM(e.consumer_count), 2) AS avg_consumption_per_capita
-    FROM energy_data e
-    JOIN state s ON e.state_id = s.id
-    WHERE e.consumer_count IS NOT NULL
+           ROUND(SUM(r.metered_consumption) * 1.0 / SUM(r.consumer_count), 2) AS avg_consumption_per_capita
+    FROM rollup_state_type r
+    JOIN state s ON r.state_id = s.id
+    WHERE r.consumer_count IS NOT NULL
     GROUP BY s.name
     ORDER BY avg_consumption_per_capita DESC;
     """
-    result = pd.read_sql_query(query, connection)
-    connection.close()
-    return result
+    return read_report(query)
 
 
+@instrumented
+@QUERY_CACHE.cached
+@storage_backend
 def get_trends_by_state(state_code):
-    connection = connect()
     query = """
-    SELECT e.year, SUM(e.consumption) AS total_consumption
-    FROM energy_data e
-    JOIN state s ON e.state_id = s.id
+    SELECT r.year, SUM(r.consumption) AS total_consumption
+    FROM rollup_year_state_type r
+    JOIN state s ON r.state_id = s.id
     WHERE s.code = ?
-    GROUP BY e.year
-    ORDER BY e.year;
+    GROUP BY r.year
+    ORDER BY r.year;
     """
-    result = pd.read_sql_query(query, connection, params=(state_code,))
-    connection.close()
-    return result
+    return read_report(query, (state_code,))
 
 
+@instrumented
+@QUERY_CACHE.cached
+@storage_backend
 def get_all_states():
     """Retrieve all states from the database."""
-    connection = connect()
     query = """
     SELECT code, name
     FROM state
     ORDER BY name;
     """
-    result = pd.read_sql_query(query, connection)
-    connection.close()
-    return result
+    return read_report(query)
 
 
+@instrumented
+@QUERY_CACHE.cached
+@storage_backend
 def get_total_consumption_by_month(year):
     """Retrieve total energy consumption by month for a specific year."""
-    connection = connect()
     query = """
-    SELECT month, SUM(consumption) AS total_consumption
-    FROM energy_data
+    SELECT month, consumption AS total_consumption
+    FROM rollup_year_month
     WHERE year = ?
-    GROUP BY month
     ORDER BY month;
     """
-    result = pd.read_sql_query(query, connection, params=(year,))
-    connection.close()
-    return result
+    return read_report(query, (year,))
@@ -0,0 +1,49 @@
+-- Tables read by the cds.database getters on the DuckDB engine,
+-- built straight from the CSV ({csv_path}) with the same names and columns as
+-- the SQLite schema. Everything is materialized once per CSV version, so the
+-- getters aggregate in-memory columnar tables.
+CREATE OR REPLACE TABLE source AS
+SELECT * FROM read_csv('{csv_path}', header = true);
+
+CREATE OR REPLACE TABLE state AS
+SELECT row_number() OVER (ORDER BY sigla_uf) AS id, sigla_uf AS code, sigla_uf_nome AS name
+FROM (SELECT DISTINCT sigla_uf, sigla_uf_nome FROM source);
+
+CREATE OR REPLACE TABLE consumption_type AS
+SELECT row_number() OVER (ORDER BY tipo_consumo) AS id, tipo_consumo AS name
+FROM (SELECT DISTINCT tipo_consumo FROM source);
+
+CREATE OR REPLACE TABLE energy_data AS
+SELECT
+  src.ano AS year,
+  src.mes AS month,
+  s.id AS state_id,
+  c.id AS consumption_type_id,
+  CAST(src.consumo AS BIGINT) AS consumption,
+  CAST(src.numero_consumidores AS BIGINT) AS consumer_count
+FROM source src
+JOIN state s ON s.code = src.sigla_uf
+JOIN consumption_type c ON c.name = src.tipo_consumo;
+
+CREATE OR REPLACE TABLE rollup_year_state_type AS
+SELECT year, state_id, consumption_type_id,
+       SUM(consumption) AS consumption,
+       SUM(consumer_count) AS consumer_count,
+       SUM(CASE WHEN consumer_count IS NOT NULL THEN consumption END) AS metered_consumption
+FROM energy_data
+GROUP BY year, state_id, consumption_type_id;
+
+CREATE OR REPLACE TABLE rollup_year_month AS
+SELECT year, month, SUM(consumption) AS consumption
+FROM energy_data
+GROUP BY year, month;
+
+CREATE OR REPLACE TABLE rollup_state_type AS
+SELECT state_id, consumption_type_id,
+       SUM(consumption) AS consumption,
+       SUM(consumer_count) AS consumer_count,
+       SUM(metered_consumption) AS metered_consumption
+FROM rollup_year_state_type
+GROUP BY state_id, consumption_type_id;
+
+DROP TABLE source;
@@ -0,0 +1,12 @@
+-- Natural key of a monthly record, used to upsert new CSV drops incrementally
+CREATE UNIQUE INDEX IF NOT EXISTS energy_data_key ON energy_data (year, month, state_id, consumption_type_id);
+
+CREATE TABLE
+  IF NOT EXISTS ingest_source (
+    path TEXT PRIMARY KEY, -- Path of the ingested CSV file
+    size INTEGER NOT NULL, -- File size in bytes
+    mtime REAL NOT NULL, -- Last modification time of the file
+    sha256 TEXT NOT NULL, -- Content hash of the file
+    row_count INTEGER NOT NULL, -- Number of rows in the file
+    ingested_at DATETIME DEFAULT CURRENT_TIMESTAMP
+  );
@@ -0,0 +1,12 @@
+-- Covering indexes matched to the access patterns of the cds.database getters
+-- Consumption by month of a year, and by year (scanned in year order)
+CREATE INDEX IF NOT EXISTS energy_data_year_month ON energy_data (year, month, consumption);
+
+-- Consumption by state for a year
+CREATE INDEX IF NOT EXISTS energy_data_year_state ON energy_data (year, state_id, consumption);
+
+-- Trends of a state over the years and consumption per capita by state
+CREATE INDEX IF NOT EXISTS energy_data_state_year ON energy_data (state_id, year, consumption, consumer_count);
+
+-- Consumption by consumption type
+CREATE INDEX IF NOT EXISTS energy_data_type ON energy_data (consumption_type_id, consumption);
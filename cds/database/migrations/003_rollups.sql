@@ -0,0 +1,80 @@
+-- Materialized rollups of energy_data, kept in sync by the ingest path.
+-- metered_consumption only sums the rows that report a consumer count, so it can
+-- be divided by consumer_count for the consumption per capita.
+CREATE TABLE
+  IF NOT EXISTS rollup_year_state_type (
+    year INTEGER NOT NULL,
+    state_id INTEGER NOT NULL, -- Foreign key for state
+    consumption_type_id INTEGER NOT NULL, -- Foreign key for consumption type
+    consumption INTEGER, -- Energy consumption in MWh
+    consumer_count INTEGER, -- Sum of the monthly number of consumers
+    metered_consumption INTEGER, -- Consumption of the rows with a consumer count
+    PRIMARY KEY (year, state_id, consumption_type_id),
+    FOREIGN KEY (state_id) REFERENCES state (id),
+    FOREIGN KEY (consumption_type_id) REFERENCES consumption_type (id)
+  ) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS rollup_year_state_type_state ON rollup_year_state_type (state_id, year, consumption);
+
+CREATE TABLE
+  IF NOT EXISTS rollup_year_month (
+    year INTEGER NOT NULL,
+    month INTEGER NOT NULL,
+    consumption INTEGER, -- Energy consumption in MWh
+    PRIMARY KEY (year, month)
+  ) WITHOUT ROWID;
+
+CREATE TABLE
+  IF NOT EXISTS rollup_state_type (
+    state_id INTEGER NOT NULL, -- Foreign key for state
+    consumption_type_id INTEGER NOT NULL, -- Foreign key for consumption type
+    consumption INTEGER, -- Energy consumption in MWh
+    consumer_count INTEGER, -- Sum of the monthly number of consumers
+    metered_consumption INTEGER, -- Consumption of the rows with a consumer count
+    PRIMARY KEY (state_id, consumption_type_id),
+    FOREIGN KEY (state_id) REFERENCES state (id),
+    FOREIGN KEY (consumption_type_id) REFERENCES consumption_type (id)
+  ) WITHOUT ROWID;
+
+-- Populate the rollups of databases created before this migration
+INSERT INTO
+  rollup_year_state_type
+SELECT
+  year,
+  state_id,
+  consumption_type_id,
+  SUM(consumption),
+  SUM(consumer_count),
+  SUM(CASE WHEN consumer_count IS NOT NULL THEN consumption END)
+FROM
+  energy_data
+GROUP BY
+  year,
+  state_id,
+  consumption_type_id;
+
+INSERT INTO
+  rollup_year_month
+SELECT
+  year,
+  month,
+  SUM(consumption)
+FROM
+  energy_data
+GROUP BY
+  year,
+  month;
+
+INSERT INTO
+  rollup_state_type
+SELECT
+  state_id,
+  consumption_type_id,
+  SUM(consumption),
+  SUM(consumer_count),
+  SUM(metered_consumption)
+FROM
+  rollup_year_state_type
+GROUP BY
+  state_id,
+  consumption_type_id;
@@ -0,0 +1,12 @@
+-- The getters read the rollups since 003, so the covering indexes of energy_data
+-- only slowed down the ingest. energy_data_key stays for the upserts.
+DROP INDEX IF EXISTS energy_data_year_month;
+
+DROP INDEX IF EXISTS energy_data_year_state;
+
+DROP INDEX IF EXISTS energy_data_state_year;
+
+DROP INDEX IF EXISTS energy_data_type;
+
+-- Consumption by consumption type, scanned in type order
+CREATE INDEX IF NOT EXISTS rollup_state_type_type ON rollup_state_type (consumption_type_id, consumption);
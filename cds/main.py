@@ -8,10 +8,12 @@ from cds.database import (
     get_trends_by_state,
     get_all_states,
 )
-import plotly.express as px
 
 
 def dashboard():
+    # Imported on first render, so other sections never pay for plotly
+    import plotly.express as px
+
     st.title("CDS")
     st.write(
         "Bem-vindo à aba de análise de consumo de energia elétrica no Brasil. "
@@ -0,0 +1,144 @@
+"""Query plan regression check for the CDS getters.
+
+Runs every query function of cds.database, captures the SQL it executes and
+fails when EXPLAIN QUERY PLAN shows a full table scan of energy_data or of
+its rollup tables, other than the ALLOWED_SCANS.
+
+Usage (from the project root):
+    python -m cds.query_plans
+"""
+
+import inspect
+import re
+import sqlite3
+import sys
+
+import cds.database as database
+
+# Sample arguments for each query function of cds.database
+QUERY_FUNCTION_ARGS = {
+    "get_total_consumption_by_year": (),
+    "get_consumption_by_state": (2023,),
+    "get_consumption_by_type": (),
+    "get_avg_consumption_per_capita": (),
+    "get_trends_by_state": ("SP",),
+    "get_all_states": (),
+    "get_total_consumption_by_month": (2023,),
+}
+MONITORED_TABLES = (
+    "energy_data",
+    "rollup_year_state_type",
+    "rollup_year_month",
+    "rollup_state_type",
+)
+# Scans reading every row by design: the yearly totals sum every month, one
+# row each, in the primary key order of the rollup
+ALLOWED_SCANS = {("get_total_consumption_by_year", "rollup_year_month")}
+SQL_KEYWORDS = {"AS", "JOIN", "LEFT", "INNER", "ON", "WHERE", "GROUP", "ORDER"}
+
+
+def get_query_functions():
+    """Return the public getters of cds.database, by name."""
+    # Unwrapped from the query cache and the storage backend switch, so every
+    # call runs its SQLite queries
+    return {
+        name: inspect.unwrap(function)
+        for name, function in inspect.getmembers(database, inspect.isfunction)
+        if name.startswith("get_") and function.__module__ == database.__name__
+    }
+
+
+def capture_statements(function, *args):
+    """Call a query function and return the SELECT statements it executed."""
+    statements = []
+    connections = []
+    original_connect = database.connect
+
+    def traced_connect():
+        connection = original_connect()
+        connection.set_trace_callback(statements.append)
+        connections.append(connection)
+        return connection
+
+    database.connect = traced_connect
+    try:
+        function(*args)
+    finally:
+        database.connect = original_connect
+        # Pooled connections outlive the call, so stop tracing them
+        for connection in connections:
+            connection.set_trace_callback(None)
+    return [
+        statement
+        for statement in statements
+        if statement.lstrip().upper().startswith(("SELECT", "WITH"))
+    ]
+
+
+def get_table_aliases(statement):
+    """Map the names under which the monitored tables appear to the tables."""
+    aliases = {}
+    for table in MONITORED_TABLES:
+        aliases[table] = table
+        pattern = rf"\b{table}\b\s+(?:AS\s+)?(\w+)"
+        for alias in re.findall(pattern, statement, flags=re.IGNORECASE):
+            if alias.upper() not in SQL_KEYWORDS:
+                aliases[alias] = table
+    return aliases
+
+
+def explain(connection, statement):
+    rows = connection.execute(f"EXPLAIN QUERY PLAN {statement}").fetchall()
+    return [row[3] for row in rows]
+
+
+def find_full_scans(plan, aliases, allowed=()):
+    """Return the plan steps that scan a monitored table without an index.
+
+    Scans of the tables in allowed are left out.
+    """
+    full_scans = []
+    for detail in plan:
+        match = re.fullmatch(r"SCAN (\w+)", detail.strip())
+        if match and aliases.get(match.group(1)) not in (None, *allowed):
+            full_scans.append(detail)
+    return full_scans
+
+
+def check_query_plans():
+    """Explain every query function and return the ones doing full scans."""
+    query_functions = get_query_functions()
+    missing = sorted(set(query_functions) - set(QUERY_FUNCTION_ARGS))
+    if missing:
+        raise RuntimeError(
+            f"No sample arguments for query functions: {', '.join(missing)}"
+        )
+
+    regressions = {}
+    connection = sqlite3.connect(database.DB_PATH)
+    for name, function in sorted(query_functions.items()):
+        for statement in capture_statements(function, *QUERY_FUNCTION_ARGS[name]):
+            plan = explain(connection, statement)
+            allowed = [table for getter, table in ALLOWED_SCANS if getter == name]
+            full_scans = find_full_scans(plan, get_table_aliases(statement), allowed)
+            status = "FULL SCAN" if full_scans else "ok"
+            print(f"[{status}] {name}")
+            for detail in plan:
+                print(f"    {detail}")
+            if full_scans:
+                regressions.setdefault(name, []).extend(full_scans)
+    connection.close()
+    return regressions
+
+
+def main():
+    regressions = check_query_plans()
+    if regressions:
+        print(f"Full table scans found in: {', '.join(sorted(regressions))}")
+        return 1
+    print("All query plans use indexes.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,112 @@
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from common.instrumentation import current_call
+
+DEFAULT_TTL = 300.0  # Seconds a cached result is served at most
+MAX_ENTRIES = 128  # Cached results kept per cache, least recently used evicted first
+
+CACHES = []
+
+
+class QueryCache:
+    """Thread-safe LRU cache of query results, bounded by a TTL and a data version.
+
+    version() is called on every lookup and must be cheap, e.g. the last event
+    id or the fingerprint of the ingested source; when it changes, every cached
+    result is dropped. Cached results are shared between callers, which must
+    treat them as read-only.
+    """
+
+    def __init__(self, version, ttl=DEFAULT_TTL, max_entries=MAX_ENTRIES, name=None):
+        self.version = version
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.name = name or getattr(version, "__module__", "cache")
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = None
+        self._hits = 0
+        self._misses = 0
+        self._expirations = 0
+        self._evictions = 0
+        self._invalidations = 0
+        CACHES.append(self)
+
+    def cached(self, function):
+        """Decorator caching the results of a query function by its arguments."""
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            key = (function.__name__, args, tuple(sorted(kwargs.items())))
+            return self.get(key, lambda: function(*args, **kwargs))
+
+        return wrapper
+
+    def get(self, key, compute):
+        """Return the cached result of key, calling compute() on a miss."""
+        call = current_call()
+        version = self.version()
+        now = time.monotonic()
+        with self._lock:
+            if version != self._version:
+                if self._entries:
+                    self._invalidations += 1
+                self._entries.clear()
+                self._version = version
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[0] > self.ttl:
+                del self._entries[key]
+                self._expirations += 1
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                if call is not None:
+                    call.cache_hit = True
+                return entry[1]
+            self._misses += 1
+        if call is not None:
+            call.cache_hit = False
+
+        value = compute()
+        with self._lock:
+            # Results computed while the data changed are not kept
+            if version == self._version:
+                self._entries[key] = (now, value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self._evictions += 1
+        return value
+
+    def clear(self):
+        """Drop every cached result, e.g. after changes the version does not track."""
+        with self._lock:
+            if self._entries:
+                self._invalidations += 1
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "cache": self.name,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_ratio": round(self._hits / lookups, 3) if lookups else 0.0,
+                "expirations": self._expirations,
+                "evictions": self._evictions,
+                "invalidations": self._invalidations,
+                "version": str(self._version),
+            }
+
+
+def get_cache_stats():
+    """Return the stats of every cache created in this process."""
+    return [cache.stats() for cache in CACHES]
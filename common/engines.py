@@ -0,0 +1,148 @@
+"""Query engines for the reporting queries of CDS and CTWP.
+
+The same SQL (with qmark parameters) runs either on SQLite, through the
+module's connection pool, or on an embedded DuckDB database, whose
+vectorized, columnar execution suits the GROUP BY/SUM reports. Results come
+back as rows, pandas DataFrames or Arrow tables.
+
+DuckDB never downloads anything: the SQLite files are attached with the
+sqlite extension only when it is already installed, otherwise their tables
+are copied through Arrow.
+"""
+
+import threading
+
+COPY_CHUNK_SIZE = 100000  # Rows copied from SQLite to DuckDB at a time
+
+
+class SQLiteEngine:
+    """Runs report queries on connections checked out from a pool."""
+
+    name = "sqlite"
+
+    def __init__(self, connect):
+        self.connect = connect
+
+    def fetchall(self, query, params=()):
+        connection = self.connect()
+        try:
+            return connection.execute(query, params).fetchall()
+        finally:
+            connection.close()
+
+    def frame(self, query, params=()):
+        # Imported on use, so the dashboards render before pandas loads
+        import pandas as pd
+
+        connection = self.connect()
+        try:
+            return pd.read_sql_query(query, connection, params=params)
+        finally:
+            connection.close()
+
+    def arrow(self, query, params=()):
+        import pyarrow as pa
+
+        return pa.Table.from_pandas(self.frame(query, params), preserve_index=False)
+
+
+class DuckDBEngine:
+    """Runs report queries on an in-process DuckDB database.
+
+    refresh(connection, state) creates the tables the queries read and
+    returns a state passed to its next call; it runs before the first query
+    and again whenever version() changes, so it can load new rows only.
+    """
+
+    name = "duckdb"
+
+    def __init__(self, refresh, version, name=None):
+        self.refresh = refresh
+        self.version = version
+        self.name = name or "duckdb"
+        self._lock = threading.Lock()
+        self._connection = None
+        self._state = None
+        self._version = None
+
+    def _prepare(self):
+        """Return the connection, refreshed for the current data version."""
+        version = self.version()
+        if self._connection is None:
+            import duckdb
+
+            # Never fetch extensions from the network: the engine works offline
+            self._connection = duckdb.connect(
+                ":memory:",
+                config={
+                    "autoinstall_known_extensions": False,
+                    "autoload_known_extensions": False,
+                },
+            )
+        if self._state is None or version != self._version:
+            self._state = self.refresh(self._connection, self._state)
+            self._version = version
+        return self._connection
+
+    def fetchall(self, query, params=()):
+        with self._lock:
+            return self._prepare().execute(query, list(params)).fetchall()
+
+    def frame(self, query, params=()):
+        with self._lock:
+            result = self._prepare().execute(query, list(params))
+            types = [column[1] for column in result.description]
+            frame = result.df()
+        # SUM of integers is a HUGEINT in DuckDB; keep SQLite's int64 columns
+        for column, column_type in zip(frame.columns, types):
+            if str(column_type) == "HUGEINT" and frame[column].notna().all():
+                frame[column] = frame[column].astype("int64")
+        return frame
+
+    def arrow(self, query, params=()):
+        with self._lock:
+            return self._prepare().execute(query, list(params)).to_arrow_table()
+
+    def reset(self):
+        """Drop the DuckDB database; the next query reloads every table."""
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+            self._connection = None
+            self._state = None
+
+
+def attach_sqlite(connection, path, alias):
+    """Attach a SQLite file read-only, if the sqlite extension is installed.
+
+    Returns False, without trying to download the extension, when it is not.
+    """
+    import duckdb
+
+    try:
+        connection.execute("LOAD sqlite;")
+    except duckdb.Error:
+        return False
+    escaped = path.replace("'", "''")
+    connection.execute(f"ATTACH '{escaped}' AS {alias} (TYPE sqlite, READ_ONLY);")
+    return True
+
+
+def copy_query(connection, sqlite_connection, query, table, params=()):
+    """Append the rows of a SQLite query to a DuckDB table, in chunks.
+
+    The query must return the columns of the table, in order. Returns the
+    number of rows copied.
+    """
+    import pandas as pd
+
+    copied = 0
+    chunks = pd.read_sql_query(
+        query, sqlite_connection, params=params, chunksize=COPY_CHUNK_SIZE
+    )
+    for chunk in chunks:
+        connection.register("sqlite_chunk", chunk)
+        connection.execute(f"INSERT INTO {table} SELECT * FROM sqlite_chunk;")
+        connection.unregister("sqlite_chunk")
+        copied += len(chunk)
+    return copied
@@ -0,0 +1,42 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Queries run at once by gather; the pools keep as many idle connections
+QUERY_WORKERS = 8
+
+_executor = None
+_lock = threading.Lock()
+
+
+def get_executor():
+    """Return the process-wide query thread pool, started on first use.
+
+    The workers live as long as the process, so Streamlit reruns reuse them
+    and each worker keeps checking out warm connections from the pools.
+    """
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=QUERY_WORKERS, thread_name_prefix="query"
+            )
+        return _executor
+
+
+def gather(calls, concurrent=True):
+    """Run independent queries and return their results by name.
+
+    calls maps a name to (function, *args). With concurrent=True every call
+    is submitted to the thread pool at once, so the total latency is that of
+    the slowest query instead of the sum; each worker checks out its own
+    pooled connection, and SQLite in WAL mode runs the reads in parallel.
+    The first exception raised by a query is re-raised here.
+    """
+    if not concurrent:
+        return {name: function(*args) for name, (function, *args) in calls.items()}
+    executor = get_executor()
+    futures = {
+        name: executor.submit(function, *args)
+        for name, (function, *args) in calls.items()
+    }
+    return {name: future.result() for name, future in futures.items()}
@@ -0,0 +1,206 @@
+"""Per-query instrumentation of the database getters of CDS and CTWP.
+
+Each call of an @instrumented getter records its wall time, the rows it
+returned, the time spent waiting for pooled connections and whether the
+query cache answered it, in a rolling window per getter. Calls slower than
+SLOW_QUERY_MS go to the slow-query log with the EXPLAIN QUERY PLAN of the
+SQLite statements they ran, which ConnectionPool traces while a call is active.
+"""
+
+import sqlite3
+import threading
+import time
+from collections import deque
+from functools import wraps
+
+INSTRUMENTATION_ENABLED = True
+ROLLING_WINDOW = 1000  # Recent calls per getter the percentiles are computed over
+SLOW_QUERY_MS = 250.0  # Calls slower than this are logged
+EXPLAIN_SLOW_QUERIES = True  # Capture EXPLAIN QUERY PLAN of the slow calls
+SLOW_QUERY_LOG_SIZE = 100  # Most recent slow calls kept
+MAX_TRACED_STATEMENTS = 100  # Statements kept per call, for the query plans
+# Statements replayed when explaining: SELECTs, and the ATTACHes they depend on
+TRACED_PREFIXES = ("SELECT", "WITH", "ATTACH", "DETACH")
+
+# Process-wide rolling samples of each getter, by qualified name
+QUERY_STATS = {}
+SLOW_QUERIES = deque(maxlen=SLOW_QUERY_LOG_SIZE)
+_lock = threading.Lock()
+_local = threading.local()
+
+
+class QueryCall:
+    """What one getter call did, filled in by the pool and the query cache."""
+
+    def __init__(self, name):
+        self.name = name
+        self.acquire_seconds = 0.0
+        self.cache_hit = None
+        self.database = None
+        self.statements = []
+
+    def connection_acquired(self, path, seconds):
+        self.acquire_seconds += seconds
+        self.database = self.database or path
+
+    def trace(self, statement):
+        """sqlite3 trace callback: keep the statements a query plan needs."""
+        if len(self.statements) >= MAX_TRACED_STATEMENTS:
+            return
+        statement = statement.strip()
+        if statement.upper().startswith(TRACED_PREFIXES):
+            self.statements.append(statement)
+
+
+def current_call():
+    """Return the innermost instrumented call of this thread, if any."""
+    calls = getattr(_local, "calls", None)
+    return calls[-1] if calls else None
+
+
+def count_rows(result):
+    if result is None:
+        return 0
+    try:
+        return len(result)
+    except TypeError:
+        return 1  # Scalar results, e.g. a total
+
+
+def explain(path, statements):
+    """Return the EXPLAIN QUERY PLAN of each SELECT, replaying its ATTACHes."""
+    plans = []
+    try:
+        connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    except sqlite3.Error as error:
+        return [{"statement": None, "plan": [f"error: {error}"]}]
+    try:
+        for statement in statements:
+            if statement.upper().startswith(("ATTACH", "DETACH")):
+                try:
+                    connection.execute(statement)
+                except sqlite3.Error:
+                    pass
+                continue
+            if any(plan["statement"] == statement for plan in plans):
+                continue
+            try:
+                rows = connection.execute(f"EXPLAIN QUERY PLAN {statement}")
+                plan = [detail for _, _, _, detail in rows]
+            except sqlite3.Error as error:
+                plan = [f"error: {error}"]
+            plans.append({"statement": statement, "plan": plan})
+    finally:
+        connection.close()
+    return plans
+
+
+def record_call(call, seconds, rows):
+    with _lock:
+        stats = QUERY_STATS.get(call.name)
+        if stats is None:
+            stats = QUERY_STATS[call.name] = {
+                "calls": 0,
+                "samples": deque(maxlen=ROLLING_WINDOW),
+            }
+        stats["calls"] += 1
+        stats["samples"].append((seconds, rows, call.acquire_seconds, call.cache_hit))
+
+    if seconds * 1000 < SLOW_QUERY_MS:
+        return
+    plans = []
+    if EXPLAIN_SLOW_QUERIES and call.database and call.statements:
+        plans = explain(call.database, call.statements)
+    entry = {
+        "query": call.name,
+        "at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "wall_ms": round(seconds * 1000, 3),
+        "rows": rows,
+        "acquire_ms": round(call.acquire_seconds * 1000, 3),
+        "cache_hit": call.cache_hit,
+        "plans": plans,
+    }
+    with _lock:
+        SLOW_QUERIES.append(entry)
+    print(f"Slow query {call.name}: {entry['wall_ms']:.1f} ms, {rows} rows")
+
+
+def instrumented(function):
+    """Decorator recording the calls of a getter; apply it above the query cache."""
+    name = f"{function.__module__}.{function.__name__}"
+
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        if not INSTRUMENTATION_ENABLED:
+            return function(*args, **kwargs)
+        call = QueryCall(name)
+        if not hasattr(_local, "calls"):
+            _local.calls = []
+        calls = _local.calls
+        calls.append(call)
+        started_at = time.perf_counter()
+        try:
+            result = function(*args, **kwargs)
+        finally:
+            seconds = time.perf_counter() - started_at
+            calls.pop()
+        record_call(call, seconds, count_rows(result))
+        return result
+
+    return wrapper
+
+
+def _percentile_ms(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(int(len(sorted_values) * fraction), len(sorted_values) - 1)
+    return round(sorted_values[index] * 1000, 3)
+
+
+def get_query_stats():
+    """Return the latency percentiles and counters of each getter, in ms."""
+    with _lock:
+        snapshot = [
+            (name, stats["calls"], list(stats["samples"]))
+            for name, stats in QUERY_STATS.items()
+        ]
+    results = []
+    for name, calls, samples in sorted(snapshot):
+        if not samples:
+            continue
+        wall = sorted(sample[0] for sample in samples)
+        lookups = [sample[3] for sample in samples if sample[3] is not None]
+        results.append(
+            {
+                "query": name,
+                "calls": calls,
+                "window": len(samples),
+                "p50_ms": _percentile_ms(wall, 0.50),
+                "p95_ms": _percentile_ms(wall, 0.95),
+                "p99_ms": _percentile_ms(wall, 0.99),
+                "max_ms": _percentile_ms(wall, 1.0),
+                "avg_rows": round(
+                    sum(sample[1] for sample in samples) / len(samples), 1
+                ),
+                "avg_acquire_ms": round(
+                    sum(sample[2] for sample in samples) * 1000 / len(samples), 3
+                ),
+                "cache_hit_ratio": (
+                    round(sum(lookups) / len(lookups), 3) if lookups else None
+                ),
+            }
+        )
+    return results
+
+
+def get_slow_queries():
+    """Return the slow-query log, most recent first."""
+    with _lock:
+        return list(reversed(SLOW_QUERIES))
+
+
+def reset():
+    """Forget every sample and slow query, e.g. between benchmark runs."""
+    with _lock:
+        QUERY_STATS.clear()
+        SLOW_QUERIES.clear()
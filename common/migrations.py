@@ -0,0 +1,21 @@
+import os
+
+
+def apply_migrations(connection, migrations_path):
+    """Apply the pending NNN_*.sql scripts of a folder, in order.
+
+    The number of the last applied script is tracked by PRAGMA user_version,
+    and each script runs in its own transaction.
+    """
+    (version,) = connection.execute("PRAGMA user_version;").fetchone()
+    for file_name in sorted(os.listdir(migrations_path)):
+        if not file_name.endswith(".sql"):
+            continue
+        number = int(file_name.split("_", 1)[0])
+        if number <= version:
+            continue
+        with open(os.path.join(migrations_path, file_name), "r") as sql_file:
+            sql_script = sql_file.read()
+        connection.executescript(
+            f"BEGIN;\n{sql_script}\nPRAGMA user_version = {number};\nCOMMIT;"
+        )
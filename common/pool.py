@@ -0,0 +1,182 @@
+import sqlite3
+import threading
+import time
+
+from common.instrumentation import current_call
+
+# Applied to every pooled connection when it is opened
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode = WAL;",
+    "PRAGMA synchronous = NORMAL;",
+    "PRAGMA cache_size = -32768;",  # 32 MiB of page cache per connection
+    "PRAGMA mmap_size = 268435456;",  # Map up to 256 MiB of the database file
+    "PRAGMA temp_store = MEMORY;",
+)
+# Compiled statements kept per connection, reused when the same SQL runs again
+STATEMENT_CACHE_SIZE = 256
+MAX_IDLE_CONNECTIONS = 8
+
+POOLS = []
+
+
+class PooledConnection(sqlite3.Connection):
+    """SQLite connection handed out by a ConnectionPool.
+
+    close() hands the connection back to its pool instead of closing it, so
+    callers keep the usual connect()/close() pattern.
+    """
+
+    pool = None
+    checked_out = False
+    traced = False
+
+    def close(self):
+        if self.pool is None:
+            super().close()
+        else:
+            self.pool.release(self)
+
+    def close_connection(self):
+        super().close()
+
+
+class ConnectionPool:
+    """Thread-safe pool of SQLite connections to a single database file.
+
+    A connection is used by one thread at a time: connect() checks out an idle
+    connection (or opens a new one) and close() returns it, so the page cache
+    and the prepared statements survive across queries and Streamlit reruns.
+    The optional initializer runs once, before the first connection is opened.
+    """
+
+    def __init__(
+        self, path, initializer=None, max_idle=MAX_IDLE_CONNECTIONS, name=None
+    ):
+        self.path = path
+        self.initializer = initializer
+        self.max_idle = max_idle
+        self.name = name or path
+        self._idle = []
+        self._lock = threading.Lock()
+        self._init_lock = threading.Lock()
+        self._initialized = initializer is None
+        self._local = threading.local()
+        self._opened = 0
+        self._closed = 0
+        self._in_use = 0
+        self._acquires = 0
+        self._reuses = 0
+        self._acquire_seconds = 0.0
+        POOLS.append(self)
+
+    def _initialize(self):
+        with self._init_lock:
+            if not self._initialized:
+                self.initializer()
+                self._initialized = True
+
+    def _open(self):
+        connection = sqlite3.connect(
+            self.path,
+            factory=PooledConnection,
+            check_same_thread=False,
+            cached_statements=STATEMENT_CACHE_SIZE,
+        )
+        for pragma in CONNECTION_PRAGMAS:
+            connection.execute(pragma)
+        connection.pool = self
+        with self._lock:
+            self._opened += 1
+        return connection
+
+    def connect(self):
+        """Check out a connection for the calling thread."""
+        if not self._initialized:
+            self._initialize()
+
+        started_at = time.perf_counter()
+        with self._lock:
+            connection = self._idle.pop() if self._idle else None
+        reused = connection is not None
+        if not reused:
+            connection = self._open()
+        connection.checked_out = True
+        elapsed = time.perf_counter() - started_at
+
+        with self._lock:
+            self._acquires += 1
+            self._in_use += 1
+            self._acquire_seconds += elapsed
+            if reused:
+                self._reuses += 1
+        self._local.last_acquire_seconds = elapsed
+
+        # Report to the instrumented getter running on this thread, if any
+        call = current_call()
+        if call is not None:
+            call.connection_acquired(self.path, elapsed)
+            connection.set_trace_callback(call.trace)
+            connection.traced = True
+        return connection
+
+    def release(self, connection):
+        """Return a connection to the pool, discarding any uncommitted changes."""
+        if not connection.checked_out:
+            return
+        connection.checked_out = False
+        if connection.traced:
+            connection.set_trace_callback(None)
+            connection.traced = False
+        if connection.in_transaction:
+            connection.rollback()
+
+        with self._lock:
+            self._in_use -= 1
+            if len(self._idle) < self.max_idle:
+                self._idle.append(connection)
+                return
+            self._closed += 1
+        connection.close_connection()
+
+    def last_acquire_seconds(self):
+        """Time the calling thread waited for its last connection."""
+        return getattr(self._local, "last_acquire_seconds", 0.0)
+
+    def close_all(self):
+        """Close the idle connections, e.g. on shutdown or before replacing the file."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+            self._closed += len(idle)
+        for connection in idle:
+            connection.close_connection()
+
+    def dispose(self):
+        """Close the idle connections and stop reporting this pool."""
+        self.close_all()
+        if self in POOLS:
+            POOLS.remove(self)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pool": self.name,
+                "open": self._opened - self._closed,
+                "idle": len(self._idle),
+                "in_use": self._in_use,
+                "opened": self._opened,
+                "acquires": self._acquires,
+                "statement_cache_size": STATEMENT_CACHE_SIZE,
+                "reuse_ratio": (
+                    round(self._reuses / self._acquires, 3) if self._acquires else 0.0
+                ),
+                "avg_acquire_ms": (
+                    round(self._acquire_seconds * 1000 / self._acquires, 3)
+                    if self._acquires
+                    else 0.0
+                ),
+            }
+
+
+def get_pool_stats():
+    """Return the stats of every pool created in this process."""
+    return [pool.stats() for pool in POOLS]
@@ -0,0 +1,46 @@
+import threading
+
+# Process-wide render timings of the dashboard sections, by section name
+TIMINGS = {}
+_lock = threading.Lock()
+
+
+def record_timing(section, import_seconds, render_seconds):
+    """Record one run of a dashboard section.
+
+    import_seconds is the time spent importing the section's module, which
+    is only non-zero on the first (cold) run of the process.
+    """
+    with _lock:
+        timing = TIMINGS.setdefault(
+            section,
+            {
+                "runs": 0,
+                "import_seconds": 0.0,
+                "first": None,
+                "last": 0.0,
+                "total": 0.0,
+            },
+        )
+        timing["runs"] += 1
+        timing["import_seconds"] += import_seconds
+        if timing["first"] is None:
+            timing["first"] = import_seconds + render_seconds
+        timing["last"] = render_seconds
+        timing["total"] += render_seconds
+
+
+def get_timings():
+    """Return the cold-start and per-rerun timings of each section, in ms."""
+    with _lock:
+        return [
+            {
+                "section": section,
+                "runs": timing["runs"],
+                "import_ms": round(timing["import_seconds"] * 1000, 1),
+                "cold_start_ms": round(timing["first"] * 1000, 1),
+                "last_run_ms": round(timing["last"] * 1000, 1),
+                "avg_run_ms": round(timing["total"] * 1000 / timing["runs"], 1),
+            }
+            for section, timing in TIMINGS.items()
+        ]
@@ -0,0 +1,162 @@
+import math
+import threading
+
+from ctwp.recent import epoch_seconds
+
+EWMA_ALPHA = 0.05  # Weight of each event in a device's mean and variance
+Z_THRESHOLD = 4.0  # Standard deviations from the mean that raise an alert
+WARMUP_EVENTS = 30  # Events of a device before its z-scores are trusted
+RATING_TOLERANCE = 1.5  # Times the rated power a device may draw on average
+MIN_RATING_INTERVAL = 60.0  # Seconds between two events to estimate the power
+ALERT_COOLDOWN = 3600.0  # Seconds between two alerts of a kind for a device
+Z_SCORE = "z-score"
+RATING = "rating"
+
+
+class DeviceBaseline:
+    """Exponentially weighted mean and variance of a device's consumption."""
+
+    __slots__ = ("mean", "variance", "count", "last_at", "alerted_at")
+
+    def __init__(self):
+        self.mean = 0.0
+        self.variance = 0.0
+        self.count = 0
+        self.last_at = None  # Time of the previous event, in epoch seconds
+        self.alerted_at = {}  # kind -> time of the last alert
+
+    def copy(self):
+        baseline = DeviceBaseline()
+        baseline.mean, baseline.variance = self.mean, self.variance
+        baseline.count, baseline.last_at = self.count, self.last_at
+        baseline.alerted_at = dict(self.alerted_at)
+        return baseline
+
+
+class AnomalyDetector:
+    """Online detector of anomalous energy-consumption events, per device.
+
+    observe_batch() runs a batch of events, in time order, through copies of
+    the devices' baselines, in constant time and memory per event; commit()
+    installs them once the batch is stored, so a failed or retried batch
+    leaves the baselines as they were. observe() does both for a single
+    event.
+
+    Two checks raise alerts: an event over Z_THRESHOLD standard deviations
+    from the device's EWMA mean, once WARMUP_EVENTS were seen, and a mean
+    power since the previous event over RATING_TOLERANCE times the device's
+    rated power. A device raises at most one alert of each kind per
+    ALERT_COOLDOWN. The baselines live in memory and warm up again after a
+    restart.
+    """
+
+    def __init__(
+        self,
+        alpha=EWMA_ALPHA,
+        z_threshold=Z_THRESHOLD,
+        warmup_events=WARMUP_EVENTS,
+        rating_tolerance=RATING_TOLERANCE,
+        min_rating_interval=MIN_RATING_INTERVAL,
+        alert_cooldown=ALERT_COOLDOWN,
+    ):
+        self.alpha = alpha
+        self.z_threshold = z_threshold
+        self.warmup_events = warmup_events
+        self.rating_tolerance = rating_tolerance
+        self.min_rating_interval = min_rating_interval
+        self.alert_cooldown = alert_cooldown
+        self._lock = threading.Lock()
+        self._baselines = {}
+        self._observed = 0
+        self._alerts = 0
+
+    def reset(self):
+        with self._lock:
+            self._baselines = {}
+            self._observed = 0
+            self._alerts = 0
+
+    def observe(self, device_id, timestamp, value, power=None):
+        """Update the device's baseline with an event and return its alerts."""
+        alerts, pending = self.observe_batch([(device_id, timestamp, value, power)])
+        self.commit(pending)
+        return alerts
+
+    def observe_batch(self, events):
+        """Return the alerts of a batch of events and the pending baselines.
+
+        events are (device_id, timestamp, value, power) tuples: value is the
+        consumption of the event in kWh and power the rated power of the
+        device in watts, if known. Alerts are (device_id, timestamp, kind,
+        value, expected, score) tuples: for z-score alerts the expected value
+        is the mean and the score the z-score, for rating alerts the energy
+        at the rated power and the ratio to it. The detector is unchanged
+        until the pending baselines are passed to commit().
+        """
+        alerts = []
+        baselines = {}
+        with self._lock:
+            for device_id, timestamp, value, power in events:
+                baseline = baselines.get(device_id)
+                if baseline is None:
+                    current = self._baselines.get(device_id)
+                    baseline = current.copy() if current else DeviceBaseline()
+                    baselines[device_id] = baseline
+                alerts.extend(
+                    self._observe(baseline, device_id, timestamp, value, power)
+                )
+        return alerts, (baselines, len(events), len(alerts))
+
+    def commit(self, pending):
+        """Install the baselines of a batch returned by observe_batch()."""
+        baselines, observed, alerts = pending
+        with self._lock:
+            self._baselines.update(baselines)
+            self._observed += observed
+            self._alerts += alerts
+
+    def stats(self):
+        with self._lock:
+            return {
+                "devices": len(self._baselines),
+                "observed": self._observed,
+                "alerts": self._alerts,
+            }
+
+    def _observe(self, baseline, device_id, timestamp, value, power):
+        at = epoch_seconds(timestamp)
+        alerts = []
+        if baseline.count >= self.warmup_events and baseline.variance > 0:
+            score = (value - baseline.mean) / math.sqrt(baseline.variance)
+            if abs(score) > self.z_threshold:
+                alerts.append((Z_SCORE, baseline.mean, score))
+
+        if power and baseline.last_at is not None:
+            interval = at - baseline.last_at
+            if interval >= self.min_rating_interval:
+                rated = power / 1000 * interval / 3600  # kWh at the rated power
+                if value > self.rating_tolerance * rated:
+                    alerts.append((RATING, rated, value / rated))
+
+        # Exponentially weighted updates, starting from the first value
+        if baseline.count == 0:
+            baseline.mean = value
+        else:
+            difference = value - baseline.mean
+            increment = self.alpha * difference
+            baseline.mean += increment
+            baseline.variance = (1 - self.alpha) * (
+                baseline.variance + difference * increment
+            )
+        baseline.count += 1
+        if baseline.last_at is None or at > baseline.last_at:
+            baseline.last_at = at
+
+        raised = []
+        for kind, expected, score in alerts:
+            alerted_at = baseline.alerted_at.get(kind)
+            if alerted_at is not None and at - alerted_at < self.alert_cooldown:
+                continue
+            baseline.alerted_at[kind] = at
+            raised.append((device_id, timestamp, kind, value, expected, score))
+        return raised
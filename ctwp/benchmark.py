@@ -0,0 +1,489 @@
+"""Synthetic load generator and ingest/query benchmark for CTWP.
+
+Builds a fleet of homes (zones and devices) in a separate database, bulk
+loads a year of synthetic device events tier by tier, and times the ingest,
+the folding into the consumption buckets, every ctwp.database getter, the
+sequential and concurrent loads of the dashboard's queries, the cold and
+cached time-of-use costs, the updates of the live metrics, the in-memory
+window of recent events and the anomaly detection of the ingest at each
+data-size tier. Results are printed (or written) as JSON for regression
+tracking.
+
+Usage (from the project root):
+    python -m ctwp.benchmark --homes 200 --tiers 10000 100000 1000000 \\
+        --output bench.json
+"""
+
+import argparse
+import inspect
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import time
+from datetime import datetime, timedelta
+
+import ctwp.database as database
+import ctwp.tariffs as tariffs
+from common.fanout import gather
+from ctwp.main import PERIODS, dashboard_queries, metric_queries
+from ctwp.anomalies import AnomalyDetector
+from ctwp.mqtt import EVENT_TYPES, generate_random_event
+from ctwp.recent import RecentEvents, epoch_seconds
+from ctwp.writer import BATCH_SIZE
+
+BENCHMARK_DB_PATH = "./ctwp/database/benchmark.db"
+ZONE_NAMES = ("Living Room", "Kitchen", "Bedroom", "Garage", "Office", "Bathroom")
+# (type, power in watts) of the devices installed in each zone
+DEVICE_KINDS = (
+    ("lamp", 15.0),
+    ("lamp", 60.0),
+    ("presence-sensor", None),
+    ("light-sensor", None),
+    ("air-conditioner", 1200.0),
+)
+# Relative share of events per hour of the day (UTC), busier in the evening
+HOURLY_WEIGHTS = [1] * 5 + [2, 4, 6, 5, 4, 3, 3, 4, 3, 3, 3, 4, 6, 9, 10, 9, 7, 4, 2]
+EVENT_WEIGHTS = (2, 3, 5)  # Weights of EVENT_TYPES
+CHUNK_SIZE = 50000  # Events per bulk insert transaction
+WRITER_SAMPLE_SIZE = 20000  # Events sent through the EventWriter per tier
+QUERY_REPEAT = 5
+
+# Time window of the event log queries, inside the default --year
+WINDOW = ("2024-02-01 00:00:00", "2024-09-01 00:00:00")
+# Sample arguments for each query function of ctwp.database
+QUERY_FUNCTION_ARGS = {
+    "get_latest_consumption": [(), WINDOW],
+    "get_current_rate": [()],
+    "get_total_cost": [(), WINDOW],
+    "get_cost_by_device": [(), WINDOW],
+    "get_all_zones": [()],
+    "get_all_devices": [()],
+    "get_devices_by_zone": [(1,)],
+    "get_cost_by_zone": [(), WINDOW],
+    "get_consumption_by_zone": [(), WINDOW],
+    "get_consumption_by_device": [(), WINDOW],
+    "get_consumption_by_period": [
+        ("Diário",),
+        ("Semanal",),
+        ("Mensal",),
+        ("Horário",),
+    ],
+    "get_consumption_alerts": [()],
+}
+
+
+def build_fleet(connection, homes, zones_per_home, devices_per_zone):
+    """Insert the zones and devices of the synthetic homes, returning device ids."""
+    cursor = connection.cursor()
+    device_ids = []
+    for home in range(1, homes + 1):
+        for zone_index in range(zones_per_home):
+            zone_name = ZONE_NAMES[zone_index % len(ZONE_NAMES)]
+            cursor.execute(
+                "INSERT INTO zone (name, description) VALUES (?, ?);",
+                (f"Home {home} - {zone_name}", f"Synthetic zone of home {home}"),
+            )
+            zone_id = cursor.lastrowid
+            for device_index in range(devices_per_zone):
+                device_type, power = DEVICE_KINDS[device_index % len(DEVICE_KINDS)]
+                cursor.execute(
+                    """
+                    INSERT INTO device (name, type, zone_id, power, description)
+                    VALUES (?, ?, ?, ?, ?);
+                    """,
+                    (
+                        f"{device_type} #{device_index + 1}",
+                        device_type,
+                        zone_id,
+                        power,
+                        f"Synthetic device of home {home}",
+                    ),
+                )
+                device_ids.append(cursor.lastrowid)
+    connection.commit()
+    return device_ids
+
+
+def generate_timestamps(count, start, days):
+    """Return count sorted timestamps over days, following HOURLY_WEIGHTS."""
+    hours = random.choices(range(24), weights=HOURLY_WEIGHTS, k=count)
+    day_offsets = [random.randrange(days) for _ in range(count)]
+    second_offsets = [random.randrange(3600) for _ in range(count)]
+    offsets = sorted(
+        day * 86400 + hour * 3600 + second
+        for day, hour, second in zip(day_offsets, hours, second_offsets)
+    )
+    return [
+        (start + timedelta(seconds=offset)).strftime("%Y-%m-%d %H:%M:%S")
+        for offset in offsets
+    ]
+
+
+def generate_events(count, device_ids, start, days):
+    """Generate count event tuples, as written by ctwp.database.insert_events."""
+    events = []
+    for timestamp in generate_timestamps(count, start, days):
+        event = generate_random_event(
+            device_ids=device_ids, event_weights=EVENT_WEIGHTS, timestamp=timestamp
+        )
+        events.append(
+            (
+                event["device_id"],
+                event["type"],
+                event["timestamp"],
+                event["value"],
+                event["numeric_value"],
+            )
+        )
+    return events
+
+
+def bulk_load(events):
+    """Insert events in CHUNK_SIZE transactions, returning the elapsed seconds."""
+    started_at = time.perf_counter()
+    for offset in range(0, len(events), CHUNK_SIZE):
+        connection = database.connect()
+        database.insert_events(connection, events[offset : offset + CHUNK_SIZE])
+        connection.commit()
+        connection.close()
+    return time.perf_counter() - started_at
+
+
+def fold_load():
+    """Fold the bulk loaded events into the buckets, returning the elapsed seconds."""
+    started_at = time.perf_counter()
+    database.fold_buckets()
+    return time.perf_counter() - started_at
+
+
+def writer_load(events):
+    """Send events through the batched EventWriter, returning the elapsed seconds."""
+    started_at = time.perf_counter()
+    for device_id, event_type, timestamp, value, numeric_value in events:
+        database.save_event(device_id, event_type, value, numeric_value, timestamp)
+    database.EVENT_WRITER.flush()
+    return time.perf_counter() - started_at
+
+
+def get_query_functions():
+    """Return the public getters of ctwp.database, by name."""
+    # Unwrapped from the instrumentation and query cache, so every call runs
+    # its queries
+    return {
+        name: inspect.unwrap(function)
+        for name, function in inspect.getmembers(database, inspect.isfunction)
+        if name.startswith("get_") and function.__module__ == database.__name__
+    }
+
+
+def time_queries(repeat=QUERY_REPEAT):
+    """Time every getter, returning {call: {median_ms, min_ms, max_ms}}."""
+    query_functions = get_query_functions()
+    missing = sorted(set(query_functions) - set(QUERY_FUNCTION_ARGS))
+    if missing:
+        raise RuntimeError(
+            f"No sample arguments for query functions: {', '.join(missing)}"
+        )
+
+    timings = {}
+    for name, function in sorted(query_functions.items()):
+        for args in QUERY_FUNCTION_ARGS[name]:
+            samples = []
+            for _ in range(repeat):
+                started_at = time.perf_counter()
+                function(*args)
+                samples.append((time.perf_counter() - started_at) * 1000)
+            label = f"{name}({', '.join(repr(arg) for arg in args)})"
+            timings[label] = {
+                "median_ms": round(statistics.median(samples), 3),
+                "min_ms": round(min(samples), 3),
+                "max_ms": round(max(samples), 3),
+            }
+    return timings
+
+
+def time_dashboard_load(repeat=QUERY_REPEAT):
+    """Time the queries of the dashboard run one after another and concurrently.
+
+    The query cache is cleared before every load, as after a new event.
+    """
+    timings = {}
+    for mode, concurrent in (("sequential", False), ("concurrent", True)):
+        samples = []
+        for _ in range(repeat):
+            database.QUERY_CACHE.clear()
+            started_at = time.perf_counter()
+            gather(dashboard_queries(PERIODS[0], None), concurrent=concurrent)
+            samples.append((time.perf_counter() - started_at) * 1000)
+        timings[f"{mode}_median_ms"] = round(statistics.median(samples), 3)
+    return timings
+
+
+def time_tariff_costs(repeat=QUERY_REPEAT):
+    """Time the costs of every scope over the whole history.
+
+    Cold runs rebuild the tariff interval index and recompute every month, as
+    after a change of the tariffs; cached runs read the closed months back.
+    """
+    timings = {}
+    for mode, cold in (("cold", True), ("cached", False)):
+        samples = []
+        for _ in range(repeat):
+            if cold:
+                connection = database.connect()
+                with connection:
+                    connection.execute("DELETE FROM tariff_cost_month;")
+                    connection.execute(
+                        "UPDATE tariff_revision SET indexed_version = NULL;"
+                    )
+                connection.close()
+            started_at = time.perf_counter()
+            for scope in tariffs.SCOPES:
+                database.query_costs(scope)
+            samples.append((time.perf_counter() - started_at) * 1000)
+        timings[f"{mode}_median_ms"] = round(statistics.median(samples), 3)
+    return timings
+
+
+def time_live_metrics(repeat=QUERY_REPEAT):
+    """Time the updates of the real-time metrics, from the live feed or queried.
+
+    A viewer of the live feed applies the ticks it missed; the feed polls the
+    new events once per tick, whatever the number of viewers.
+    """
+    live_metrics = database.LIVE_METRICS
+    live_metrics.reset()
+    view = live_metrics.catch_up()
+    poll_samples, catch_up_samples, query_samples = [], [], []
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        live_metrics.poll()
+        poll_samples.append((time.perf_counter() - started_at) * 1000)
+        started_at = time.perf_counter()
+        view = live_metrics.catch_up(view)
+        catch_up_samples.append((time.perf_counter() - started_at) * 1000)
+        database.QUERY_CACHE.clear()
+        started_at = time.perf_counter()
+        gather(metric_queries(), concurrent=False)
+        query_samples.append((time.perf_counter() - started_at) * 1000)
+    return {
+        "poll_median_ms": round(statistics.median(poll_samples), 3),
+        "catch_up_median_ms": round(statistics.median(catch_up_samples), 4),
+        "queries_median_ms": round(statistics.median(query_samples), 3),
+    }
+
+
+def time_recent_events(events, repeat=QUERY_REPEAT):
+    """Time filling a RecentEvents window with events and its queries.
+
+    The window ends at the last event, so it holds the events of its last
+    RECENT_WINDOW_SECONDS.
+    """
+    recent_events = RecentEvents()
+    rows = [
+        (event_id, device_id, database.EVENT_TYPE_CODES[event_type], *values)
+        for event_id, (device_id, event_type, *values) in enumerate(events, 1)
+    ]
+    started_at = time.perf_counter()
+    recent_events.add_rows(rows)
+    add_seconds = time.perf_counter() - started_at
+
+    now = max(epoch_seconds(row[3]) for row in rows)
+    seconds = database.RECENT_WINDOW_SECONDS
+    queries = {
+        "rolling": lambda: recent_events.rolling(
+            database.ENERGY_CONSUMPTION, seconds, now
+        ),
+        "window_total": lambda: recent_events.window_total(
+            database.ENERGY_CONSUMPTION, seconds, now
+        ),
+        "device_window": lambda: recent_events.device_window(
+            rows[-1][1], database.ENERGY_CONSUMPTION, seconds, now
+        ),
+        "last_event": lambda: recent_events.last_event(
+            rows[-1][1], database.ENERGY_CONSUMPTION
+        ),
+        "truncated": lambda: recent_events.truncated(
+            database.ENERGY_CONSUMPTION, seconds, now
+        ),
+    }
+    timings = {
+        "add_us_per_event": round(add_seconds / len(rows) * 1e6, 3),
+        "memory_bytes": recent_events.stats()["memory_bytes"],
+    }
+    for name, query in queries.items():
+        samples = []
+        for _ in range(repeat):
+            started_at = time.perf_counter()
+            query()
+            samples.append((time.perf_counter() - started_at) * 1e6)
+        timings[f"{name}_median_us"] = round(statistics.median(samples), 1)
+    return timings
+
+
+def time_anomaly_detection(events):
+    """Time the anomaly detector of the EventWriter on the consumption events.
+
+    The events go through a fresh detector in batches of the EventWriter.
+    Returns the latency added per event and the alerts raised by kind. The
+    simulator draws consumption values at random, regardless of the power of
+    the device, so most rating alerts, and the alert rate, are an artifact
+    of the synthetic data.
+    """
+    connection = database.connect()
+    device_powers = dict(connection.execute("SELECT id, power FROM device;"))
+    connection.close()
+    detector = AnomalyDetector()
+    consumption = [
+        (device_id, timestamp, numeric_value, device_powers.get(device_id))
+        for device_id, event_type, timestamp, _, numeric_value in events
+        if event_type == "energy-consumption" and numeric_value is not None
+    ]
+    alerts = {}
+    started_at = time.perf_counter()
+    for offset in range(0, len(consumption), BATCH_SIZE):
+        batch_alerts, pending = detector.observe_batch(
+            consumption[offset : offset + BATCH_SIZE]
+        )
+        detector.commit(pending)
+        for alert in batch_alerts:
+            alerts[alert[2]] = alerts.get(alert[2], 0) + 1
+    elapsed = time.perf_counter() - started_at
+    result = {
+        "events": len(consumption),
+        "alerts": alerts,
+        "alert_rate": 0.0,
+        "us_per_event": None,
+        "events_per_second": None,
+    }
+    if consumption:
+        result["alert_rate"] = round(sum(alerts.values()) / len(consumption), 4)
+        result["us_per_event"] = round(elapsed / len(consumption) * 1e6, 3)
+        result["events_per_second"] = round(len(consumption) / elapsed, 1)
+    return result
+
+
+def count_events():
+    connection = database.connect()
+    (count,) = connection.execute("SELECT COUNT(*) FROM device_event;").fetchone()
+    connection.close()
+    return count
+
+
+def run_benchmark(args):
+    random.seed(args.seed)
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(args.db_path + suffix):
+            os.remove(args.db_path + suffix)
+    database.use_database(args.db_path)
+
+    connection = database.connect()
+    device_ids = build_fleet(
+        connection, args.homes, args.zones_per_home, args.devices_per_zone
+    )
+    connection.close()
+    start = datetime(args.year, 1, 1)
+
+    results = {
+        "config": {
+            "homes": args.homes,
+            "zones_per_home": args.zones_per_home,
+            "devices_per_zone": args.devices_per_zone,
+            "devices": len(device_ids),
+            "days": args.days,
+            "event_types": dict(zip(EVENT_TYPES, EVENT_WEIGHTS)),
+            "seed": args.seed,
+        },
+        "environment": {
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+        },
+        "tiers": [],
+    }
+
+    for tier in sorted(args.tiers):
+        missing_events = tier - count_events()
+        if missing_events <= 0:
+            continue
+
+        writer_count = min(WRITER_SAMPLE_SIZE, missing_events)
+        bulk_events = generate_events(
+            missing_events - writer_count, device_ids, start, args.days
+        )
+        writer_events = generate_events(writer_count, device_ids, start, args.days)
+
+        bulk_seconds = bulk_load(bulk_events)
+        fold_seconds = fold_load()
+        writer_seconds = writer_load(writer_events)
+
+        tier_result = {
+            "rows": count_events(),
+            "db_size_bytes": os.path.getsize(args.db_path),
+            "bulk_rows_per_second": (
+                round(len(bulk_events) / bulk_seconds, 1) if bulk_events else None
+            ),
+            "fold_rows_per_second": (
+                round(len(bulk_events) / fold_seconds, 1) if bulk_events else None
+            ),
+            "writer_rows_per_second": round(writer_count / writer_seconds, 1),
+        }
+        # Every getter on each engine; only the windowed ones differ
+        for engine in args.engines:
+            database.use_query_engine(engine)
+            key = "queries" if engine == "sqlite" else f"queries_{engine}"
+            tier_result[key] = time_queries()
+        database.use_query_engine("sqlite")
+        tier_result["dashboard_load"] = time_dashboard_load()
+        tier_result["tariff_costs"] = time_tariff_costs()
+        tier_result["live_metrics"] = time_live_metrics()
+        tier_result["recent_events"] = time_recent_events(writer_events)
+        tier_result["anomaly_detection"] = time_anomaly_detection(writer_events)
+        results["tiers"].append(tier_result)
+        print(
+            f"Tier {tier_result['rows']} rows: "
+            f"bulk {tier_result['bulk_rows_per_second']} rows/s, "
+            f"writer {tier_result['writer_rows_per_second']} rows/s",
+            flush=True,
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark CTWP ingest and queries on synthetic fleets."
+    )
+    parser.add_argument("--homes", type=int, default=100)
+    parser.add_argument("--zones-per-home", type=int, default=4)
+    parser.add_argument("--devices-per-zone", type=int, default=3)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--year", type=int, default=2024)
+    parser.add_argument(
+        "--tiers", type=int, nargs="+", default=[10000, 100000, 1000000]
+    )
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument(
+        "--engines",
+        nargs="+",
+        choices=database.QUERY_ENGINES,
+        default=["sqlite"],
+        help="query engines of the event log queries to time",
+    )
+    parser.add_argument("--db-path", default=BENCHMARK_DB_PATH)
+    parser.add_argument("--output", help="write the JSON results to this file")
+    args = parser.parse_args()
+
+    results = run_benchmark(args)
+    output = json.dumps(results, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""Downsampled consumption buckets of the event log.
+
+Energy-consumption events are folded into the consumption_bucket table (see
+migrations/003_consumption_buckets.sql) at several resolutions, per device and
+per zone. A watermark keeps the id of the last folded event, so each fold only
+reads the new events through the rowid range.
+"""
+
+from ctwp.tariffs import invalidate_months
+
+# (label, first timestamp, first timestamp after the bucket) of each resolution,
+# as SQL expressions of {timestamp}. Labels match the strftime formats of the
+# period views; weeks are cut at the year boundaries, like strftime('%W').
+BUCKET_RESOLUTIONS = {
+    "hourly": (
+        "strftime('%Y-%m-%d %H', {timestamp})",
+        "strftime('%Y-%m-%d %H:00:00', {timestamp})",
+        "datetime(strftime('%Y-%m-%d %H:00:00', {timestamp}), '+1 hour')",
+    ),
+    "daily": (
+        "strftime('%Y-%m-%d', {timestamp})",
+        "datetime({timestamp}, 'start of day')",
+        "datetime({timestamp}, 'start of day', '+1 day')",
+    ),
+    "weekly": (
+        "strftime('%Y-%W', {timestamp})",
+        "max(datetime({timestamp}, 'start of day', '-6 days', 'weekday 1'),"
+        " datetime({timestamp}, 'start of year'))",
+        "min(datetime({timestamp}, 'start of day', '+1 day', 'weekday 1'),"
+        " datetime({timestamp}, 'start of year', '+1 year'))",
+    ),
+    "monthly": (
+        "strftime('%Y-%m', {timestamp})",
+        "datetime({timestamp}, 'start of month')",
+        "datetime({timestamp}, 'start of month', '+1 month')",
+    ),
+}
+# (scope id expression, joins) of the bucket scopes
+BUCKET_SCOPES = {
+    "device": ("de.device_id", ""),
+    "zone": ("d.zone_id", "JOIN device d ON de.device_id = d.id"),
+}
+FOLD_QUERY = """
+SELECT
+    '{resolution}',
+    {label} AS bucket,
+    '{scope}',
+    {scope_id} AS scope_id,
+    {start},
+    {end},
+    SUM(de.numeric_value),
+    COUNT(*)
+FROM {{events}} de
+{joins}
+WHERE de.type_code = ? AND de.id > ? AND de.id <= ? AND {scope_id} IS NOT NULL
+GROUP BY bucket, scope_id
+"""
+WATERMARK_NAME = "consumption_bucket"
+
+
+def fold_queries():
+    """Return the event log queries that aggregate a range of event ids.
+
+    Each query refers to the event table as {events} and takes the type code
+    and the (after_id, up_to_id] range as parameters; the rows match the
+    columns of consumption_bucket.
+    """
+    queries = []
+    for resolution, (label, start, end) in BUCKET_RESOLUTIONS.items():
+        for scope, (scope_id, joins) in BUCKET_SCOPES.items():
+            queries.append(
+                FOLD_QUERY.format(
+                    resolution=resolution,
+                    label=label.format(timestamp="de.timestamp"),
+                    scope=scope,
+                    scope_id=scope_id,
+                    start=start.format(timestamp="de.timestamp"),
+                    end=end.format(timestamp="de.timestamp"),
+                    joins=joins,
+                )
+            )
+    return queries
+
+
+def add_to_buckets(connection, rows):
+    """Add aggregated rows (see fold_queries) to the matching buckets."""
+    connection.executemany(
+        """
+        INSERT INTO consumption_bucket (
+            resolution, bucket, scope, scope_id, bucket_start, bucket_end,
+            consumption, event_count
+        )
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (resolution, scope, bucket, scope_id) DO UPDATE SET
+            consumption = consumption + excluded.consumption,
+            event_count = event_count + excluded.event_count;
+        """,
+        rows,
+    )
+
+
+def read_watermark(connection):
+    """Id of the last folded event, -1 when the buckets were never built."""
+    row = connection.execute(
+        "SELECT last_event_id FROM bucket_watermark WHERE name = ?;",
+        (WATERMARK_NAME,),
+    ).fetchone()
+    return row[0] if row else -1
+
+
+def write_watermark(connection, last_event_id):
+    connection.execute(
+        "INSERT OR REPLACE INTO bucket_watermark (name, last_event_id) VALUES (?, ?);",
+        (WATERMARK_NAME, last_event_id),
+    )
+
+
+def last_event_id(connection):
+    (event_id,) = connection.execute(
+        "SELECT COALESCE(MAX(id), 0) FROM main.device_event;"
+    ).fetchone()
+    return event_id
+
+
+def fold_new_events(connection, type_code):
+    """Fold the events written after the watermark, in the caller's transaction.
+
+    Returns the number of folded events; nothing is folded before the buckets
+    were first built by a rebuild.
+    """
+    watermark = read_watermark(connection)
+    up_to_id = last_event_id(connection)
+    if watermark < 0 or up_to_id <= watermark:
+        return 0
+    params = (type_code, watermark, up_to_id)
+    for query in fold_queries():
+        add_to_buckets(
+            connection,
+            connection.execute(query.format(events="main.device_event"), params),
+        )
+    invalidate_months(connection, *params)
+    write_watermark(connection, up_to_id)
+    return up_to_id - watermark
+
+
+def prune_buckets(connection, resolution, before):
+    """Delete the buckets of a resolution that end before a timestamp."""
+    with connection:
+        cursor = connection.execute(
+            """
+            DELETE FROM consumption_bucket
+            WHERE resolution = ? AND bucket_end <= ?;
+            """,
+            (resolution, before),
+        )
+    return cursor.rowcount
@@ -1,99 +1,729 @@
 import sqlite3
 import os
+import time
+from datetime import datetime, timezone
+from math import isclose
+from common.cache import QueryCache
+from common.engines import DuckDBEngine, attach_sqlite, copy_query
+from common.instrumentation import instrumented
+from common.migrations import apply_migrations
+from common.pool import ConnectionPool
+from ctwp.buckets import (
+    add_to_buckets,
+    fold_new_events,
+    fold_queries,
+    last_event_id,
+    prune_buckets,
+    read_watermark,
+    write_watermark,
+)
+from ctwp.partitions import (
+    EVENT_COLUMNS,
+    archive_month,
+    drop_partitions,
+    list_partitions,
+    month_start,
+    overlapping_partitions,
+    partition_path,
+    remove_archived_events,
+    shift_month,
+)
+from ctwp.anomalies import RATING, Z_SCORE, AnomalyDetector
+from ctwp.live import LiveMetrics
+from ctwp.recent import RecentEvents
+from ctwp.tariffs import current_rate, parse_timestamp, scope_costs
+from ctwp.writer import EventWriter
 
 DB_PATH = "./ctwp/database/data.db"
 INIT_SQL_PATH = "./ctwp/database/init.sql"
-DB_INITIALIZED = False
+MIGRATIONS_PATH = "./ctwp/database/migrations"
+# Codes of the event_type table, see migrations/001_event_log_layout.sql
+EVENT_TYPE_CODES = {"state-change": 1, "sensor-reading": 2, "energy-consumption": 3}
+ENERGY_CONSUMPTION = EVENT_TYPE_CODES["energy-consumption"]
+# Bounds of the timestamp window when since/until are not given
+MIN_TIMESTAMP = "0000-01-01 00:00:00"
+MAX_TIMESTAMP = "9999-12-31 23:59:59"
+HOT_MONTHS = 3  # Months kept in the hot device_event table by archive_events
+PARTITION_RETENTION_MONTHS = 36  # Months of partitions kept by drop_old_partitions
+QUERY_CACHE_TTL = 60.0  # Seconds a query result is served while no event arrives
+HOURLY_BUCKET_RETENTION_MONTHS = 3  # Months of hourly buckets kept by enforce_retention
+MAX_EVENT_ID = 2**63 - 1
+BUCKET_FOLD_INTERVAL = 5.0  # Seconds between the folds of the EventWriter
+LIVE_TOTALS_ATTEMPTS = 3  # Reads of the live totals before keeping one raced by a fold
+RECENT_WINDOW_SECONDS = 15 * 60  # Span of recent_activity and of RECENT_EVENTS
+ALERT_LIMIT = 50  # Alerts returned by get_consumption_alerts by default
+# Labels of the kinds of alerts of ctwp.anomalies
+ALERT_KINDS = {Z_SCORE: "Fora do padrão", RATING: "Acima da potência"}
+# Bucket resolution read by get_consumption_by_period for each period
+PERIOD_RESOLUTIONS = {
+    "Horário": "hourly",
+    "Diário": "daily",
+    "Semanal": "weekly",
+    "Mensal": "monthly",
+}
+# Engine of the event log queries with a time window: "sqlite" runs them on
+# the hot table and each overlapping partition, "duckdb" on a DuckDB mirror
+# of the whole log (see load_duckdb and common/engines.py)
+QUERY_ENGINE = "sqlite"
+QUERY_ENGINES = ("sqlite", "duckdb")
+# Tables of the DuckDB mirror, named and typed like their SQLite sources
+DUCKDB_SCHEMA = """
+CREATE OR REPLACE TABLE device_event (
+    id BIGINT,
+    device_id BIGINT,
+    type VARCHAR,
+    timestamp VARCHAR,
+    value VARCHAR,
+    numeric_value DOUBLE,
+    type_code INTEGER
+);
+CREATE OR REPLACE TABLE zone (id BIGINT, name VARCHAR, description VARCHAR);
+CREATE OR REPLACE TABLE device (
+    id BIGINT, name VARCHAR, type VARCHAR, zone_id BIGINT, power DOUBLE
+);
+"""
+# Relative difference tolerated between a running total and the raw event log
+# (floating point sums depend on the order of the events)
+RECONCILE_TOLERANCE = 1e-6
+# Recomputes the consumption_total counters from an event table, by scope
+RUNNING_TOTAL_QUERIES = {
+    "global": """
+    SELECT 0, SUM(de.numeric_value), COUNT(*)
+    FROM {events} de
+    WHERE de.type_code = ? AND de.timestamp >= ? AND de.timestamp < ?
+    """,
+    "device": """
+    SELECT de.device_id, SUM(de.numeric_value), COUNT(*)
+    FROM {events} de
+    WHERE de.type_code = ? AND de.timestamp >= ? AND de.timestamp < ?
+        AND de.device_id IS NOT NULL
+    GROUP BY de.device_id
+    """,
+    "zone": """
+    SELECT d.zone_id, SUM(de.numeric_value), COUNT(*)
+    FROM {events} de
+    JOIN device d ON de.device_id = d.id
+    WHERE de.type_code = ? AND de.timestamp >= ? AND de.timestamp < ?
+        AND d.zone_id IS NOT NULL
+    GROUP BY d.zone_id
+    """,
+}
 
 
 def initialize_database():
-    if not os.path.exists(DB_PATH) or os.stat(DB_PATH).st_size == 0:
+    is_new = not os.path.exists(DB_PATH) or os.stat(DB_PATH).st_size == 0
+    connection = sqlite3.connect(DB_PATH)
+    if is_new:
         with open(INIT_SQL_PATH, "r") as sql_file:
             sql_script = sql_file.read()
-        connection = sqlite3.connect(DB_PATH)
         cursor = connection.cursor()
         cursor.executescript(sql_script)
         connection.commit()
-        connection.close()
+    apply_migrations(connection, MIGRATIONS_PATH)
+    # A crash in the middle of archive_month can leave a month in both files
+    remove_archived_events(connection, DB_PATH)
+    if read_watermark(connection) < 0:
+        rebuild_buckets(connection)
+    connection.close()
+
+
+POOL = ConnectionPool(DB_PATH, initializer=initialize_database, name="ctwp")
 
 
 def connect():
-    global DB_INITIALIZED
-    if not DB_INITIALIZED:
-        initialize_database()
-        DB_INITIALIZED = True
-    return sqlite3.connect(DB_PATH)
+    """Check out a pooled connection; close() returns it to the pool."""
+    return POOL.connect()
+
 
+def data_version():
+    """Last event, zone and device ids and the tariff version.
 
-def save_event(device_id, event_type, value=None, numeric_value=None):
+    They change whenever new data arrives or a tariff is edited.
+    """
     connection = connect()
-    cursor = connection.cursor()
-    cursor.execute(
+    version = connection.execute("""
+        SELECT
+            (SELECT MAX(id) FROM device_event),
+            (SELECT MAX(id) FROM zone),
+            (SELECT MAX(id) FROM device),
+            (SELECT version FROM tariff_revision);
+        """).fetchone()
+    connection.close()
+    return version
+
+
+QUERY_CACHE = QueryCache(data_version, ttl=QUERY_CACHE_TTL, name="ctwp")
+
+
+def use_database(path):
+    """Point the pool and the event writer at another database file.
+
+    The file is created from init.sql on first use, e.g. for benchmarks.
+    """
+    global DB_PATH, POOL, pending_detection
+    EVENT_WRITER.flush()
+    POOL.dispose()
+    QUERY_CACHE.clear()
+    DUCKDB_ENGINE.reset()
+    LIVE_METRICS.reset()
+    RECENT_EVENTS.clear()
+    ANOMALY_DETECTOR.reset()
+    device_powers.clear()
+    pending_detection = None
+    DB_PATH = path
+    POOL = ConnectionPool(DB_PATH, initializer=initialize_database, name="ctwp")
+
+
+def use_query_engine(engine):
+    """Switch the event log queries to another entry of QUERY_ENGINES."""
+    global QUERY_ENGINE
+    if engine not in QUERY_ENGINES:
+        raise ValueError(f"Unknown query engine: {engine}")
+    QUERY_ENGINE = engine
+    QUERY_CACHE.clear()
+
+
+def attach_duckdb_partitions(connection, state, partitions):
+    """Point the device_event view of DuckDB at the main file and the partitions."""
+    for month in state["partitions"] or ():
+        connection.execute(
+            f"DETACH DATABASE IF EXISTS partition_{month[:4]}_{month[5:]};"
+        )
+    sources = ["ctwp.device_event"]
+    for month in partitions:
+        alias = f"partition_{month[:4]}_{month[5:]}"
+        attach_sqlite(connection, partition_path(DB_PATH, month), alias)
+        sources.append(f"{alias}.device_event")
+    connection.execute(
+        "CREATE OR REPLACE VIEW device_event AS "
+        + " UNION ALL ".join(
+            f"SELECT {EVENT_COLUMNS} FROM {source}" for source in sources
+        )
+        + ";"
+    )
+    connection.execute(
+        "CREATE OR REPLACE VIEW zone AS SELECT id, name, description FROM ctwp.zone;"
+    )
+    connection.execute(
+        "CREATE OR REPLACE VIEW device AS "
+        "SELECT id, name, type, zone_id, power FROM ctwp.device;"
+    )
+
+
+def load_duckdb(connection, state):
+    """Mirror the event log (hot table and partitions), zones and devices in DuckDB.
+
+    With DuckDB's sqlite extension installed the files are attached and read
+    in place. Otherwise they are copied: new events are appended by id, and
+    the copy is rebuilt when the archived partitions change.
+    """
+    partitions = {
+        month: os.stat(partition_path(DB_PATH, month)).st_mtime
+        for month in list_partitions(DB_PATH)
+    }
+    if state is None:
+        attached = attach_sqlite(connection, DB_PATH, "ctwp")
+        state = {"attached": attached, "partitions": None, "last_id": -1}
+    if state["attached"]:
+        if state["partitions"] != partitions:
+            attach_duckdb_partitions(connection, state, partitions)
+        return dict(state, partitions=partitions)
+
+    last_id = state["last_id"]
+    if state["partitions"] != partitions:
+        connection.execute(DUCKDB_SCHEMA)
+        last_id = -1
+        for month in partitions:
+            partition_connection = sqlite3.connect(partition_path(DB_PATH, month))
+            try:
+                copy_query(
+                    connection,
+                    partition_connection,
+                    f"SELECT {EVENT_COLUMNS} FROM device_event;",
+                    "device_event",
+                )
+            finally:
+                partition_connection.close()
+    sqlite_connection = connect()
+    try:
+        copy_query(
+            connection,
+            sqlite_connection,
+            f"SELECT {EVENT_COLUMNS} FROM device_event WHERE id > ?;",
+            "device_event",
+            (last_id,),
+        )
+        connection.execute("DELETE FROM zone; DELETE FROM device;")
+        copy_query(
+            connection,
+            sqlite_connection,
+            "SELECT id, name, description FROM zone;",
+            "zone",
+        )
+        copy_query(
+            connection,
+            sqlite_connection,
+            "SELECT id, name, type, zone_id, power FROM device;",
+            "device",
+        )
+    finally:
+        sqlite_connection.close()
+    (last_id,) = connection.execute(
+        "SELECT COALESCE(MAX(id), -1) FROM device_event;"
+    ).fetchone()
+    return {"attached": False, "partitions": partitions, "last_id": last_id}
+
+
+DUCKDB_ENGINE = DuckDBEngine(load_duckdb, data_version, name="ctwp")
+
+
+def insert_events(connection, events):
+    """Insert (device_id, type, timestamp, value, numeric_value) event tuples."""
+    connection.executemany(
         """
-        INSERT INTO device_event (device_id, type, value, numeric_value)
-        VALUES (?, ?, ?, ?);
+        INSERT INTO device_event (
+            device_id, type, timestamp, value, numeric_value, type_code
+        )
+        VALUES (?, ?, ?, ?, ?, ?);
         """,
-        (device_id, event_type, value, numeric_value),
+        (event + (EVENT_TYPE_CODES.get(event[1]),) for event in events),
     )
-    connection.commit()
-    connection.close()
-    print(f"Event saved: {device_id}, {event_type}, {value}, {numeric_value}")
 
 
-def get_latest_consumption():
+def write_events(connection, events):
+    """Insert a batch of event tuples, folding the log into the buckets at times.
+
+    Folding every BUCKET_FOLD_INTERVAL seconds instead of every batch lets a
+    fold group many events into each bucket; readers catch up with
+    fold_buckets.
+    """
+    global last_fold_at, pending_detection
+    insert_events(connection, events)
+    pending_detection = detect_anomalies(connection, events)
+    if time.monotonic() - last_fold_at >= BUCKET_FOLD_INTERVAL:
+        fold_new_events(connection, ENERGY_CONSUMPTION)
+        last_fold_at = time.monotonic()
+
+
+last_fold_at = 0.0
+
+# Online anomaly detection of the energy-consumption events of the EventWriter
+ANOMALY_DETECTOR = AnomalyDetector()
+DEVICE_POWER_TTL = 300.0  # Seconds before the rated powers are read again
+device_powers = {}  # Rated power in watts by device id, of the known devices
+device_powers_read_at = 0.0
+# Baselines of the batch being written, committed by notify_written
+pending_detection = None
+
+
+def detect_anomalies(connection, events):
+    """Run the events through ANOMALY_DETECTOR, storing the alerts it raises.
+
+    The alerts are inserted in the transaction of the events. Returns the
+    pending baselines of the batch, for ANOMALY_DETECTOR.commit() once the
+    transaction is committed.
+    """
+    global device_powers_read_at
+    consumption = [
+        (device_id, timestamp, numeric_value)
+        for device_id, event_type, timestamp, _, numeric_value in events
+        if event_type == "energy-consumption"
+        and device_id is not None
+        and numeric_value is not None
+    ]
+    if time.monotonic() - device_powers_read_at >= DEVICE_POWER_TTL:
+        # Pick up the devices added since and any change of their power
+        device_powers.clear()
+        device_powers_read_at = time.monotonic()
+    unknown = {device_id for device_id, _, _ in consumption} - set(device_powers)
+    if unknown:
+        placeholders = ", ".join("?" * len(unknown))
+        device_powers.update(
+            connection.execute(
+                f"SELECT id, power FROM device WHERE id IN ({placeholders});",
+                tuple(unknown),
+            )
+        )
+    alerts, pending = ANOMALY_DETECTOR.observe_batch(
+        [
+            (device_id, timestamp, value, device_powers.get(device_id))
+            for device_id, timestamp, value in consumption
+        ]
+    )
+    if alerts:
+        connection.executemany(
+            """
+            INSERT INTO consumption_alert (
+                device_id, timestamp, kind, value, expected, score
+            )
+            VALUES (?, ?, ?, ?, ?, ?);
+            """,
+            alerts,
+        )
+    return pending
+
+
+def notify_written(events):
+    """Commit the anomaly baselines of a written batch and wake the live feed."""
+    global pending_detection
+    if pending_detection is not None:
+        ANOMALY_DETECTOR.commit(pending_detection)
+        pending_detection = None
+    LIVE_METRICS.notify(events)
+
+
+EVENT_WRITER = EventWriter(connect, write_events, on_written=notify_written)
+
+
+def save_event(device_id, event_type, value=None, numeric_value=None, timestamp=None):
+    """Queue an event for the batched writer.
+
+    The event is timestamped when it is queued (UTC, same format as SQLite's
+    CURRENT_TIMESTAMP) and written in the next batch; call
+    EVENT_WRITER.flush() to wait for it.
+    """
+    if timestamp is None:
+        timestamp = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+    EVENT_WRITER.submit((device_id, event_type, timestamp, value, numeric_value))
+
+
+def query_event_log(query, type_code, since=None, until=None):
+    """Run an event log query on the hot table and on the archived partitions.
+
+    The query refers to the event table as {events} and takes the type code and
+    the [since, until) timestamp window as parameters. Only the partitions that
+    overlap the window are attached; the rows of every source are concatenated.
+    With QUERY_ENGINE = "duckdb" the query runs once on the DuckDB mirror.
+    """
+    params = (type_code, since or MIN_TIMESTAMP, until or MAX_TIMESTAMP)
+    if QUERY_ENGINE == "duckdb":
+        # The DuckDB mirror already holds the hot table and every partition
+        return DUCKDB_ENGINE.fetchall(query.format(events="device_event"), params)
     connection = connect()
-    cursor = connection.cursor()
-    query = """
-    SELECT SUM(numeric_value) AS total_consumption
-    FROM device_event
-    WHERE type = 'energy-consumption'
+    try:
+        rows = connection.execute(
+            query.format(events="main.device_event"), params
+        ).fetchall()
+        rows.extend(query_partitions(connection, query, params, since, until))
+    finally:
+        connection.close()
+    return rows
+
+
+def query_partitions(connection, query, params, since=None, until=None):
+    """Run an event log query on each archived partition overlapping the window."""
+    rows = []
+    for month in overlapping_partitions(DB_PATH, since, until):
+        connection.execute(
+            "ATTACH DATABASE ? AS partition_db;", (partition_path(DB_PATH, month),)
+        )
+        try:
+            rows.extend(
+                connection.execute(
+                    query.format(events="partition_db.device_event"), params
+                ).fetchall()
+            )
+        finally:
+            connection.execute("DETACH DATABASE partition_db;")
+    return rows
+
+
+def query_consumption(totals_query, events_query, key_size, since=None, until=None):
+    """Aggregate energy consumption from the running totals or the event log.
+
+    Without a time window the counters of the consumption_total table (kept up
+    to date by a trigger, see migrations/002_running_totals.sql) are read, so
+    the cost is constant in the size of the log; windows are aggregated from
+    the event log with query_event_log. Returns {key: values} like sum_by_key.
     """
-    cursor.execute(query)
-    result = cursor.fetchone()
-    connection.close()
+    if since is None and until is None:
+        connection = connect()
+        rows = connection.execute(totals_query).fetchall()
+        connection.close()
+    else:
+        rows = query_event_log(events_query, ENERGY_CONSUMPTION, since, until)
+    return sum_by_key(rows, key_size)
+
+
+def sum_by_key(rows, key_size):
+    """Merge partial aggregates: sum the value columns of rows sharing a key."""
+    totals = {}
+    for row in rows:
+        key, values = tuple(row[:key_size]), row[key_size:]
+        if key in totals:
+            values = tuple(
+                (
+                    current
+                    if value is None
+                    else value if current is None else current + value
+                )
+                for current, value in zip(totals[key], values)
+            )
+        totals[key] = tuple(values)
+    return totals
+
+
+def rebuild_buckets(connection):
+    """Rebuild consumption_bucket from the hot table and the archived partitions.
+
+    Runs when the buckets are first built; the buckets of months whose
+    partitions were already dropped cannot be rebuilt.
+    """
+    params = (ENERGY_CONSUMPTION, -1, MAX_EVENT_ID)
+    partition_rows = [
+        row
+        for query in fold_queries()
+        for row in query_partitions(connection, query, params)
+    ]
+    connection.execute("BEGIN IMMEDIATE;")
+    with connection:
+        connection.execute("DELETE FROM consumption_bucket;")
+        connection.execute("DELETE FROM tariff_cost_month;")
+        add_to_buckets(connection, partition_rows)
+        write_watermark(connection, 0)
+        fold_new_events(connection, ENERGY_CONSUMPTION)
+
+
+def fold_buckets():
+    """Fold the events written since the last fold into consumption_bucket.
+
+    The EventWriter folds at most every BUCKET_FOLD_INTERVAL seconds; this
+    catches up with the events written since, and with those inserted by other
+    means, before the buckets are read or events archived.
+    Returns the number of event ids folded.
+    """
+    connection = connect()
+    try:
+        # Cheap check without taking the write lock
+        if read_watermark(connection) >= last_event_id(connection):
+            return 0
+        connection.execute("BEGIN IMMEDIATE;")
+        with connection:
+            return fold_new_events(connection, ENERGY_CONSUMPTION)
+    finally:
+        connection.close()
+
+
+def archive_events(keep_months=HOT_MONTHS):
+    """Move the events older than the last keep_months months to partition files.
+
+    Returns the number of archived events. Archived months stay visible to the
+    getters through query_event_log.
+    """
+    fold_buckets()
+    cutoff = shift_month(datetime.now(timezone.utc).strftime("%Y-%m"), 1 - keep_months)
+    connection = connect()
+    try:
+        months = [
+            row[0]
+            for row in connection.execute(
+                """
+                SELECT DISTINCT substr(timestamp, 1, 7)
+                FROM device_event
+                WHERE timestamp < ?;
+                """,
+                (month_start(cutoff),),
+            )
+        ]
+        return sum(archive_month(connection, DB_PATH, month) for month in months)
+    finally:
+        connection.close()
+
+
+def drop_old_partitions(retention_months=PARTITION_RETENTION_MONTHS):
+    """Delete the partitions older than retention_months months, for good."""
+    current_month = datetime.now(timezone.utc).strftime("%Y-%m")
+    return drop_partitions(DB_PATH, shift_month(current_month, -retention_months))
+
+
+def enforce_retention(
+    keep_months=HOT_MONTHS,
+    retention_months=PARTITION_RETENTION_MONTHS,
+    hourly_retention_months=HOURLY_BUCKET_RETENTION_MONTHS,
+):
+    """Apply the retention of the raw events and of the hourly buckets.
+
+    Events are archived after keep_months and dropped after retention_months;
+    the daily, weekly and monthly buckets of dropped months are kept, so the
+    period views still cover them.
+    """
+    archived = archive_events(keep_months)
+    dropped = drop_old_partitions(retention_months)
+    current_month = datetime.now(timezone.utc).strftime("%Y-%m")
+    connection = connect()
+    try:
+        pruned = prune_buckets(
+            connection,
+            "hourly",
+            month_start(shift_month(current_month, -hourly_retention_months)),
+        )
+    finally:
+        connection.close()
+    QUERY_CACHE.clear()
+    return {
+        "archived_events": archived,
+        "dropped_partitions": dropped,
+        "pruned_hourly_buckets": pruned,
+    }
+
+
+def reconcile_running_totals(repair=False, tolerance=RECONCILE_TOLERANCE):
+    """Verify the consumption_total counters against the raw event log.
+
+    The counters are recomputed from the hot table, every archived partition
+    and the monthly buckets of dropped partitions, and compared with the
+    stored ones. Returns the mismatching
+    counters as dicts; with repair=True they are also replaced by the
+    recomputed values. The hot table is read inside an immediate transaction,
+    so events written meanwhile wait instead of being miscounted.
+    """
+    params = (ENERGY_CONSUMPTION, MIN_TIMESTAMP, MAX_TIMESTAMP)
+    connection = connect()
+    try:
+        # Partitions cannot be attached inside a transaction; they only change
+        # when archive_events runs, which must not run concurrently
+        rows = {
+            scope: query_partitions(connection, query, params)
+            for scope, query in RUNNING_TOTAL_QUERIES.items()
+        }
+        connection.execute("BEGIN IMMEDIATE;")
+        expected = {}
+        for scope, query in RUNNING_TOTAL_QUERIES.items():
+            rows[scope].extend(
+                connection.execute(
+                    query.format(events="main.device_event"), params
+                ).fetchall()
+            )
+            for (scope_id,), values in sum_by_key(rows[scope], 1).items():
+                expected[(scope, scope_id)] = tuple(value or 0 for value in values)
+        # Months whose partitions were dropped only survive in the buckets
+        (hot_month,) = connection.execute(
+            "SELECT substr(MIN(timestamp), 1, 7) FROM main.device_event;"
+        ).fetchone()
+        raw_months = list_partitions(DB_PATH) + ([hot_month] if hot_month else [])
+        dropped_rows = connection.execute(
+            """
+            SELECT scope, scope_id, SUM(consumption), SUM(event_count)
+            FROM consumption_bucket
+            WHERE resolution = 'monthly' AND bucket < ?
+            GROUP BY scope, scope_id;
+            """,
+            (min(raw_months, default=MAX_TIMESTAMP),),
+        ).fetchall()
+        for scope, scope_id, *values in dropped_rows:
+            keys = [(scope, scope_id)] + ([("global", 0)] if scope == "device" else [])
+            for key in keys:
+                current = expected.get(key, (0, 0))
+                expected[key] = tuple(
+                    total + (value or 0) for total, value in zip(current, values)
+                )
+        stored = {
+            (scope, scope_id): values
+            for scope, scope_id, *values in connection.execute("""
+                SELECT scope, scope_id, consumption, event_count
+                FROM consumption_total;
+                """)
+        }
+
+        mismatches = []
+        for key in sorted(expected.keys() | stored.keys()):
+            consumption, count = expected.get(key, (0, 0))
+            stored_consumption, stored_count = stored.get(key, (0, 0))
+            if count != stored_count or not isclose(
+                consumption, stored_consumption, rel_tol=tolerance, abs_tol=tolerance
+            ):
+                mismatches.append(
+                    {
+                        "scope": key[0],
+                        "scope_id": key[1],
+                        "consumption": stored_consumption,
+                        "expected_consumption": consumption,
+                        "event_count": stored_count,
+                        "expected_event_count": count,
+                    }
+                )
+
+        if repair and mismatches:
+            connection.execute("DELETE FROM consumption_total;")
+            connection.executemany(
+                """
+                INSERT INTO consumption_total (
+                    scope, scope_id, consumption, event_count
+                )
+                VALUES (?, ?, ?, ?);
+                """,
+                (key + values for key, values in expected.items()),
+            )
+        connection.commit()
+    finally:
+        connection.close()
+    if repair and mismatches:
+        QUERY_CACHE.clear()
+    return mismatches
+
+
+@instrumented
+@QUERY_CACHE.cached
+def get_latest_consumption(since=None, until=None):
+    totals_query = """
+    SELECT consumption
+    FROM consumption_total
+    WHERE scope = 'global' AND scope_id = 0
+    """
+    events_query = """
+    SELECT SUM(de.numeric_value) AS total_consumption
+    FROM {events} de
+    WHERE de.type_code = ? AND de.timestamp >= ? AND de.timestamp < ?
+    """
+    result = query_consumption(totals_query, events_query, 0, since, until).get(
+        (), (None,)
+    )
     return round(result[0] if result[0] else 0, 2)
 
 
+@instrumented
 def get_current_rate():
-    # Placeholder for real tariff retrieval
-    # Replace this with a query to fetch from the database if tariffs are stored
-    return 0.45  # Static rate as a placeholder
+    """Rate in R$/kWh in force now: time-of-use period plus the month's flag."""
+    connection = connect()
+    try:
+        rate, _, _ = current_rate(connection)
+    finally:
+        connection.close()
+    return round(rate or 0, 5)
 
 
-def get_total_cost():
-    """Calculate the total cost of energy consumption from the database."""
+def query_costs(scope, since=None, until=None):
+    """Return {scope_id: cost} of the consumption buckets, see ctwp.tariffs."""
+    fold_buckets()
     connection = connect()
-    query = """
-    SELECT SUM(numeric_value * 0.45) AS total_cost
-    FROM device_event
-    WHERE type = 'energy-consumption'
+    try:
+        return scope_costs(connection, scope, since, until)
+    finally:
+        connection.close()
+
+
+@instrumented
+@QUERY_CACHE.cached
+def get_total_cost(since=None, until=None):
+    """Calculate the total cost of energy consumption from the database.
+
+    Costs follow the time-of-use tariffs (see ctwp.tariffs), over the hourly
+    buckets overlapping the [since, until) window.
     """
-    cursor = connection.cursor()
-    cursor.execute(query)
-    result = cursor.fetchone()
-    connection.close()
-    return round(result[0] if result[0] else 0, 2)
+    return round(sum(query_costs("device", since, until).values()), 2)
 
 
-def get_cost_by_device():
+@instrumented
+@QUERY_CACHE.cached
+def get_cost_by_device(since=None, until=None):
     """Calculate energy cost per device and include additional details."""
+    costs = query_costs("device", since, until)
     connection = connect()
-    query = """
-    SELECT 
-        d.id,
-        d.name,
-        d.type,
-        d.power,
-        SUM(de.numeric_value * 0.45) AS cost
-    FROM device_event de
-    JOIN device d ON de.device_id = d.id
-    WHERE de.type = 'energy-consumption'
-    GROUP BY d.id, d.name, d.type, d.power
-    ORDER BY d.id
-    """
-    cursor = connection.cursor()
-    cursor.execute(query)
-    result = cursor.fetchall()
+    result = connection.execute("""
+        SELECT id, name, type, power
+        FROM device
+        ORDER BY id
+        """).fetchall()
     connection.close()
 
     # Convert the results into a list of dictionaries for Streamlit table
@@ -103,12 +733,15 @@ def get_cost_by_device():
             "Nome": row[1],
             "Tipo": row[2],
             "Potência (W)": row[3],
-            "Custo (R$)": round(row[4], 2),
+            "Custo (R$)": round(costs[row[0]] or 0, 2),
         }
         for row in result
+        if row[0] in costs
     ]
 
 
+@instrumented
+@QUERY_CACHE.cached
 def get_all_zones():
     """Fetch all zones (cômodos) from the database."""
     connection = connect()
@@ -125,6 +758,8 @@ def get_all_zones():
     return [{"ID": row[0], "Nome": row[1], "Descrição": row[2]} for row in result]
 
 
+@instrumented
+@QUERY_CACHE.cached
 def get_all_devices():
     """Fetch all devices from the database."""
     connection = connect()
@@ -150,6 +785,40 @@ def get_all_devices():
     ]
 
 
+@instrumented
+@QUERY_CACHE.cached
+def get_consumption_alerts(limit=ALERT_LIMIT):
+    """Fetch the latest alerts of the anomaly detector, newest first."""
+    connection = connect()
+    query = """
+    SELECT a.timestamp, a.device_id, d.name, a.kind, a.value, a.expected, a.score
+    FROM consumption_alert a
+    LEFT JOIN device d ON d.id = a.device_id
+    ORDER BY a.timestamp DESC, a.id DESC
+    LIMIT ?
+    """
+    cursor = connection.cursor()
+    cursor.execute(query, (limit,))
+    result = cursor.fetchall()
+    connection.close()
+
+    # Convert to a list of dictionaries for Streamlit
+    return [
+        {
+            "Data": row[0],
+            "ID": row[1],
+            "Dispositivo": row[2],
+            "Alerta": ALERT_KINDS.get(row[3], row[3]),
+            "Consumo (kWh)": round(row[4], 3),
+            "Esperado (kWh)": round(row[5], 3) if row[5] is not None else None,
+            "Índice": round(row[6], 2) if row[6] is not None else None,
+        }
+        for row in result
+    ]
+
+
+@instrumented
+@QUERY_CACHE.cached
 def get_devices_by_zone(zone_id):
     """Fetch all devices for a specific zone from the database."""
     connection = connect()
@@ -176,24 +845,17 @@ def get_devices_by_zone(zone_id):
     ]
 
 
-def get_cost_by_zone():
+@instrumented
+@QUERY_CACHE.cached
+def get_cost_by_zone(since=None, until=None):
     """Calculate total energy cost per zone."""
+    costs = query_costs("zone", since, until)
     connection = connect()
-    query = """
-    SELECT 
-        z.id AS zone_id,
-        z.name AS zone_name,
-        SUM(de.numeric_value * 0.45) AS total_cost
-    FROM zone z
-    LEFT JOIN device d ON z.id = d.zone_id
-    LEFT JOIN device_event de ON d.id = de.device_id
-    WHERE de.type = 'energy-consumption'
-    GROUP BY z.id, z.name
-    ORDER BY z.id
-    """
-    cursor = connection.cursor()
-    cursor.execute(query)
-    result = cursor.fetchall()
+    result = connection.execute("""
+        SELECT id, name
+        FROM zone
+        ORDER BY id
+        """).fetchall()
     connection.close()
 
     # Convert results to a list of dictionaries
@@ -201,91 +863,107 @@ def get_cost_by_zone():
         {
             "ID": row[0],
             "Zona": row[1],
-            "Custo Total (R$)": round(row[2] if row[2] else 0, 2),
+            "Custo Total (R$)": round(costs[row[0]] or 0, 2),
         }
         for row in result
+        if row[0] in costs
     ]
 
 
-def get_consumption_by_zone():
+@instrumented
+@QUERY_CACHE.cached
+def get_consumption_by_zone(since=None, until=None):
     """Fetch total consumption (kWh) grouped by zone."""
-    connection = connect()
-    query = """
+    totals_query = """
+    SELECT z.name, SUM(t.consumption)
+    FROM consumption_total t
+    JOIN zone z ON t.scope_id = z.id
+    WHERE t.scope = 'zone'
+    GROUP BY z.name
+    """
+    events_query = """
     SELECT 
         z.name AS zone_name,
         SUM(de.numeric_value) AS total_consumption
-    FROM zone z
-    LEFT JOIN device d ON z.id = d.zone_id
-    LEFT JOIN device_event de ON d.id = de.device_id
-    WHERE de.type = 'energy-consumption'
+    FROM {events} de
+    JOIN device d ON de.device_id = d.id
+    JOIN zone z ON d.zone_id = z.id
+    WHERE de.type_code = ? AND de.timestamp >= ? AND de.timestamp < ?
     GROUP BY z.name
-    ORDER BY z.name
     """
-    cursor = connection.cursor()
-    cursor.execute(query)
-    result = cursor.fetchall()
-    connection.close()
+    result = sorted(
+        query_consumption(totals_query, events_query, 1, since, until).items()
+    )
 
     # Convert results to a list of dictionaries
     return [
-        {"Zona": row[0], "Consumo Total (kWh)": round(row[1] if row[1] else 0, 2)}
-        for row in result
+        {"Zona": key[0], "Consumo Total (kWh)": round(values[0] if values[0] else 0, 2)}
+        for key, values in result
     ]
 
 
-def get_consumption_by_device():
+@instrumented
+@QUERY_CACHE.cached
+def get_consumption_by_device(since=None, until=None):
     """Fetch total consumption (kWh) grouped by device."""
-    connection = connect()
-    query = """
+    totals_query = """
+    SELECT d.name, SUM(t.consumption)
+    FROM consumption_total t
+    JOIN device d ON t.scope_id = d.id
+    WHERE t.scope = 'device'
+    GROUP BY d.name
+    """
+    events_query = """
     SELECT 
         d.name AS device_name,
         SUM(de.numeric_value) AS total_consumption
-    FROM device d
-    LEFT JOIN device_event de ON d.id = de.device_id
-    WHERE de.type = 'energy-consumption'
+    FROM {events} de
+    JOIN device d ON de.device_id = d.id
+    WHERE de.type_code = ? AND de.timestamp >= ? AND de.timestamp < ?
     GROUP BY d.name
-    ORDER BY d.name
     """
-    cursor = connection.cursor()
-    cursor.execute(query)
-    result = cursor.fetchall()
-    connection.close()
+    result = sorted(
+        query_consumption(totals_query, events_query, 1, since, until).items()
+    )
 
     # Convert results to a list of dictionaries
     return [
         {
-            "Dispositivo": row[0],
-            "Consumo Total (kWh)": round(row[1] if row[1] else 0, 2),
+            "Dispositivo": key[0],
+            "Consumo Total (kWh)": round(values[0] if values[0] else 0, 2),
         }
-        for row in result
+        for key, values in result
     ]
 
 
-def get_consumption_by_period(period):
-    """Fetch total consumption (kWh) grouped by zone and filtered by period."""
-    connection = connect()
-    period_filter = {
-        "Diário": "strftime('%Y-%m-%d', de.timestamp) AS period",
-        "Semanal": "strftime('%Y-%W', de.timestamp) AS period",
-        "Mensal": "strftime('%Y-%m', de.timestamp) AS period",
-    }
+@instrumented
+@QUERY_CACHE.cached
+def get_consumption_by_period(period, since=None, until=None):
+    """Fetch total consumption (kWh) grouped by zone and filtered by period.
 
-    query = f"""
+    Reads the consumption buckets of the period's resolution. since/until
+    select the buckets that overlap the [since, until) window, so the buckets
+    at the edges of a window are counted whole.
+    """
+    fold_buckets()
+    connection = connect()
+    query = """
     SELECT 
         z.name AS zone_name,
-        {period_filter[period]},
-        SUM(de.numeric_value) AS total_consumption
-    FROM zone z
-    LEFT JOIN device d ON z.id = d.zone_id
-    LEFT JOIN device_event de ON d.id = de.device_id
-    WHERE de.type = 'energy-consumption'
-    GROUP BY period, z.name
-    ORDER BY period
+        b.bucket AS period,
+        SUM(b.consumption) AS total_consumption
+    FROM consumption_bucket b
+    JOIN zone z ON b.scope_id = z.id
+    WHERE b.resolution = ? AND b.scope = 'zone'
+        AND b.bucket_end > ? AND b.bucket_start < ?
+    GROUP BY b.bucket, z.name
     """
-
     cursor = connection.cursor()
-    cursor.execute(query)
-    result = cursor.fetchall()
+    cursor.execute(
+        query,
+        (PERIOD_RESOLUTIONS[period], since or MIN_TIMESTAMP, until or MAX_TIMESTAMP),
+    )
+    result = sorted(cursor.fetchall(), key=lambda row: (row[1], row[0]))
     connection.close()
 
     # Convert results to a list of dictionaries
@@ -297,3 +975,165 @@ def get_consumption_by_period(period):
         }
         for row in result
     ]
+
+
+def live_totals():
+    """Return (last event id, tariff version, consumption, cost) of the log.
+
+    Read by LIVE_METRICS when it resyncs. The cost comes from the buckets,
+    which only hold the events up to the fold watermark, so the totals are
+    those of the events up to the watermark, read in the same snapshot as
+    it, and the watermark is returned as the last id: LIVE_METRICS costs the
+    events after it hour by hour. A fold during the read is retried. The
+    events of the last RECENT_WINDOW_SECONDS not yet in RECENT_EVENTS are
+    added to it.
+    """
+    since = datetime.fromtimestamp(
+        time.time() - RECENT_WINDOW_SECONDS, timezone.utc
+    ).strftime("%Y-%m-%d %H:%M:%S")
+    codes = list(EVENT_TYPE_CODES.values())
+    placeholders = ", ".join("?" * len(codes))
+    for _ in range(LIVE_TOTALS_ATTEMPTS):
+        fold_buckets()
+        connection = connect()
+        try:
+            watermark = read_watermark(connection)
+            cost = sum(
+                cost or 0.0 for cost in scope_costs(connection, "device").values()
+            )
+            connection.execute("BEGIN;")  # One snapshot for the reads below
+            try:
+                folded_at = read_watermark(connection)
+                last_id, tariff_version, consumption, unfolded = connection.execute(
+                    """
+                    SELECT
+                        (SELECT COALESCE(MAX(id), 0) FROM device_event),
+                        (SELECT version FROM tariff_revision),
+                        (
+                            SELECT consumption
+                            FROM consumption_total
+                            WHERE scope = 'global' AND scope_id = 0
+                        ),
+                        (
+                            SELECT TOTAL(numeric_value)
+                            FROM device_event
+                            WHERE id > ? AND type_code = ?
+                        );
+                    """,
+                    (watermark, ENERGY_CONSUMPTION),
+                ).fetchone()
+                rows = connection.execute(
+                    f"""
+                    SELECT id, device_id, type_code, timestamp, value, numeric_value
+                    FROM device_event
+                    WHERE type_code IN ({placeholders}) AND timestamp >= ?
+                        AND id > ? AND id <= ?
+                    ORDER BY id;
+                    """,
+                    (*codes, since, RECENT_EVENTS.last_id or 0, last_id),
+                ).fetchall()
+            finally:
+                connection.rollback()
+        finally:
+            connection.close()
+        # Otherwise a fold changed the buckets while the cost was read
+        if folded_at == watermark:
+            break
+    RECENT_EVENTS.add_rows(rows)
+    return max(watermark, 0), tariff_version, (consumption or 0.0) - unfolded, cost
+
+
+def live_events(after_id):
+    """Return the last event id, the tariff version and the new consumption.
+
+    The events after after_id are read through the primary key, so each poll
+    of LIVE_METRICS only touches the new rows, and added to RECENT_EVENTS.
+    Their consumption is returned by UTC hour, as (hour, events, consumption)
+    rows.
+    """
+    connection = connect()
+    try:
+        last_id, tariff_version = connection.execute("""
+            SELECT
+                (SELECT COALESCE(MAX(id), 0) FROM device_event),
+                (SELECT version FROM tariff_revision);
+            """).fetchone()
+        rows = connection.execute(
+            """
+            SELECT id, device_id, type_code, timestamp, value, numeric_value
+            FROM device_event
+            WHERE id > ? AND id <= ?
+            ORDER BY id;
+            """,
+            (after_id, last_id),
+        ).fetchall()
+    finally:
+        connection.close()
+    RECENT_EVENTS.add_rows(rows)
+    hours = {}
+    for _, _, type_code, timestamp, _, numeric_value in rows:
+        if type_code == ENERGY_CONSUMPTION:
+            events, consumption = hours.get(timestamp[:13], (0, 0.0))
+            hours[timestamp[:13]] = (events + 1, consumption + (numeric_value or 0.0))
+    return (
+        last_id,
+        tariff_version,
+        [(hour, *totals) for hour, totals in hours.items()],
+    )
+
+
+def recent_activity(seconds=RECENT_WINDOW_SECONDS):
+    """Return what each device did over the last seconds, from RECENT_EVENTS.
+
+    Served from memory: the consumption events, total and mean, and the last
+    state change and sensor reading of the devices active in the window.
+    "Janela Incompleta" flags the devices that sent more events of a type
+    than RECENT_EVENTS keeps, whose figures only cover the latest ones.
+    """
+    windows = {
+        type_code: RECENT_EVENTS.rolling(type_code, seconds)
+        for type_code in EVENT_TYPE_CODES.values()
+    }
+    truncated = set().union(
+        *(
+            RECENT_EVENTS.truncated(type_code, seconds)
+            for type_code in EVENT_TYPE_CODES.values()
+        )
+    )
+    consumption = windows[ENERGY_CONSUMPTION]
+    active = set().union(*windows.values())
+    activity = []
+    for device_id in sorted(active):
+        state = RECENT_EVENTS.last_event(device_id, EVENT_TYPE_CODES["state-change"])
+        reading = RECENT_EVENTS.last_event(
+            device_id, EVENT_TYPE_CODES["sensor-reading"]
+        )
+        events, total, mean = consumption.get(device_id, (0, 0.0, 0.0))
+        activity.append(
+            {
+                "ID": device_id,
+                "Estado": state[1] if state else None,
+                "Última Leitura": reading[1] if reading else None,
+                "Eventos de Consumo": events,
+                "Consumo (kWh)": round(total, 3),
+                "Média por Evento (kWh)": round(mean, 4),
+                "Janela Incompleta": device_id in truncated,
+            }
+        )
+    return activity
+
+
+def rate_at(hour):
+    """Rate in R$/kWh of a UTC hour ("YYYY-MM-DD HH"), see ctwp.tariffs."""
+    connection = connect()
+    try:
+        rate, _, _ = current_rate(connection, parse_timestamp(f"{hour}:00:00"))
+    finally:
+        connection.close()
+    return rate
+
+
+# Recent events of every device, filled from the event log tail of LIVE_METRICS
+RECENT_EVENTS = RecentEvents()
+# Live totals of the "Métricas em Tempo Real" panel, shared by every viewer
+LIVE_METRICS = LiveMetrics(live_totals, live_events, rate_at)
@@ -0,0 +1,54 @@
+-- Integer codes for the event types, so the event log indexes stay compact
+CREATE TABLE
+  IF NOT EXISTS event_type (
+    id INTEGER PRIMARY KEY,
+    name VARCHAR(50) NOT NULL UNIQUE -- Type of the event (e.g., "energy-consumption")
+  );
+
+INSERT OR IGNORE INTO
+  event_type (id, name)
+VALUES
+  (1, 'state-change'),
+  (2, 'sensor-reading'),
+  (3, 'energy-consumption');
+
+ALTER TABLE device_event
+ADD COLUMN type_code INTEGER REFERENCES event_type (id);
+
+UPDATE device_event
+SET
+  type_code = (
+    SELECT
+      id
+    FROM
+      event_type
+    WHERE
+      name = device_event.type
+  );
+
+-- Fills type_code for the writers that only provide the type name
+CREATE TRIGGER IF NOT EXISTS device_event_type_code AFTER INSERT ON device_event WHEN NEW.type_code IS NULL BEGIN
+INSERT OR IGNORE INTO
+  event_type (name)
+VALUES
+  (NEW.type);
+
+UPDATE device_event
+SET
+  type_code = (
+    SELECT
+      id
+    FROM
+      event_type
+    WHERE
+      name = NEW.type
+  )
+WHERE
+  id = NEW.id;
+
+END;
+
+-- Covering indexes of the event log: per device over time, and over time
+CREATE INDEX IF NOT EXISTS device_event_type_device_time ON device_event (type_code, device_id, timestamp, numeric_value);
+
+CREATE INDEX IF NOT EXISTS device_event_type_time ON device_event (type_code, timestamp, device_id, numeric_value);
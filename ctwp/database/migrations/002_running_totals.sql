@@ -0,0 +1,112 @@
+-- Running consumption and cost counters, maintained by a trigger on each
+-- energy-consumption event, so the real-time metrics are constant time reads
+CREATE TABLE
+  IF NOT EXISTS consumption_total (
+    scope VARCHAR(10) NOT NULL, -- Scope of the counter: "global", "zone" or "device"
+    scope_id INTEGER NOT NULL, -- Zone or device id, 0 for the global counter
+    consumption REAL NOT NULL DEFAULT 0, -- Energy consumption in kWh
+    cost REAL NOT NULL DEFAULT 0, -- Cost of the consumption in R$
+    event_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (scope, scope_id)
+  ) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS device_event_running_totals AFTER INSERT ON device_event WHEN NEW.type = 'energy-consumption' BEGIN
+INSERT INTO
+  consumption_total (scope, scope_id, consumption, cost, event_count)
+VALUES
+  (
+    'global',
+    0,
+    COALESCE(NEW.numeric_value, 0),
+    COALESCE(NEW.numeric_value * 0.45, 0),
+    1
+  ) ON CONFLICT (scope, scope_id) DO
+UPDATE
+SET
+  consumption = consumption + excluded.consumption,
+  cost = cost + excluded.cost,
+  event_count = event_count + 1;
+
+INSERT INTO
+  consumption_total (scope, scope_id, consumption, cost, event_count)
+SELECT
+  'device',
+  NEW.device_id,
+  COALESCE(NEW.numeric_value, 0),
+  COALESCE(NEW.numeric_value * 0.45, 0),
+  1
+WHERE
+  NEW.device_id IS NOT NULL ON CONFLICT (scope, scope_id) DO
+UPDATE
+SET
+  consumption = consumption + excluded.consumption,
+  cost = cost + excluded.cost,
+  event_count = event_count + 1;
+
+INSERT INTO
+  consumption_total (scope, scope_id, consumption, cost, event_count)
+SELECT
+  'zone',
+  d.zone_id,
+  COALESCE(NEW.numeric_value, 0),
+  COALESCE(NEW.numeric_value * 0.45, 0),
+  1
+FROM
+  device d
+WHERE
+  d.id = NEW.device_id
+  AND d.zone_id IS NOT NULL ON CONFLICT (scope, scope_id) DO
+UPDATE
+SET
+  consumption = consumption + excluded.consumption,
+  cost = cost + excluded.cost,
+  event_count = event_count + 1;
+
+END;
+
+-- Counters of the events recorded before this migration
+INSERT INTO
+  consumption_total (scope, scope_id, consumption, cost, event_count)
+SELECT
+  'global',
+  0,
+  COALESCE(SUM(numeric_value), 0),
+  COALESCE(SUM(numeric_value * 0.45), 0),
+  COUNT(*)
+FROM
+  device_event
+WHERE
+  type = 'energy-consumption';
+
+INSERT INTO
+  consumption_total (scope, scope_id, consumption, cost, event_count)
+SELECT
+  'device',
+  device_id,
+  COALESCE(SUM(numeric_value), 0),
+  COALESCE(SUM(numeric_value * 0.45), 0),
+  COUNT(*)
+FROM
+  device_event
+WHERE
+  type = 'energy-consumption'
+  AND device_id IS NOT NULL
+GROUP BY
+  device_id;
+
+INSERT INTO
+  consumption_total (scope, scope_id, consumption, cost, event_count)
+SELECT
+  'zone',
+  d.zone_id,
+  COALESCE(SUM(de.numeric_value), 0),
+  COALESCE(SUM(de.numeric_value * 0.45), 0),
+  COUNT(*)
+FROM
+  device_event de
+  JOIN device d ON de.device_id = d.id
+WHERE
+  de.type = 'energy-consumption'
+  AND d.zone_id IS NOT NULL
+GROUP BY
+  d.zone_id;
@@ -0,0 +1,31 @@
+-- Energy consumption downsampled into hourly, daily, weekly and monthly
+-- buckets per device and per zone, folded from the event log by ctwp.buckets
+CREATE TABLE
+  IF NOT EXISTS consumption_bucket (
+    resolution VARCHAR(10) NOT NULL, -- "hourly", "daily", "weekly" or "monthly"
+    bucket VARCHAR(13) NOT NULL, -- Label of the bucket (e.g., "2024-05-03 14", "2024-05-03", "2024-18", "2024-05")
+    scope VARCHAR(10) NOT NULL, -- Scope of the bucket: "device" or "zone"
+    scope_id INTEGER NOT NULL, -- Device or zone id
+    bucket_start DATETIME NOT NULL, -- First timestamp of the bucket
+    bucket_end DATETIME NOT NULL, -- First timestamp after the bucket
+    consumption REAL, -- Energy consumption in kWh
+    cost REAL, -- Cost of the consumption in R$
+    event_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (resolution, scope, bucket, scope_id)
+  ) WITHOUT ROWID;
+
+-- Buckets of a resolution that overlap a time window
+CREATE INDEX IF NOT EXISTS consumption_bucket_window ON consumption_bucket (resolution, scope, bucket_end, bucket_start);
+
+-- Id of the last event folded into the buckets, -1 until they are first built
+-- (the archived partitions can only be read outside of this migration)
+CREATE TABLE
+  IF NOT EXISTS bucket_watermark (
+    name VARCHAR(50) PRIMARY KEY,
+    last_event_id INTEGER NOT NULL
+  );
+
+INSERT OR IGNORE INTO
+  bucket_watermark (name, last_event_id)
+VALUES
+  ('consumption_bucket', -1);
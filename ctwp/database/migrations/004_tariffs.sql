@@ -0,0 +1,264 @@
+-- Time-of-use tariffs: the rate of each hour comes from the tariff valid at
+-- that time, its peak windows and the bandeira tarifária of the month (see
+-- ctwp/tariffs.py). Costs are no longer kept per event at a fixed rate.
+CREATE TABLE
+  IF NOT EXISTS tariff (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name VARCHAR(50) NOT NULL, -- Name of the tariff (e.g., "Tarifa Branca")
+    valid_from DATETIME NOT NULL, -- First local time the tariff applies to
+    valid_until DATETIME, -- First local time it no longer applies to, NULL while in force
+    base_rate REAL NOT NULL -- Off-peak rate in R$/kWh, outside of the tariff windows
+  );
+
+CREATE TABLE
+  IF NOT EXISTS tariff_window (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    tariff_id INTEGER NOT NULL,
+    period VARCHAR(20) NOT NULL, -- Name of the period (e.g., "peak", "intermediate")
+    weekdays VARCHAR(7) NOT NULL DEFAULT '12345', -- ISO days of the week (1 = Monday), holidays excluded
+    start_hour INTEGER NOT NULL, -- Local hour the window starts at
+    end_hour INTEGER NOT NULL, -- Local hour the window ends at (exclusive)
+    rate REAL NOT NULL, -- Rate in R$/kWh within the window
+    FOREIGN KEY (tariff_id) REFERENCES tariff (id)
+  );
+
+-- Bandeiras tarifárias: surcharge of every kWh consumed in a month
+CREATE TABLE
+  IF NOT EXISTS tariff_flag (
+    month VARCHAR(7) PRIMARY KEY, -- Local month (e.g., "2024-08")
+    flag VARCHAR(20) NOT NULL, -- Name of the flag (e.g., "amarela", "vermelha-1")
+    surcharge REAL NOT NULL -- Surcharge in R$/kWh
+  );
+
+-- Days billed at the off-peak rate, like weekends
+CREATE TABLE
+  IF NOT EXISTS tariff_holiday (
+    date DATE PRIMARY KEY, -- Local date (e.g., "2024-12-25")
+    name VARCHAR(50)
+  );
+
+-- Version of the tariff definitions, bumped by the triggers below, and the
+-- version and span of the interval index built from them
+CREATE TABLE
+  IF NOT EXISTS tariff_revision (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    version INTEGER NOT NULL,
+    indexed_version INTEGER,
+    indexed_from DATETIME,
+    indexed_until DATETIME
+  );
+
+INSERT OR IGNORE INTO
+  tariff_revision (id, version)
+VALUES
+  (1, 1);
+
+CREATE TRIGGER IF NOT EXISTS tariff_insert_revision AFTER INSERT ON tariff BEGIN
+UPDATE tariff_revision
+SET
+  version = version + 1;
+
+END;
+
+CREATE TRIGGER IF NOT EXISTS tariff_update_revision AFTER
+UPDATE ON tariff BEGIN
+UPDATE tariff_revision
+SET
+  version = version + 1;
+
+END;
+
+CREATE TRIGGER IF NOT EXISTS tariff_delete_revision AFTER DELETE ON tariff BEGIN
+UPDATE tariff_revision
+SET
+  version = version + 1;
+
+END;
+
+CREATE TRIGGER IF NOT EXISTS tariff_window_insert_revision AFTER INSERT ON tariff_window BEGIN
+UPDATE tariff_revision
+SET
+  version = version + 1;
+
+END;
+
+CREATE TRIGGER IF NOT EXISTS tariff_window_update_revision AFTER
+UPDATE ON tariff_window BEGIN
+UPDATE tariff_revision
+SET
+  version = version + 1;
+
+END;
+
+CREATE TRIGGER IF NOT EXISTS tariff_window_delete_revision AFTER DELETE ON tariff_window BEGIN
+UPDATE tariff_revision
+SET
+  version = version + 1;
+
+END;
+
+CREATE TRIGGER IF NOT EXISTS tariff_flag_insert_revision AFTER INSERT ON tariff_flag BEGIN
+UPDATE tariff_revision
+SET
+  version = version + 1;
+
+END;
+
+CREATE TRIGGER IF NOT EXISTS tariff_flag_update_revision AFTER
+UPDATE ON tariff_flag BEGIN
+UPDATE tariff_revision
+SET
+  version = version + 1;
+
+END;
+
+CREATE TRIGGER IF NOT EXISTS tariff_flag_delete_revision AFTER DELETE ON tariff_flag BEGIN
+UPDATE tariff_revision
+SET
+  version = version + 1;
+
+END;
+
+CREATE TRIGGER IF NOT EXISTS tariff_holiday_insert_revision AFTER INSERT ON tariff_holiday BEGIN
+UPDATE tariff_revision
+SET
+  version = version + 1;
+
+END;
+
+CREATE TRIGGER IF NOT EXISTS tariff_holiday_update_revision AFTER
+UPDATE ON tariff_holiday BEGIN
+UPDATE tariff_revision
+SET
+  version = version + 1;
+
+END;
+
+CREATE TRIGGER IF NOT EXISTS tariff_holiday_delete_revision AFTER DELETE ON tariff_holiday BEGIN
+UPDATE tariff_revision
+SET
+  version = version + 1;
+
+END;
+
+-- Interval index: consecutive UTC hours sharing a rate, merged into intervals
+CREATE TABLE
+  IF NOT EXISTS tariff_interval (
+    start DATETIME PRIMARY KEY, -- First UTC timestamp of the interval
+    end DATETIME NOT NULL, -- First UTC timestamp after the interval
+    rate REAL NOT NULL, -- Rate in R$/kWh, flag surcharge included
+    period VARCHAR(20) NOT NULL, -- "off-peak" or the period of a tariff window
+    tariff_id INTEGER, -- NULL when no tariff was in force
+    flag VARCHAR(20) -- Bandeira tarifária of the month, NULL when none was set
+  ) WITHOUT ROWID;
+
+-- Costs of each month by scope, cached for the tariff version they were
+-- computed with; rows are dropped when events of their month are folded
+CREATE TABLE
+  IF NOT EXISTS tariff_cost_month (
+    month VARCHAR(7) PRIMARY KEY, -- UTC month (e.g., "2024-08")
+    tariff_version INTEGER NOT NULL,
+    resolution VARCHAR(10) NOT NULL -- Buckets the costs were computed from: "hourly" or "daily"
+  );
+
+CREATE TABLE
+  IF NOT EXISTS tariff_cost (
+    month VARCHAR(7) NOT NULL,
+    scope VARCHAR(10) NOT NULL, -- Scope of the cost: "device" or "zone"
+    scope_id INTEGER NOT NULL, -- Device or zone id
+    consumption REAL, -- Energy consumption in kWh
+    cost REAL, -- Cost of the consumption in R$
+    PRIMARY KEY (month, scope, scope_id)
+  ) WITHOUT ROWID;
+
+-- Default tariff: Tarifa Branca, off-peak at the former flat rate
+INSERT INTO
+  tariff (name, valid_from, valid_until, base_rate)
+VALUES
+  ('Tarifa Branca', '2000-01-01 00:00:00', NULL, 0.45);
+
+INSERT INTO
+  tariff_window (tariff_id, period, weekdays, start_hour, end_hour, rate)
+SELECT
+  id,
+  period,
+  '12345',
+  start_hour,
+  end_hour,
+  rate
+FROM
+  tariff,
+  (
+    SELECT
+      'intermediate' AS period,
+      17 AS start_hour,
+      18 AS end_hour,
+      0.68 AS rate
+    UNION ALL
+    SELECT
+      'peak',
+      18,
+      21,
+      1.05
+    UNION ALL
+    SELECT
+      'intermediate',
+      21,
+      22,
+      0.68
+  )
+WHERE
+  name = 'Tarifa Branca';
+
+-- The costs are computed from the hourly buckets from now on: drop the fixed
+-- rate cost of the running totals and of the buckets
+DROP TRIGGER IF EXISTS device_event_running_totals;
+
+ALTER TABLE consumption_total
+DROP COLUMN cost;
+
+ALTER TABLE consumption_bucket
+DROP COLUMN cost;
+
+CREATE TRIGGER IF NOT EXISTS device_event_running_totals AFTER INSERT ON device_event WHEN NEW.type = 'energy-consumption' BEGIN
+INSERT INTO
+  consumption_total (scope, scope_id, consumption, event_count)
+VALUES
+  ('global', 0, COALESCE(NEW.numeric_value, 0), 1) ON CONFLICT (scope, scope_id) DO
+UPDATE
+SET
+  consumption = consumption + excluded.consumption,
+  event_count = event_count + 1;
+
+INSERT INTO
+  consumption_total (scope, scope_id, consumption, event_count)
+SELECT
+  'device',
+  NEW.device_id,
+  COALESCE(NEW.numeric_value, 0),
+  1
+WHERE
+  NEW.device_id IS NOT NULL ON CONFLICT (scope, scope_id) DO
+UPDATE
+SET
+  consumption = consumption + excluded.consumption,
+  event_count = event_count + 1;
+
+INSERT INTO
+  consumption_total (scope, scope_id, consumption, event_count)
+SELECT
+  'zone',
+  d.zone_id,
+  COALESCE(NEW.numeric_value, 0),
+  1
+FROM
+  device d
+WHERE
+  d.id = NEW.device_id
+  AND d.zone_id IS NOT NULL ON CONFLICT (scope, scope_id) DO
+UPDATE
+SET
+  consumption = consumption + excluded.consumption,
+  event_count = event_count + 1;
+
+END;
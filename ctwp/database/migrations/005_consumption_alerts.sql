@@ -0,0 +1,16 @@
+-- Alerts raised by the anomaly detector of the event writer on
+-- energy-consumption events (see ctwp/anomalies.py)
+CREATE TABLE
+  IF NOT EXISTS consumption_alert (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    device_id INTEGER NOT NULL,
+    timestamp DATETIME NOT NULL, -- Timestamp of the event that raised the alert
+    kind VARCHAR(20) NOT NULL, -- "z-score" (far from the device's mean) or "rating" (above its rated power)
+    value REAL NOT NULL, -- Consumption of the event in kWh
+    expected REAL, -- Mean consumption of the device, or the energy at its rated power, in kWh
+    score REAL, -- z-score, or the ratio to the energy at the rated power
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (device_id) REFERENCES device (id)
+  );
+
+CREATE INDEX IF NOT EXISTS consumption_alert_time ON consumption_alert (timestamp);
@@ -0,0 +1,211 @@
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+FEED_SIZE = 600  # Ticks kept for the viewers catching up
+POLL_INTERVAL = 1.0  # Seconds between two reads of the new events
+RESYNC_INTERVAL = 60.0  # Seconds between two reads of the full totals
+IDLE_TIMEOUT = 300.0  # Seconds without viewers before the feed stops polling
+RATE_CACHE_SIZE = 48  # Hourly rates kept before the cache is cleared
+
+
+def current_hour():
+    """The current UTC hour, as the "YYYY-MM-DD HH" prefix of the timestamps."""
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d %H")
+
+
+class LiveMetrics:
+    """Rolling totals of the event log, published to the dashboards as ticks.
+
+    A single background thread per process tails device_event by id: every
+    poll_interval, or as soon as notify() reports a written batch, it reads
+    the consumption of the new events by hour with read_events(after_id),
+    costs it at the rate of its hour and appends a tick to a ring buffer of
+    feed_size ticks. Viewers call catch_up() with the view they drew last and
+    only apply the ticks published since, so any number of them cost a single
+    read of the new events per tick.
+
+    The totals are read in full with read_totals() at start, every
+    resync_interval and when the tariffs change, which also corrects any
+    drift of the ticks. A resync starts a new epoch; views of an older epoch,
+    or too far behind for the buffer, are redrawn from the totals.
+    """
+
+    def __init__(
+        self,
+        read_totals,
+        read_events,
+        rate_at,
+        feed_size=FEED_SIZE,
+        poll_interval=POLL_INTERVAL,
+        resync_interval=RESYNC_INTERVAL,
+        idle_timeout=IDLE_TIMEOUT,
+    ):
+        self.read_totals = read_totals
+        self.read_events = read_events
+        self.rate_at = rate_at
+        self.poll_interval = poll_interval
+        self.resync_interval = resync_interval
+        self.idle_timeout = idle_timeout
+        self._lock = threading.Lock()
+        self._poll_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._ticks = deque(maxlen=feed_size)
+        self._rates = {}
+        self._epoch = 0
+        self._sequence = 0
+        self._last_id = None
+        self._tariff_version = None
+        self._consumption = 0.0
+        self._cost = 0.0
+        self._rate = None
+        self._resynced_at = 0.0
+        self._viewed_at = 0.0
+        self._polls = 0
+        self._failed = 0
+        self._last_error = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(
+                target=self._run, name="live-metrics", daemon=True
+            )
+            self._thread.start()
+
+    def notify(self, events=None):
+        """Poll now, e.g. after the EventWriter wrote a batch."""
+        self._wake.set()
+
+    def reset(self):
+        """Drop the totals, read again in full on the next poll."""
+        with self._poll_lock, self._lock:
+            self._last_id = None
+            self._rates.clear()
+
+    def poll(self):
+        """Publish a tick with the events written since the last poll."""
+        with self._poll_lock:
+            if (
+                self._last_id is None
+                or time.monotonic() - self._resynced_at >= self.resync_interval
+            ):
+                self._resync()
+                return
+            last_id, tariff_version, hours = self.read_events(self._last_id)
+            if tariff_version != self._tariff_version:
+                self._resync()
+                return
+            events, consumption, cost = 0, 0.0, 0.0
+            for hour, hour_events, hour_consumption in hours:
+                hour_consumption = hour_consumption or 0.0
+                events += hour_events
+                consumption += hour_consumption
+                cost += hour_consumption * self._hour_rate(hour)
+            rate = self._hour_rate(current_hour())
+            with self._lock:
+                self._polls += 1
+                self._last_id = last_id
+                if not events and rate == self._rate:
+                    return
+                self._sequence += 1
+                self._consumption += consumption
+                self._cost += cost
+                self._rate = rate
+                self._ticks.append((self._sequence, events, consumption, cost))
+
+    def catch_up(self, view=None):
+        """Return the current view of the totals, from the previous view.
+
+        view is the dict returned by the previous call, None at first. Within
+        the same epoch only the ticks after its sequence are applied; the
+        *_delta entries hold the change since the previous view.
+        """
+        self.start()
+        if (
+            self._last_id is None
+            or time.monotonic() - self._viewed_at > self.idle_timeout
+        ):
+            # First viewer, or the feed stopped polling: read the totals now
+            self.poll()
+        self._wake.set()
+        with self._lock:
+            self._viewed_at = time.monotonic()
+            oldest = self._ticks[0][0] if self._ticks else self._sequence + 1
+            events = 0
+            if (
+                view is None
+                or view["epoch"] != self._epoch
+                or view["sequence"] < oldest - 1
+            ):
+                consumption, cost = self._consumption, self._cost
+            else:
+                consumption, cost = view["consumption"], view["cost"]
+                for sequence, tick_events, tick_consumption, tick_cost in self._ticks:
+                    if sequence > view["sequence"]:
+                        events += tick_events
+                        consumption += tick_consumption
+                        cost += tick_cost
+            return {
+                "epoch": self._epoch,
+                "sequence": self._sequence,
+                "consumption": consumption,
+                "cost": cost,
+                "rate": self._rate,
+                "events_delta": events,
+                "consumption_delta": consumption - view["consumption"] if view else 0.0,
+                "cost_delta": cost - view["cost"] if view else 0.0,
+            }
+
+    def stats(self):
+        with self._lock:
+            return {
+                "epoch": self._epoch,
+                "sequence": self._sequence,
+                "buffered_ticks": len(self._ticks),
+                "last_event_id": self._last_id,
+                "polls": self._polls,
+                "failed_polls": self._failed,
+                "last_error": self._last_error,
+            }
+
+    def _resync(self):
+        last_id, tariff_version, consumption, cost = self.read_totals()
+        if tariff_version != self._tariff_version:
+            self._rates.clear()
+        rate = self._hour_rate(current_hour())
+        with self._lock:
+            self._epoch += 1
+            self._sequence = 0
+            self._ticks.clear()
+            self._last_id = last_id
+            self._tariff_version = tariff_version
+            self._consumption = consumption
+            self._cost = cost
+            self._rate = rate
+            self._resynced_at = time.monotonic()
+
+    def _hour_rate(self, hour):
+        if hour not in self._rates:
+            if len(self._rates) >= RATE_CACHE_SIZE:
+                self._rates.clear()
+            self._rates[hour] = self.rate_at(hour) or 0.0
+        return self._rates[hour]
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            if time.monotonic() - self._viewed_at > self.idle_timeout:
+                # Nobody is watching: the next viewer wakes the feed up
+                continue
+            try:
+                self.poll()
+            except Exception as error:
+                with self._lock:
+                    self._failed += 1
+                    self._last_error = str(error)
+                print(f"Failed to poll the live metrics: {error}")
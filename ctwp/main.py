@@ -1,6 +1,6 @@
 import streamlit as st
-import pandas as pd
-import plotly.express as px
+from datetime import datetime, timedelta, timezone
+from common.fanout import gather
 from ctwp.database import (
     get_latest_consumption,
     get_current_rate,
@@ -12,14 +12,67 @@ from ctwp.database import (
     get_consumption_by_zone,
     get_consumption_by_device,
     get_consumption_by_period,
+    get_consumption_alerts,
+    LIVE_METRICS,
+    RECENT_WINDOW_SECONDS,
+    recent_activity,
 )
 
+PERIODS = ["Diário", "Semanal", "Mensal", "Horário"]
+# Days of history shown in the period details, None for the whole history
+PERIOD_WINDOWS = {
+    "Todo o histórico": None,
+    "Últimos 7 dias": 7,
+    "Últimos 30 dias": 30,
+    "Últimos 365 dias": 365,
+}
+# Run the independent queries of the page in parallel before drawing it
+CONCURRENT_LOADING = True
+# Follow the real-time metrics from the live feed of ctwp.database instead of
+# querying them again on every click of "Atualizar Métricas"
+LIVE_METRICS_ENABLED = True
+LIVE_REFRESH_SECONDS = 2  # Seconds between two updates of the live metrics
 
-def update_metrics(consumption_placeholder, rate_placeholder, cost_placeholder):
-    # Fetch data from the database
-    current_consumption = get_latest_consumption()
-    current_rate = get_current_rate()
-    total_cost = get_total_cost()
+
+def window_since(window_option):
+    """Start of a period window, rounded to the minute so reruns hit the cache."""
+    if PERIOD_WINDOWS[window_option] is None:
+        return None
+    since = datetime.now(timezone.utc) - timedelta(days=PERIOD_WINDOWS[window_option])
+    return since.strftime("%Y-%m-%d %H:%M:00")
+
+
+def metric_queries():
+    return {
+        "current_consumption": (get_latest_consumption,),
+        "current_rate": (get_current_rate,),
+        "total_cost": (get_total_cost,),
+    }
+
+
+def dashboard_queries(period, since, metrics=True):
+    """The queries of the page that do not depend on another query's result."""
+    return {
+        **(metric_queries() if metrics else {}),
+        "alerts": (get_consumption_alerts,),
+        "zones": (get_all_zones,),
+        "cost_by_zone": (get_cost_by_zone,),
+        "cost_by_device": (get_cost_by_device,),
+        "consumption_by_zone": (get_consumption_by_zone,),
+        "consumption_by_device": (get_consumption_by_device,),
+        "consumption_by_period": (get_consumption_by_period, period, since),
+    }
+
+
+def update_metrics(
+    consumption_placeholder, rate_placeholder, cost_placeholder, data=None
+):
+    # Fetch data from the database, unless the page already loaded it
+    if data is None:
+        data = gather(metric_queries(), concurrent=CONCURRENT_LOADING)
+    current_consumption = data["current_consumption"]
+    current_rate = data["current_rate"]
+    total_cost = data["total_cost"]
 
     # Update placeholders with real-time data
     consumption_placeholder.metric("Consumo Atual (kWh)", f"{current_consumption} kWh")
@@ -27,6 +80,49 @@ def update_metrics(consumption_placeholder, rate_placeholder, cost_placeholder):
     cost_placeholder.metric("Custo Total (R$)", f"R${total_cost}")
 
 
+def live_metrics():
+    """Real-time metrics from the live feed, redrawn every LIVE_REFRESH_SECONDS.
+
+    Each run only applies the ticks published since the view of the previous
+    run, kept in the session state.
+    """
+    view = LIVE_METRICS.catch_up(st.session_state.get("ctwp_live_view"))
+    st.session_state["ctwp_live_view"] = view
+
+    col1, col2, col3 = st.columns(3)
+    col1.metric(
+        "Consumo Atual (kWh)",
+        f"{round(view['consumption'], 2)} kWh",
+        delta=round(view["consumption_delta"], 3) or None,
+    )
+    col2.metric("Tarifa Atual (R$/kWh)", f"R${round(view['rate'] or 0, 5)}")
+    col3.metric(
+        "Custo Total (R$)",
+        f"R${round(view['cost'], 2)}",
+        delta=round(view["cost_delta"], 2) or None,
+    )
+    st.caption(
+        f"Atualizado a cada {LIVE_REFRESH_SECONDS} s: "
+        f"{view['events_delta']} novos eventos de consumo desde a última atualização."
+    )
+
+    # What each device did in the last minutes, from the recent events in memory
+    activity = recent_activity()
+    with st.expander(
+        f"Agora: {len(activity)} dispositivos ativos nos últimos "
+        f"{RECENT_WINDOW_SECONDS // 60} minutos"
+    ):
+        if activity:
+            st.dataframe(activity, use_container_width=True, hide_index=True)
+            if any(device["Janela Incompleta"] for device in activity):
+                st.caption(
+                    "Dispositivos com janela incompleta enviaram mais eventos do "
+                    "que a memória guarda; seus valores cobrem só os mais recentes."
+                )
+        else:
+            st.write("Nenhum evento recente.")
+
+
 def dashboard():
     # Application title
     st.title("CTWP")
@@ -36,24 +132,51 @@ def dashboard():
         "para tomar decisões informadas e reduzir custos."
     )
 
+    # The period selectors are drawn at the bottom of the page; their values
+    # are read from the session state so their query is loaded with the rest
+    period_option = st.session_state.get("ctwp_period", PERIODS[0])
+    window_option = st.session_state.get("ctwp_window", next(iter(PERIOD_WINDOWS)))
+    since = window_since(window_option)
+    data = gather(
+        dashboard_queries(period_option, since, metrics=not LIVE_METRICS_ENABLED),
+        concurrent=CONCURRENT_LOADING,
+    )
+
     # Separator for sections
     st.markdown("---")
 
     # Section: Real-time metrics
     st.header("Métricas em Tempo Real")
 
-    # Columns for metrics
-    col1, col2, col3 = st.columns(3)
+    if LIVE_METRICS_ENABLED:
+        # Only this fragment reruns on each update, not the whole page
+        st.fragment(live_metrics, run_every=LIVE_REFRESH_SECONDS)()
+    else:
+        # Columns for metrics
+        col1, col2, col3 = st.columns(3)
+
+        # Placeholders for metrics
+        consumption_placeholder = col1.empty()
+        rate_placeholder = col2.empty()
+        cost_placeholder = col3.empty()
+        update_metrics(
+            consumption_placeholder, rate_placeholder, cost_placeholder, data
+        )
+
+        # Button to update metrics
+        if st.button("Atualizar Métricas"):
+            update_metrics(consumption_placeholder, rate_placeholder, cost_placeholder)
 
-    # Placeholders for metrics
-    consumption_placeholder = col1.empty()
-    rate_placeholder = col2.empty()
-    cost_placeholder = col3.empty()
-    update_metrics(consumption_placeholder, rate_placeholder, cost_placeholder)
+    # Separator for alerts
+    st.markdown("---")
 
-    # Button to update metrics
-    if st.button("Atualizar Métricas"):
-        update_metrics(consumption_placeholder, rate_placeholder, cost_placeholder)
+    # Section: Consumption alerts raised while the events were ingested
+    st.header("Alertas de Consumo")
+    alerts = data["alerts"]
+    if alerts:
+        st.dataframe(alerts, use_container_width=True, hide_index=True)
+    else:
+        st.write("Nenhum consumo fora do padrão detectado.")
 
     # Separator for reports
     st.markdown("---")
@@ -61,8 +184,7 @@ def dashboard():
     # Section: Zones and Devices
     st.header("Zonas e Dispositivos")
 
-    # Fetch all zones
-    zones = get_all_zones()
+    zones = data["zones"]
     zone_options = {zone["Nome"]: zone["ID"] for zone in zones}
 
     # Dropdown for zones
@@ -93,7 +215,7 @@ def dashboard():
 
     # Display cost by zone
     st.subheader("Custo por Zona")
-    cost_by_zone = get_cost_by_zone()
+    cost_by_zone = data["cost_by_zone"]
     if cost_by_zone:
         st.dataframe(cost_by_zone, use_container_width=True)
     else:
@@ -101,7 +223,7 @@ def dashboard():
 
     # Display cost by device table
     st.subheader("Custo por Dispositivo")
-    cost_by_device = get_cost_by_device()
+    cost_by_device = data["cost_by_device"]
     if cost_by_device:
         st.dataframe(cost_by_device, use_container_width=True)
     else:
@@ -113,9 +235,13 @@ def dashboard():
     # Section: Consumption Graphs
     st.header("Gráficos de Consumo")
 
+    # Imported here, so the metrics and tables render before pandas/plotly load
+    import pandas as pd
+    import plotly.express as px
+
     # Consumption by Zone
     st.subheader("Consumo Total por Zona")
-    consumption_by_zone = get_consumption_by_zone()
+    consumption_by_zone = data["consumption_by_zone"]
     if consumption_by_zone:
         df_zone = pd.DataFrame(consumption_by_zone)
         fig_zone = px.bar(
@@ -127,7 +253,7 @@ def dashboard():
 
     # Consumption by Device
     st.subheader("Consumo Total por Dispositivo")
-    consumption_by_device = get_consumption_by_device()
+    consumption_by_device = data["consumption_by_device"]
     if consumption_by_device:
         df_device = pd.DataFrame(consumption_by_device)
         fig_device = px.bar(
@@ -146,11 +272,20 @@ def dashboard():
     # Section: Details by Period
     st.header("Detalhes por Período")
 
-    # Period selector
-    period_option = st.selectbox("Selecione o Período", ["Diário", "Semanal", "Mensal"])
+    # Period and time window selectors
+    selected_period = st.selectbox("Selecione o Período", PERIODS, key="ctwp_period")
+    selected_window = st.selectbox(
+        "Selecione a Janela", list(PERIOD_WINDOWS), key="ctwp_window"
+    )
 
-    # Fetch consumption by period from the database
-    consumption_by_period = get_consumption_by_period(period_option)
+    # Consumption by period within the window, loaded with the other queries
+    # unless the selection was not in the session state yet
+    consumption_by_period = data["consumption_by_period"]
+    if (selected_period, selected_window) != (period_option, window_option):
+        period_option = selected_period
+        consumption_by_period = get_consumption_by_period(
+            period_option, since=window_since(selected_window)
+        )
 
     # Display results based on selected period
     if consumption_by_period:
@@ -1,22 +1,31 @@
+import argparse
 import paho.mqtt.client as mqtt
 import json
 import random
 import time
 from datetime import datetime
-from database import save_event
+from ctwp.database import EVENT_WRITER, save_event
 
 BROKER = "test.mosquitto.org"
 TOPIC = "home/events"
 CONNECTED = False
 PORT = 1883
+DEVICE_IDS = (1, 2, 3, 4, 5)
+EVENT_TYPES = ("state-change", "sensor-reading", "energy-consumption")
 
 
-def generate_random_event():
-    device_id = random.randint(1, 5)
-    event_type = random.choice(["state-change", "sensor-reading", "energy-consumption"])
-    timestamp = datetime.utcnow().strftime(
-        "%Y-%m-%dT%H:%M:%SZ"
-    )  # Timestamp in UTC format
+def generate_random_event(device_ids=DEVICE_IDS, event_weights=None, timestamp=None):
+    """Generate a random event for one of device_ids.
+
+    event_weights optionally weights EVENT_TYPES (uniform by default) and
+    timestamp overrides the current UTC time, e.g. for synthetic history.
+    """
+    device_id = random.choice(device_ids)
+    event_type = random.choices(EVENT_TYPES, weights=event_weights)[0]
+    if timestamp is None:
+        timestamp = datetime.utcnow().strftime(
+            "%Y-%m-%dT%H:%M:%SZ"
+        )  # Timestamp in UTC format
 
     if event_type == "state-change":
         return {
@@ -56,6 +65,14 @@ def on_connect(client, userdata, flags, rc):
 def main():
     global CONNECTED
 
+    parser = argparse.ArgumentParser(description="Simulate device events over MQTT.")
+    parser.add_argument(
+        "--publish-only",
+        action="store_true",
+        help="only publish the events, leaving storage to ctwp.subscriber",
+    )
+    args = parser.parse_args()
+
     # Initialize the MQTT client
     client = mqtt.Client()
     client.on_connect = on_connect
@@ -75,15 +92,14 @@ def main():
             client.publish(TOPIC, payload)
             print(f"Published: {payload}")
 
-            # Save event to database
-            save_event(
-                device_id=event["device_id"],
-                event_type=event["type"],
-                value=event.get("value"),
-                numeric_value=event.get("numeric_value"),
-            )
-
-            print("Event saved to database.")
+            # Queue event for the batched database writer
+            if not args.publish_only:
+                save_event(
+                    device_id=event["device_id"],
+                    event_type=event["type"],
+                    value=event.get("value"),
+                    numeric_value=event.get("numeric_value"),
+                )
 
             # Wait for 1 seconds before generating the next event
             time.sleep(1)
@@ -91,6 +107,8 @@ def main():
         print("Exiting...")
         client.loop_stop()
         client.disconnect()
+        EVENT_WRITER.close()
+        print(f"Event writer stats: {EVENT_WRITER.stats()}")
 
 
 if __name__ == "__main__":
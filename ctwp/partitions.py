@@ -0,0 +1,157 @@
+import os
+import re
+
+# Columns of device_event, in table order, shared by the monthly partitions
+EVENT_COLUMNS = "id, device_id, type, timestamp, value, numeric_value, type_code"
+PARTITION_SCHEMA = """
+CREATE TABLE IF NOT EXISTS {schema}.device_event (
+    id INTEGER PRIMARY KEY,
+    device_id INTEGER,
+    type VARCHAR(50) NOT NULL,
+    timestamp DATETIME,
+    value TEXT,
+    numeric_value REAL,
+    type_code INTEGER
+);
+CREATE INDEX IF NOT EXISTS {schema}.device_event_type_device_time
+ON device_event (type_code, device_id, timestamp, numeric_value);
+CREATE INDEX IF NOT EXISTS {schema}.device_event_type_time
+ON device_event (type_code, timestamp, device_id, numeric_value);
+"""
+PARTITION_FILE_PATTERN = re.compile(r"device_event_(\d{4}-\d{2})\.db")
+
+
+def partition_dir(db_path):
+    """Folder of the monthly partitions archived out of a database file."""
+    return os.path.splitext(db_path)[0] + "-partitions"
+
+
+def partition_path(db_path, month):
+    return os.path.join(partition_dir(db_path), f"device_event_{month}.db")
+
+
+def list_partitions(db_path):
+    """Return the archived months ("YYYY-MM") of a database, oldest first."""
+    directory = partition_dir(db_path)
+    if not os.path.isdir(directory):
+        return []
+    months = []
+    for file_name in os.listdir(directory):
+        match = PARTITION_FILE_PATTERN.fullmatch(file_name)
+        if match:
+            months.append(match.group(1))
+    return sorted(months)
+
+
+def overlapping_partitions(db_path, since=None, until=None):
+    """Return the archived months that intersect the [since, until) window.
+
+    since and until are timestamps in the device_event format; the other
+    partitions are pruned without being opened.
+    """
+    return [
+        month
+        for month in list_partitions(db_path)
+        if (since is None or month_start(next_month(month)) > since)
+        and (until is None or month_start(month) < until)
+    ]
+
+
+def month_start(month):
+    return f"{month}-01 00:00:00"
+
+
+def next_month(month):
+    return shift_month(month, 1)
+
+
+def shift_month(month, months):
+    year, month_number = (int(part) for part in month.split("-"))
+    index = year * 12 + month_number - 1 + months
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+
+def archive_month(connection, db_path, month):
+    """Move the events of a month from the hot table into its partition file.
+
+    Returns the number of archived events. The connection must not be in a
+    transaction. SQLite does not commit a transaction spanning an attached
+    database atomically in WAL mode, so the copy is committed to the partition
+    first and only then are the copied events deleted from the hot table.
+    Until that delete commits, readers see the month twice; if it never does,
+    remove_archived_events (run on startup) or archiving the month again
+    deletes the leftover events.
+    """
+    os.makedirs(partition_dir(db_path), exist_ok=True)
+    bounds = (month_start(month), month_start(next_month(month)))
+    connection.execute(
+        "ATTACH DATABASE ? AS partition_db;", (partition_path(db_path, month),)
+    )
+    try:
+        connection.executescript(PARTITION_SCHEMA.format(schema="partition_db"))
+        with connection:
+            connection.execute(
+                f"""
+                INSERT OR REPLACE INTO partition_db.device_event ({EVENT_COLUMNS})
+                SELECT {EVENT_COLUMNS}
+                FROM main.device_event
+                WHERE timestamp >= ? AND timestamp < ?;
+                """,
+                bounds,
+            )
+        with connection:
+            return delete_archived_events(connection, bounds)
+    finally:
+        connection.execute("DETACH DATABASE partition_db;")
+
+
+def delete_archived_events(connection, bounds):
+    """Delete the hot events within bounds already copied to partition_db.
+
+    Events of the month written after the copy stay in the hot table.
+    """
+    cursor = connection.execute(
+        """
+        DELETE FROM main.device_event
+        WHERE timestamp >= ? AND timestamp < ?
+            AND id IN (SELECT id FROM partition_db.device_event);
+        """,
+        bounds,
+    )
+    return cursor.rowcount
+
+
+def remove_archived_events(connection, db_path):
+    """Delete the hot events left behind by an interrupted archive_month.
+
+    Only the partitions of months still present in the hot table are opened.
+    Returns the number of events deleted.
+    """
+    (oldest,) = connection.execute(
+        "SELECT MIN(timestamp) FROM main.device_event;"
+    ).fetchone()
+    if oldest is None:
+        return 0
+    removed = 0
+    for month in overlapping_partitions(db_path, since=oldest):
+        connection.execute(
+            "ATTACH DATABASE ? AS partition_db;", (partition_path(db_path, month),)
+        )
+        try:
+            with connection:
+                removed += delete_archived_events(
+                    connection, (month_start(month), month_start(next_month(month)))
+                )
+        finally:
+            connection.execute("DETACH DATABASE partition_db;")
+    return removed
+
+
+def drop_partitions(db_path, before_month):
+    """Delete the partition files of the months before before_month."""
+    dropped = []
+    for month in list_partitions(db_path):
+        if month < before_month:
+            os.remove(partition_path(db_path, month))
+            dropped.append(month)
+    return dropped
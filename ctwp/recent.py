@@ -0,0 +1,210 @@
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+WINDOW_SECONDS = 15 * 60  # Span of the rolling queries by default
+CAPACITY = 128  # Events kept per device and type, the oldest overwritten first
+INITIAL_RINGS = 64  # Rows allocated up front, doubled when full
+INT32_MIN, INT32_MAX = np.iinfo(np.int32).min, np.iinfo(np.int32).max
+
+
+def epoch_seconds(timestamp):
+    """Seconds since the epoch of a UTC "YYYY-MM-DD HH:MM:SS" timestamp."""
+    return int(
+        datetime.fromisoformat(timestamp).replace(tzinfo=timezone.utc).timestamp()
+    )
+
+
+class EventRing:
+    """Row of a device's events of one type in the ring arrays, and its last."""
+
+    __slots__ = ("row", "head", "count", "last")
+
+    def __init__(self, row):
+        self.row = row
+        self.head = 0  # Next position written in the row
+        self.count = 0  # Events written so far, up to CAPACITY kept
+        self.last = None  # (timestamp, value, numeric_value) of the last event
+
+
+class RecentEvents:
+    """Bounded in-memory window of the recent events of every device.
+
+    The events of each device and type own a row of capacity slots in NumPy
+    arrays, overwritten round-robin, so frequent sensor readings never push
+    out the consumption events: the event time (int32 seconds from a base
+    time), the numeric value (float32, 0 when missing) and whether it had
+    one. Memory stays at rings x capacity x 9 bytes however many events
+    arrive. The rolling sums and means of every device are computed at once
+    over the arrays; truncated() tells the devices whose window held more
+    events than their ring. Rows are added with add_rows(), skipping ids
+    already added.
+    """
+
+    def __init__(self, capacity=CAPACITY, initial_rings=INITIAL_RINGS):
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._rings = {}
+        self._base = int(time.time())
+        self._allocate(initial_rings)
+        self._skipped = 0
+        self.last_id = None
+
+    def clear(self):
+        with self._lock:
+            self._rings = {}
+            self._allocate(len(self._device_ids))
+            self._skipped = 0
+            self.last_id = None
+
+    def add_rows(self, rows):
+        """Add (id, device_id, type_code, timestamp, value, numeric_value) rows.
+
+        Rows must come in id order; those up to last_id are skipped, so the
+        same rows can be offered twice. Events too far from the base time for
+        the int32 offsets (about 68 years) are skipped as well.
+        """
+        with self._lock:
+            for event_id, device_id, type_code, timestamp, value, numeric in rows:
+                if self.last_id is not None and event_id <= self.last_id:
+                    continue
+                self.last_id = event_id
+                if device_id is None:
+                    continue
+                offset = epoch_seconds(timestamp) - self._base
+                if not INT32_MIN < offset <= INT32_MAX:
+                    self._skipped += 1
+                    continue
+                ring = self._rings.get((device_id, type_code))
+                if ring is None:
+                    ring = self._add_ring(device_id, type_code)
+                position = ring.row, ring.head
+                self._times[position] = offset
+                self._values[position] = numeric or 0.0
+                self._valued[position] = numeric is not None
+                ring.head = (ring.head + 1) % self.capacity
+                ring.count += 1
+                ring.last = (timestamp, value, numeric)
+
+    def rolling(self, type_code, seconds=WINDOW_SECONDS, now=None):
+        """Return {device_id: (events, sum, mean)} of one type over the window.
+
+        Only the devices with events of the type in the last seconds (before
+        now, by default the current time) are returned; events without a
+        numeric value are counted but left out of the mean.
+        """
+        with self._lock:
+            rows = self._type_rows(type_code)
+            in_window = self._in_window(rows, seconds, now)
+            counts = np.count_nonzero(in_window, axis=1)
+            sums = np.einsum("ij,ij->i", in_window, self._values[rows])
+            valued = np.count_nonzero(in_window & self._valued[rows], axis=1)
+            device_ids = self._device_ids[rows]
+        active = np.flatnonzero(counts)
+        means = sums[active] / np.maximum(valued[active], 1)
+        return dict(
+            zip(
+                device_ids[active].tolist(),
+                zip(
+                    counts[active].tolist(),
+                    sums[active].astype(float).tolist(),
+                    means.astype(float).tolist(),
+                ),
+            )
+        )
+
+    def truncated(self, type_code, seconds=WINDOW_SECONDS, now=None):
+        """Return the devices whose events of a type overflowed their ring.
+
+        Their ring is full of events within the window, so older events of
+        the window were overwritten and their rolling figures fall short.
+        """
+        with self._lock:
+            rows = self._type_rows(type_code)
+            full = np.all(self._in_window(rows, seconds, now), axis=1)
+            return set(self._device_ids[rows][full].tolist())
+
+    def device_window(self, device_id, type_code, seconds=WINDOW_SECONDS, now=None):
+        """Return (events, sum, mean) of one type of one device over the window."""
+        with self._lock:
+            ring = self._rings.get((device_id, type_code))
+            if ring is None:
+                return 0, 0.0, 0.0
+            in_window = self._in_window(ring.row, seconds, now)
+            count = int(np.count_nonzero(in_window))
+            total = float(self._values[ring.row] @ in_window)
+            valued = int(np.count_nonzero(in_window & self._valued[ring.row]))
+        return count, total, total / max(valued, 1)
+
+    def window_total(self, type_code, seconds=WINDOW_SECONDS, now=None):
+        """Return (events, sum) of one type over the window, for every device."""
+        with self._lock:
+            rows = self._type_rows(type_code)
+            in_window = self._in_window(rows, seconds, now)
+            total = float(np.einsum("ij,ij->", in_window, self._values[rows]))
+            return int(np.count_nonzero(in_window)), total
+
+    def last_event(self, device_id, type_code):
+        """Return (timestamp, value, numeric_value) of a device's last event."""
+        with self._lock:
+            ring = self._rings.get((device_id, type_code))
+            return ring.last if ring else None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "rings": len(self._rings),
+                "devices": len({device_id for device_id, _ in self._rings}),
+                "capacity": self.capacity,
+                "last_event_id": self.last_id,
+                "skipped_events": self._skipped,
+                "memory_bytes": sum(
+                    array.nbytes
+                    for array in (
+                        self._times,
+                        self._values,
+                        self._valued,
+                        self._types,
+                        self._device_ids,
+                    )
+                ),
+            }
+
+    def _allocate(self, rows):
+        # Empty slots are older than any window
+        self._times = np.full((rows, self.capacity), INT32_MIN, dtype=np.int32)
+        self._values = np.zeros((rows, self.capacity), dtype=np.float32)
+        self._valued = np.zeros((rows, self.capacity), dtype=bool)
+        self._types = np.full(rows, -1, dtype=np.int8)
+        self._device_ids = np.full(rows, -1, dtype=np.int64)
+
+    def _type_rows(self, type_code):
+        return np.flatnonzero(self._types[: len(self._rings)] == type_code)
+
+    def _in_window(self, rows, seconds, now):
+        cutoff = int((time.time() if now is None else now) - seconds) - self._base
+        return self._times[rows] >= cutoff
+
+    def _add_ring(self, device_id, type_code):
+        row = len(self._rings)
+        if row == len(self._device_ids):
+            # Double the rows, keeping the events of the known rings
+            times, values, valued, types, device_ids = (
+                self._times,
+                self._values,
+                self._valued,
+                self._types,
+                self._device_ids,
+            )
+            self._allocate(2 * row)
+            self._times[:row] = times
+            self._values[:row] = values
+            self._valued[:row] = valued
+            self._types[:row] = types
+            self._device_ids[:row] = device_ids
+        self._types[row] = type_code
+        self._device_ids[row] = device_id
+        ring = self._rings[device_id, type_code] = EventRing(row)
+        return ring
@@ -0,0 +1,47 @@
+"""Verify the running consumption counters against the raw event log.
+
+Usage (from the project root):
+    python -m ctwp.reconcile [--repair]
+
+Exits with status 1 when a counter drifted from the event log and was not
+repaired, so it can run as a scheduled job.
+"""
+
+import argparse
+import sys
+
+from ctwp.database import EVENT_WRITER, reconcile_running_totals
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Reconcile the CTWP running totals with the event log."
+    )
+    parser.add_argument(
+        "--repair",
+        action="store_true",
+        help="rebuild the counters from the event log when they drifted",
+    )
+    args = parser.parse_args()
+
+    EVENT_WRITER.flush()
+    mismatches = reconcile_running_totals(repair=args.repair)
+    for mismatch in mismatches:
+        print(
+            f"{mismatch['scope']} {mismatch['scope_id']}: "
+            f"consumption {mismatch['consumption']} "
+            f"(expected {mismatch['expected_consumption']}), "
+            f"events {mismatch['event_count']} "
+            f"(expected {mismatch['expected_event_count']})"
+        )
+    if not mismatches:
+        print("Running totals match the event log.")
+    elif args.repair:
+        print(f"Repaired {len(mismatches)} running totals.")
+    else:
+        print(f"{len(mismatches)} running totals differ from the event log.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
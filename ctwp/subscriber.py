@@ -0,0 +1,295 @@
+import argparse
+import json
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import paho.mqtt.client as mqtt
+
+from ctwp.database import EVENT_WRITER, save_event
+from ctwp.mqtt import BROKER, EVENT_TYPES, PORT, TOPIC
+
+MAX_QUEUE_SIZE = 10000  # Payloads waiting for decoding before new ones are dropped
+WORKERS = 2
+STATS_INTERVAL = 10  # Seconds between stats reports of the command line service
+
+
+def decode_event(payload):
+    """Decode and validate a JSON event payload published on TOPIC.
+
+    Returns the save_event keyword arguments, or raises ValueError.
+    """
+    try:
+        event = json.loads(payload)
+    except (TypeError, UnicodeDecodeError, json.JSONDecodeError) as error:
+        raise ValueError(f"invalid JSON: {error}") from error
+    if not isinstance(event, dict):
+        raise ValueError("payload is not a JSON object")
+
+    device_id = event.get("device_id")
+    if isinstance(device_id, bool) or not isinstance(device_id, int):
+        raise ValueError(f"invalid device_id: {device_id!r}")
+
+    event_type = event.get("type")
+    if event_type not in EVENT_TYPES:
+        raise ValueError(f"invalid type: {event_type!r}")
+
+    value = event.get("value")
+    if value is not None and not isinstance(value, str):
+        raise ValueError(f"invalid value: {value!r}")
+
+    numeric_value = event.get("numeric_value")
+    if numeric_value is not None and (
+        isinstance(numeric_value, bool) or not isinstance(numeric_value, (int, float))
+    ):
+        raise ValueError(f"invalid numeric_value: {numeric_value!r}")
+    if event_type == "energy-consumption" and numeric_value is None:
+        raise ValueError("energy-consumption events need a numeric_value")
+
+    timestamp = event.get("timestamp")
+    if timestamp is not None:
+        try:
+            parsed = datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+        except (AttributeError, ValueError) as error:
+            raise ValueError(f"invalid timestamp: {timestamp!r}") from error
+        if parsed.tzinfo is not None:
+            parsed = parsed.astimezone(timezone.utc)
+        # Stored in the same format as SQLite's CURRENT_TIMESTAMP
+        timestamp = parsed.strftime("%Y-%m-%d %H:%M:%S")
+
+    return {
+        "device_id": device_id,
+        "event_type": event_type,
+        "value": value,
+        "numeric_value": numeric_value,
+        "timestamp": timestamp,
+    }
+
+
+class IngestPipeline:
+    """Receive, validate and decode event payloads, then hand them to the writer.
+
+    on_payload() only enqueues, so it is safe to call from the MQTT network
+    thread; when the bounded queue is full the payload is dropped and counted.
+    Worker threads decode the payloads and call sink(**event), which defaults
+    to save_event (the batched EventWriter).
+    """
+
+    def __init__(self, sink=save_event, max_queue_size=MAX_QUEUE_SIZE, workers=WORKERS):
+        self.sink = sink
+        self.workers = workers
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._lock = threading.Lock()
+        self._threads = []
+        self._received = 0
+        self._accepted = 0
+        self._invalid = 0
+        self._dropped = 0
+        self._failed = 0
+        self._lag_seconds = 0.0
+        self._max_lag_seconds = 0.0
+        self._last_error = None
+
+    def start(self):
+        for index in range(self.workers):
+            thread = threading.Thread(
+                target=self._run, name=f"ingest-worker-{index}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        """Process the queued payloads and stop the workers."""
+        self._queue.join()
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def on_payload(self, payload):
+        with self._lock:
+            self._received += 1
+        try:
+            self._queue.put_nowait((time.time(), payload))
+        except queue.Full:
+            with self._lock:
+                self._dropped += 1
+
+    def on_message(self, client, userdata, message):
+        """paho-mqtt on_message callback (callback API version 2)."""
+        self.on_payload(message.payload)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                self._process(*item)
+            finally:
+                self._queue.task_done()
+
+    def _process(self, received_at, payload):
+        try:
+            event = decode_event(payload)
+        except ValueError as error:
+            with self._lock:
+                self._invalid += 1
+                self._last_error = str(error)
+            return
+
+        try:
+            self.sink(**event)
+        except Exception as error:
+            with self._lock:
+                self._failed += 1
+                self._last_error = str(error)
+            return
+
+        lag = time.time() - received_at
+        with self._lock:
+            self._accepted += 1
+            self._lag_seconds += lag
+            self._max_lag_seconds = max(self._max_lag_seconds, lag)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "received": self._received,
+                "accepted": self._accepted,
+                "invalid": self._invalid,
+                "dropped": self._dropped,
+                "failed": self._failed,
+                "queued": self._queue.qsize(),
+                "avg_lag_seconds": (
+                    round(self._lag_seconds / self._accepted, 3)
+                    if self._accepted
+                    else 0.0
+                ),
+                "max_lag_seconds": round(self._max_lag_seconds, 3),
+                "last_error": self._last_error,
+            }
+
+
+class InProcessBroker:
+    """In-process stand-in for an MQTT broker, for tests and local runs.
+
+    client() returns objects with the subset of the paho-mqtt Client API used
+    here (callback API version 2); messages are delivered synchronously to the
+    clients subscribed to the exact topic.
+    """
+
+    def __init__(self):
+        self._subscriptions = {}
+        self._lock = threading.Lock()
+
+    def client(self):
+        return InProcessClient(self)
+
+    def subscribe(self, client, topic):
+        with self._lock:
+            self._subscriptions.setdefault(topic, []).append(client)
+
+    def unsubscribe(self, client):
+        with self._lock:
+            for clients in self._subscriptions.values():
+                if client in clients:
+                    clients.remove(client)
+
+    def publish(self, topic, payload):
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        with self._lock:
+            clients = list(self._subscriptions.get(topic, []))
+        message = SimpleNamespace(topic=topic, payload=payload, qos=0, retain=False)
+        for client in clients:
+            if client.on_message is not None:
+                client.on_message(client, None, message)
+
+
+class InProcessClient:
+    def __init__(self, broker):
+        self.broker = broker
+        self.on_connect = None
+        self.on_message = None
+
+    def connect(self, host=None, port=None, keepalive=60):
+        if self.on_connect is not None:
+            self.on_connect(self, None, {}, 0, None)
+        return 0
+
+    def subscribe(self, topic, qos=0):
+        self.broker.subscribe(self, topic)
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        self.broker.publish(topic, payload)
+
+    def loop_start(self):
+        pass
+
+    def loop_stop(self):
+        pass
+
+    def disconnect(self):
+        self.broker.unsubscribe(self)
+
+
+class MqttSubscriber:
+    """Subscribe to TOPIC and feed the received payloads to an IngestPipeline."""
+
+    def __init__(self, pipeline, client=None, broker=BROKER, port=PORT, topic=TOPIC):
+        self.pipeline = pipeline
+        self.client = client or mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+        self.broker = broker
+        self.port = port
+        self.topic = topic
+        self.client.on_connect = self.on_connect
+        self.client.on_message = pipeline.on_message
+
+    def on_connect(self, client, userdata, flags, reason_code, properties):
+        if reason_code == 0:
+            print(f"Subscribed to {self.topic} on MQTT Broker: {self.broker}")
+            client.subscribe(self.topic)
+        else:
+            print(f"Failed to connect, return code {reason_code}")
+
+    def start(self):
+        self.pipeline.start()
+        self.client.connect(self.broker, self.port)
+        self.client.loop_start()
+
+    def stop(self):
+        self.client.loop_stop()
+        self.client.disconnect()
+        self.pipeline.stop()
+        EVENT_WRITER.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Consume device events from MQTT into the CTWP database."
+    )
+    parser.add_argument("--broker", default=BROKER)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--topic", default=TOPIC)
+    args = parser.parse_args()
+
+    subscriber = MqttSubscriber(
+        IngestPipeline(), broker=args.broker, port=args.port, topic=args.topic
+    )
+    subscriber.start()
+    try:
+        while True:
+            time.sleep(STATS_INTERVAL)
+            print(f"Ingest: {subscriber.pipeline.stats()}")
+            print(f"Writer: {EVENT_WRITER.stats()}")
+    except KeyboardInterrupt:
+        print("Exiting...")
+        subscriber.stop()
+
+
+if __name__ == "__main__":
+    main()
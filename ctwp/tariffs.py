@@ -0,0 +1,394 @@
+"""Time-of-use tariffs and the cost of the consumption buckets.
+
+The rate of an hour is set by the tariff in force at that local time: the
+rate of the tariff window covering the hour, on the window's weekdays and
+outside of holidays, or else the base (off-peak) rate, plus the surcharge of
+the month's bandeira tarifária (see migrations/004_tariffs.sql).
+
+The definitions are expanded once per tariff version into tariff_interval,
+an index of UTC intervals with a constant rate. Costs are then computed by
+joining each interval with the range of hourly buckets it covers, so the
+tariff rules are never evaluated per row. The costs of past months are kept
+in tariff_cost for the tariff version they were computed with.
+"""
+
+from datetime import datetime, timedelta, timezone
+
+from ctwp.partitions import month_start, next_month
+
+UTC_OFFSET_HOURS = -3  # Local time of the tariff windows, flags and holidays
+OFF_PEAK = "off-peak"
+# Surcharges of the bandeiras tarifárias in R$/kWh, the defaults of set_flag
+FLAG_SURCHARGES = {
+    "verde": 0.0,
+    "amarela": 0.01885,
+    "vermelha-1": 0.04463,
+    "vermelha-2": 0.07877,
+}
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+# Cost of the hourly buckets overlapping a window: each interval of the index
+# reads the range of buckets it covers through the primary key (CROSS JOIN
+# keeps the intervals in the outer loop)
+HOURLY_COST_QUERY = """
+SELECT b.scope_id, SUM(b.consumption), SUM(b.consumption * i.rate)
+FROM tariff_interval i
+CROSS JOIN consumption_bucket b
+WHERE i.start < ? AND i.end > ?
+    AND b.resolution = 'hourly' AND b.scope = ?
+    AND b.bucket >= substr(i.start, 1, 13) AND b.bucket < substr(i.end, 1, 13)
+    AND b.bucket_start < ? AND b.bucket_end > ?
+GROUP BY b.scope_id
+"""
+SCOPES = ("device", "zone")
+
+
+def tariff_version(connection):
+    (version,) = connection.execute("SELECT version FROM tariff_revision;").fetchone()
+    return version
+
+
+def load_definitions(connection):
+    """Return the tariffs with their windows, the flags and the holidays."""
+    tariffs = [
+        {
+            "id": row[0],
+            "valid_from": row[1],
+            "valid_until": row[2],
+            "base_rate": row[3],
+            "windows": [],
+        }
+        for row in connection.execute("""
+            SELECT id, valid_from, valid_until, base_rate
+            FROM tariff
+            ORDER BY valid_from DESC, id DESC;
+            """)
+    ]
+    by_id = {tariff["id"]: tariff for tariff in tariffs}
+    for tariff_id, period, weekdays, start_hour, end_hour, rate in connection.execute(
+        """
+        SELECT tariff_id, period, weekdays, start_hour, end_hour, rate
+        FROM tariff_window
+        ORDER BY id;
+        """
+    ):
+        if tariff_id in by_id:
+            by_id[tariff_id]["windows"].append(
+                (period, weekdays, start_hour, end_hour, rate)
+            )
+    flags = {
+        month: (flag, surcharge)
+        for month, flag, surcharge in connection.execute(
+            "SELECT month, flag, surcharge FROM tariff_flag;"
+        )
+    }
+    holidays = {
+        row[0] for row in connection.execute("SELECT date FROM tariff_holiday;")
+    }
+    return {"tariffs": tariffs, "flags": flags, "holidays": holidays}
+
+
+def hour_rate(definitions, hour):
+    """Return (rate, period, tariff_id, flag) of the UTC hour starting at hour.
+
+    The rate is None when no tariff was in force.
+    """
+    local = hour + timedelta(hours=UTC_OFFSET_HOURS)
+    local_time = local.strftime(TIMESTAMP_FORMAT)
+    flag, surcharge = definitions["flags"].get(local_time[:7], (None, 0.0))
+    for tariff in definitions["tariffs"]:
+        if tariff["valid_from"] <= local_time and (
+            tariff["valid_until"] is None or local_time < tariff["valid_until"]
+        ):
+            break
+    else:
+        return None, OFF_PEAK, None, flag
+
+    period, rate = OFF_PEAK, tariff["base_rate"]
+    if local_time[:10] not in definitions["holidays"]:
+        weekday = str(local.isoweekday())
+        for window_period, weekdays, start_hour, end_hour, window_rate in tariff[
+            "windows"
+        ]:
+            if weekday in weekdays and start_hour <= local.hour < end_hour:
+                period, rate = window_period, window_rate
+                break
+    return rate + surcharge, period, tariff["id"], flag
+
+
+def parse_timestamp(timestamp):
+    return datetime.strptime(timestamp, TIMESTAMP_FORMAT)
+
+
+def build_intervals(definitions, start, end):
+    """Expand the definitions over [start, end) into intervals of constant rate.
+
+    start and end are UTC timestamps on the hour. Consecutive hours with the
+    same rate, period, tariff and flag are merged; hours without a tariff in
+    force are left out, so their consumption is not costed.
+    """
+    intervals = []
+    hour, end = parse_timestamp(start), parse_timestamp(end)
+    while hour < end:
+        rate, *details = hour_rate(definitions, hour)
+        following = hour + timedelta(hours=1)
+        if rate is not None:
+            if (
+                intervals
+                and intervals[-1][1] == hour
+                and intervals[-1][2:] == [rate, *details]
+            ):
+                intervals[-1][1] = following
+            else:
+                intervals.append([hour, following, rate, *details])
+        hour = following
+    return [
+        (
+            interval_start.strftime(TIMESTAMP_FORMAT),
+            interval_end.strftime(TIMESTAMP_FORMAT),
+            *details,
+        )
+        for interval_start, interval_end, *details in intervals
+    ]
+
+
+def ensure_interval_index(connection, start, end):
+    """Build tariff_interval over at least [start, end) for the current version.
+
+    The span is widened to whole months, and to the span already indexed while
+    the version is unchanged. The connection must not be in a transaction.
+    """
+    start = month_start(start[:7])
+    if end != month_start(end[:7]):
+        end = month_start(next_month(end[:7]))
+    version, indexed_version, indexed_from, indexed_until = connection.execute("""
+        SELECT version, indexed_version, indexed_from, indexed_until
+        FROM tariff_revision;
+        """).fetchone()
+    if version == indexed_version:
+        if indexed_from <= start and end <= indexed_until:
+            return
+        start, end = min(start, indexed_from), max(end, indexed_until)
+
+    intervals = build_intervals(load_definitions(connection), start, end)
+    connection.execute("BEGIN IMMEDIATE;")
+    with connection:
+        connection.execute("DELETE FROM tariff_interval;")
+        connection.executemany(
+            """
+            INSERT INTO tariff_interval (start, end, rate, period, tariff_id, flag)
+            VALUES (?, ?, ?, ?, ?, ?);
+            """,
+            intervals,
+        )
+        connection.execute(
+            """
+            UPDATE tariff_revision
+            SET indexed_version = ?, indexed_from = ?, indexed_until = ?;
+            """,
+            (version, start, end),
+        )
+
+
+def has_hourly_buckets(connection, start, end):
+    row = connection.execute(
+        """
+        SELECT 1
+        FROM consumption_bucket
+        WHERE resolution = 'hourly' AND scope = 'device'
+            AND bucket >= substr(?, 1, 13) AND bucket < substr(?, 1, 13)
+        LIMIT 1;
+        """,
+        (start, end),
+    ).fetchone()
+    return row is not None
+
+
+def hourly_costs(connection, scope, start, end):
+    """Return (scope_id, consumption, cost) rows of the hourly buckets in a window."""
+    ensure_interval_index(connection, start, end)
+    return connection.execute(
+        HOURLY_COST_QUERY, (end, start, scope, end, start)
+    ).fetchall()
+
+
+def daily_costs(connection, scope, start, end):
+    """Costs of the daily buckets in a window, at the mean rate of each day.
+
+    Used for the months whose hourly buckets were pruned by the retention.
+    """
+    definitions = load_definitions(connection)
+    rates = {}
+    totals = {}
+    rows = connection.execute(
+        """
+        SELECT scope_id, bucket_start, consumption
+        FROM consumption_bucket
+        WHERE resolution = 'daily' AND scope = ?
+            AND bucket_start < ? AND bucket_end > ?;
+        """,
+        (scope, end, start),
+    )
+    for scope_id, day, consumption in rows:
+        if day not in rates:
+            hour = parse_timestamp(day)
+            day_rates = [
+                hour_rate(definitions, hour + timedelta(hours=offset))[0] or 0.0
+                for offset in range(24)
+            ]
+            rates[day] = sum(day_rates) / 24
+        consumption = consumption or 0.0
+        current = totals.get(scope_id, (0.0, 0.0))
+        totals[scope_id] = (
+            current[0] + consumption,
+            current[1] + consumption * rates[day],
+        )
+    return [(scope_id, *values) for scope_id, values in totals.items()]
+
+
+def window_costs(connection, scope, start, end):
+    """Costs within one month, from the hourly buckets or else the daily ones."""
+    if has_hourly_buckets(connection, start, end):
+        return hourly_costs(connection, scope, start, end)
+    return daily_costs(connection, scope, start, end)
+
+
+def invalidate_months(connection, type_code, after_id, up_to_id):
+    """Drop the cached costs of the months of the events in (after_id, up_to_id]."""
+    connection.execute(
+        """
+        DELETE FROM tariff_cost_month
+        WHERE month >= (
+            SELECT substr(MIN(timestamp), 1, 7)
+            FROM main.device_event
+            WHERE id > ? AND id <= ? AND type_code = ?
+        );
+        """,
+        (after_id, up_to_id, type_code),
+    )
+
+
+def materialize_months(connection, months):
+    """Compute and store the costs of the months not cached for this version.
+
+    The connection must not be in a transaction.
+    """
+    version = tariff_version(connection)
+    cached = {
+        row[0]
+        for row in connection.execute(
+            "SELECT month FROM tariff_cost_month WHERE tariff_version = ?;",
+            (version,),
+        )
+    }
+    for month in sorted(set(months) - cached):
+        start, end = month_start(month), month_start(next_month(month))
+        if has_hourly_buckets(connection, start, end):
+            resolution, costs = "hourly", hourly_costs
+        else:
+            resolution, costs = "daily", daily_costs
+        rows = [
+            (month, scope, *row)
+            for scope in SCOPES
+            for row in costs(connection, scope, start, end)
+        ]
+        connection.execute("BEGIN IMMEDIATE;")
+        with connection:
+            connection.execute("DELETE FROM tariff_cost WHERE month = ?;", (month,))
+            connection.executemany(
+                """
+                INSERT INTO tariff_cost (month, scope, scope_id, consumption, cost)
+                VALUES (?, ?, ?, ?, ?);
+                """,
+                rows,
+            )
+            connection.execute(
+                """
+                INSERT OR REPLACE INTO tariff_cost_month (
+                    month, tariff_version, resolution
+                )
+                VALUES (?, ?, ?);
+                """,
+                (month, version, resolution),
+            )
+
+
+def scope_costs(connection, scope, since=None, until=None):
+    """Return {scope_id: cost} of a scope over the [since, until) window.
+
+    Past months wholly inside the window are read from tariff_cost, computed
+    first if not cached for the current tariff version; the current month and
+    the months at the edges of the window are costed from their buckets, the
+    buckets overlapping the window being counted whole.
+    """
+    since = since or "0000-01-01 00:00:00"
+    until = until or "9999-12-31 23:59:59"
+    months = [
+        row[0]
+        for row in connection.execute(
+            """
+            SELECT DISTINCT bucket
+            FROM consumption_bucket
+            WHERE resolution = 'monthly' AND scope = ?
+                AND bucket_end > ? AND bucket_start < ?;
+            """,
+            (scope, since, until),
+        )
+    ]
+    current_month = datetime.now(timezone.utc).strftime("%Y-%m")
+    whole_months = [
+        month
+        for month in months
+        if month < current_month
+        and since <= month_start(month)
+        and month_start(next_month(month)) <= until
+    ]
+    if months:
+        # Index the whole span at once rather than widening it month by month
+        ensure_interval_index(
+            connection, month_start(min(months)), month_start(next_month(max(months)))
+        )
+    materialize_months(connection, whole_months)
+
+    costs = {}
+    if whole_months:
+        placeholders = ", ".join("?" * len(whole_months))
+        costs.update(
+            connection.execute(
+                f"""
+                SELECT scope_id, SUM(cost)
+                FROM tariff_cost
+                WHERE scope = ? AND month IN ({placeholders})
+                GROUP BY scope_id;
+                """,
+                (scope, *whole_months),
+            )
+        )
+    for month in sorted(set(months) - set(whole_months)):
+        start = max(since, month_start(month))
+        end = min(until, month_start(next_month(month)))
+        for scope_id, _, cost in window_costs(connection, scope, start, end):
+            costs[scope_id] = costs.get(scope_id, 0.0) + (cost or 0.0)
+    return costs
+
+
+def current_rate(connection, now=None):
+    """Return (rate, period, flag) in force at now (UTC, default the current time)."""
+    now = now or datetime.now(timezone.utc).replace(tzinfo=None)
+    hour = now.replace(minute=0, second=0, microsecond=0)
+    rate, period, _, flag = hour_rate(load_definitions(connection), hour)
+    return rate, period, flag
+
+
+def set_flag(connection, month, flag, surcharge=None):
+    """Set the bandeira tarifária of a local month ("YYYY-MM").
+
+    The surcharge defaults to FLAG_SURCHARGES; the costs of the month are
+    recomputed on their next read, as the tariff version changes.
+    """
+    if surcharge is None:
+        surcharge = FLAG_SURCHARGES[flag]
+    with connection:
+        connection.execute(
+            "INSERT OR REPLACE INTO tariff_flag (month, flag, surcharge) VALUES (?, ?, ?);",
+            (month, flag, surcharge),
+        )
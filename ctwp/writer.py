@@ -0,0 +1,218 @@
+import atexit
+import queue
+import threading
+import time
+from collections import deque
+
+BATCH_SIZE = 500  # Events written per transaction at most
+FLUSH_INTERVAL = 0.5  # Seconds an event may wait for its batch to fill up
+MAX_PENDING = 20000  # Queued events before submit() blocks the producers
+SUBMIT_TIMEOUT = 5.0  # Seconds submit() blocks on a full queue before failing
+WRITE_ATTEMPTS = 4  # Tries of a batch before its events are dropped
+RETRY_BACKOFF = 0.5  # Seconds before the first retry, doubled after each
+LATENCY_SAMPLES = 2000
+
+
+class EventWriter:
+    """Buffered writer that persists events in batched transactions.
+
+    Any thread can submit() events; a background thread groups them and calls
+    write_batch(connection, events) once per batch, when BATCH_SIZE events are
+    pending or FLUSH_INTERVAL elapsed. When MAX_PENDING events are queued,
+    submit() blocks (backpressure) and raises queue.Full after the timeout.
+    A failed batch, e.g. on a busy database, is retried with exponential
+    backoff up to write_attempts times before its events are dropped.
+    on_written(events), when given, is called after each committed batch.
+    Pending events are flushed when the interpreter exits.
+    """
+
+    def __init__(
+        self,
+        connect,
+        write_batch,
+        batch_size=BATCH_SIZE,
+        flush_interval=FLUSH_INTERVAL,
+        max_pending=MAX_PENDING,
+        submit_timeout=SUBMIT_TIMEOUT,
+        write_attempts=WRITE_ATTEMPTS,
+        retry_backoff=RETRY_BACKOFF,
+        on_written=None,
+    ):
+        self.connect = connect
+        self.write_batch = write_batch
+        self.on_written = on_written
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.submit_timeout = submit_timeout
+        self.write_attempts = write_attempts
+        self.retry_backoff = retry_backoff
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._lock = threading.Lock()
+        self._flush_requested = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._started_at = None
+        self._submitted = 0
+        self._written = 0
+        self._failed = 0
+        self._retries = 0
+        self._batches = 0
+        self._blocked = 0
+        self._write_seconds = 0.0
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._started_at = time.perf_counter()
+            self._thread = threading.Thread(
+                target=self._run, name="event-writer", daemon=True
+            )
+            self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, event):
+        """Queue an event tuple for writing, blocking while the queue is full."""
+        if self._stopping.is_set():
+            raise RuntimeError("EventWriter is closed")
+        if self._thread is None:
+            self.start()
+        item = (time.perf_counter(), event)
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            with self._lock:
+                self._blocked += 1
+            self._flush_requested.set()
+            self._queue.put(item, timeout=self.submit_timeout)
+        with self._lock:
+            self._submitted += 1
+
+    def flush(self):
+        """Block until every event submitted so far has been written."""
+        if self._thread is None:
+            return
+        self._flush_requested.set()
+        self._queue.join()
+
+    def close(self):
+        """Flush the pending events and stop the background thread."""
+        if self._thread is None or self._stopping.is_set():
+            return
+        self.flush()
+        self._stopping.set()
+        self._flush_requested.set()
+        self._thread.join()
+
+    def _next_batch(self):
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.perf_counter() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.perf_counter()
+            if self._flush_requested.is_set():
+                remaining = 0
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not (self._stopping.is_set() and self._queue.empty()):
+            batch = self._next_batch()
+            if self._queue.empty():
+                self._flush_requested.clear()
+            if batch:
+                self._write(batch)
+
+    def _write(self, batch):
+        events = [event for _, event in batch]
+        try:
+            for attempt in range(1, self.write_attempts + 1):
+                started_at = time.perf_counter()
+                try:
+                    self._write_once(events)
+                    break
+                except Exception as error:
+                    if attempt == self.write_attempts:
+                        with self._lock:
+                            self._failed += len(batch)
+                        print(
+                            f"Failed to write {len(batch)} events "
+                            f"after {attempt} attempts: {error}"
+                        )
+                        return
+                    with self._lock:
+                        self._retries += 1
+                    print(f"Retrying a batch of {len(batch)} events: {error}")
+                    time.sleep(self.retry_backoff * 2 ** (attempt - 1))
+
+            finished_at = time.perf_counter()
+            with self._lock:
+                self._written += len(batch)
+                self._batches += 1
+                self._write_seconds += finished_at - started_at
+                self._latencies.extend(
+                    finished_at - submitted_at for submitted_at, _ in batch
+                )
+            if self.on_written is not None:
+                # A failing callback must not stop the thread, or flush() hangs
+                try:
+                    self.on_written(events)
+                except Exception as error:
+                    print(f"Failed to notify a written batch: {error}")
+        finally:
+            for _ in batch:
+                self._queue.task_done()
+
+    def _write_once(self, events):
+        # A connection closed without a commit rolls the batch back
+        connection = self.connect()
+        try:
+            self.write_batch(connection, events)
+            connection.commit()
+        finally:
+            connection.close()
+
+    def stats(self):
+        """Return throughput and latency counters of the writer."""
+        with self._lock:
+            elapsed = time.perf_counter() - self._started_at if self._started_at else 0
+            latencies = sorted(self._latencies)
+            return {
+                "submitted": self._submitted,
+                "written": self._written,
+                "failed": self._failed,
+                "retries": self._retries,
+                "pending": self._queue.qsize(),
+                "batches": self._batches,
+                "blocked_submits": self._blocked,
+                "avg_batch_size": (
+                    round(self._written / self._batches, 1) if self._batches else 0
+                ),
+                "events_per_second": (
+                    round(self._written / elapsed, 1) if elapsed else 0
+                ),
+                "write_events_per_second": (
+                    round(self._written / self._write_seconds, 1)
+                    if self._write_seconds
+                    else 0
+                ),
+                "latency_p50_ms": _percentile_ms(latencies, 0.50),
+                "latency_p95_ms": _percentile_ms(latencies, 0.95),
+                "latency_max_ms": _percentile_ms(latencies, 1.0),
+            }
+
+
+def _percentile_ms(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(int(len(sorted_values) * fraction), len(sorted_values) - 1)
+    return round(sorted_values[index] * 1000, 3)
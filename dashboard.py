@@ -1,16 +1,59 @@
+import importlib
+import sys
+import time
+
 import streamlit as st
-import cds.main as cds
-import ctwp.main as ctwp
-import scr.main as scr
+from common.cache import get_cache_stats
+from common.instrumentation import get_query_stats, get_slow_queries
+from common.timings import get_timings, record_timing
+
+# Module of each dashboard section, imported the first time it is shown
+SECTIONS = {"CTWP": "ctwp.main", "CDS": "cds.main", "SCR": "scr.main"}
+# Only import and run the selected section; False renders every section in tabs
+LAZY_NAVIGATION = True
+# Show the per-query latency percentiles and the slow-query log in the sidebar
+SHOW_DIAGNOSTICS = True
+
+
+def render_section(section):
+    """Import a section's module if needed and run its dashboard, timing both."""
+    started_at = time.perf_counter()
+    cold = SECTIONS[section] not in sys.modules
+    module = importlib.import_module(SECTIONS[section])
+    imported_at = time.perf_counter()
+    module.dashboard()
+    record_timing(
+        section,
+        imported_at - started_at if cold else 0.0,
+        time.perf_counter() - imported_at,
+    )
+
 
 st.set_page_config(page_title="Global Solution")
-tab1, tab2, tab3 = st.tabs(["CTWP", "CDS", "SCR"])
 
-with tab1:
-    ctwp.dashboard()
+if LAZY_NAVIGATION:
+    selected_section = st.radio(
+        "Seção", list(SECTIONS), horizontal=True, label_visibility="collapsed"
+    )
+    render_section(selected_section)
+else:
+    for tab, section in zip(st.tabs(list(SECTIONS)), SECTIONS):
+        with tab:
+            render_section(section)
+
+# Hit/miss statistics of the query caches, after this run's queries
+with st.sidebar.expander("Cache de Consultas"):
+    st.dataframe(get_cache_stats(), use_container_width=True)
 
-with tab2:
-    cds.dashboard()
+# Cold-start and per-rerun timings of the sections rendered by this process
+with st.sidebar.expander("Tempos de Execução"):
+    st.dataframe(get_timings(), use_container_width=True)
 
-with tab3:
-    scr.dashboard()
+# Latency percentiles of the database getters and the slow queries, with plans
+if SHOW_DIAGNOSTICS:
+    with st.sidebar.expander("Diagnóstico"):
+        st.dataframe(get_query_stats(), use_container_width=True)
+        slow_queries = get_slow_queries()
+        st.caption(f"Consultas lentas: {len(slow_queries)}")
+        for slow_query in slow_queries:
+            st.json(slow_query, expanded=False)
@@ -9,136 +9,180 @@ options(repos = c(CRAN = "https://cran-r.c3sl.ufpr.br/"))
 # Configurar instalação paralela (usa múltiplos núcleos do processador)
 options(Ncpus = parallel::detectCores() - 1)
 
+# Pastas dos dados e dos resultados (configuráveis, ex.: pelo teste de
+# paridade em scr/parity.py)
+dir_dados <- Sys.getenv("SCR_DATA_DIR", "scr")
+dir_saida <- Sys.getenv("SCR_OUTPUT_DIR", "scr/outputs")
+
 # Criar pasta "outputs" se não existir
-if (!dir.exists("scr/outputs")) {
-  dir.create("scr/outputs")
+if (!dir.exists(dir_saida)) {
+  dir.create(dir_saida)
 }
 
-# Carregar pacotes necessários
-if (!require("ggplot2")) install.packages("ggplot2")
-if (!require("dplyr")) install.packages("dplyr")
-if (!require("tidyr")) install.packages("tidyr")
-if (!require("readr")) install.packages("readr")
-if (!require("corrplot")) install.packages("corrplot")
-if (!require("plotly")) install.packages("plotly")
+# Gráficos a gerar: os nomes passados na linha de comando (ex.: pelo executor
+# de jobs em scr/jobs.py, somente os desatualizados) ou todos
+todos_graficos <- c(
+  "investimento_total_por_empresa",
+  "matriz_de_correlacao",
+  "investimento_vs_economia_energia",
+  "frequencia_tipo_equipamento"
+)
+graficos <- commandArgs(trailingOnly = TRUE)
+if (length(graficos) == 0) {
+  graficos <- todos_graficos
+}
+graficos_empresa <- intersect(graficos, todos_graficos[1:3])
+
+# Informar ao executor de jobs que um gráfico foi salvo
+grafico_concluido <- function(nome) {
+  cat(sprintf("CHART_DONE %s\n", nome))
+  flush(stdout())
+}
 
-# Carregar pacotes
+# Instalar somente os pacotes ausentes e carregar os utilizados
+pacotes <- c("ggplot2", "dplyr", "corrplot")
+for (pacote in pacotes) {
+  if (!requireNamespace(pacote, quietly = TRUE)) install.packages(pacote)
+}
 library(ggplot2)
 library(dplyr)
-library(tidyr)
-library(readr)
 library(corrplot)
-library(plotly)
 
 # Importação e Limpeza dos Dados
-# Importar arquivos CSV
-empresa_data <- read.csv("scr/projetos-eficiencia-energetica-empresa.csv", sep = ";", encoding = "latin1", stringsAsFactors = FALSE)
-equipamento_data <- read.csv("scr/projetos-eficiencia-energetica-equipamento.csv", sep = ";", encoding = "latin1", stringsAsFactors = FALSE)
-uso_final_data <- read.csv("scr/projetos-eficiencia-energetica-uso-final.csv", sep = ";", encoding = "latin1", stringsAsFactors = FALSE)
-
-# Converter valores financeiros de string para numérico
-empresa_data$VlrCustoTotal <- as.numeric(gsub(",", ".", empresa_data$VlrCustoTotal))
-empresa_data$VlrEnergiaEconomizadaTotal <- as.numeric(gsub(",", ".", empresa_data$VlrEnergiaEconomizadaTotal))
-empresa_data$VlrRetiradaDemandaPontaTotal <- as.numeric(gsub(",", ".", empresa_data$VlrRetiradaDemandaPontaTotal))
-
-# Remover valores ausentes nas colunas principais
-empresa_data <- na.omit(empresa_data)
-
-# Resumo dos dados para garantir que foram limpos corretamente
-str(empresa_data)
-
-# Análise Exploratória dos Dados
-# Calcular medidas de tendência central e dispersão
-media_custo <- mean(empresa_data$VlrCustoTotal, na.rm = TRUE)
-mediana_custo <- median(empresa_data$VlrCustoTotal, na.rm = TRUE)
-variancia_custo <- var(empresa_data$VlrCustoTotal, na.rm = TRUE)
-desvio_padrao_custo <- sd(empresa_data$VlrCustoTotal, na.rm = TRUE)
-
-# Exibir os resultados
-cat("Média do Custo Total dos Projetos: R$", round(media_custo, 2), "\n")
-cat("Mediana do Custo Total dos Projetos: R$", round(mediana_custo, 2), "\n")
-cat("Variância do Custo Total dos Projetos: R$", round(variancia_custo, 2), "\n")
-cat("Desvio Padrão do Custo Total dos Projetos: R$", round(desvio_padrao_custo, 2), "\n")
-
-# Análise descritiva dos dados adicionais
-summary(empresa_data)
-
-# Agrupar por empresa e somar valores
-projetos_por_empresa <- empresa_data %>%
-  group_by(NomAgente) %>%
-  summarise(
-    TotalCusto = sum(VlrCustoTotal, na.rm = TRUE),
-    EnergiaEconomizada = sum(VlrEnergiaEconomizadaTotal, na.rm = TRUE),
-    TotalProjetos = n()
-  ) %>%
-  arrange(desc(TotalCusto))
-
-# Visualizar os primeiros resultados
-df_head <- head(projetos_por_empresa, 10)
-print(df_head)
-
-# Visualização dos Dados
-# Alterar NomAgente para conter apenas as iniciais
-projetos_por_empresa$NomAgente <- sapply(
-  strsplit(projetos_por_empresa$NomAgente, " "),
-  function(x) paste(toupper(substring(x, 1, 1)), collapse = "")
-)
+# Importar somente os arquivos CSV usados pelos gráficos pedidos
+if (length(graficos_empresa) > 0) {
+  empresa_data <- read.csv(file.path(dir_dados, "projetos-eficiencia-energetica-empresa.csv"), sep = ";", encoding = "latin1", stringsAsFactors = FALSE)
+
+  # Converter valores financeiros de string para numérico
+  empresa_data$VlrCustoTotal <- as.numeric(gsub(",", ".", empresa_data$VlrCustoTotal))
+  empresa_data$VlrEnergiaEconomizadaTotal <- as.numeric(gsub(",", ".", empresa_data$VlrEnergiaEconomizadaTotal))
+  empresa_data$VlrRetiradaDemandaPontaTotal <- as.numeric(gsub(",", ".", empresa_data$VlrRetiradaDemandaPontaTotal))
+
+  # Remover valores ausentes nas colunas principais
+  empresa_data <- na.omit(empresa_data)
+
+  # Resumo dos dados para garantir que foram limpos corretamente
+  str(empresa_data)
+
+  # Análise Exploratória dos Dados
+  # Calcular medidas de tendência central e dispersão
+  media_custo <- mean(empresa_data$VlrCustoTotal, na.rm = TRUE)
+  mediana_custo <- median(empresa_data$VlrCustoTotal, na.rm = TRUE)
+  variancia_custo <- var(empresa_data$VlrCustoTotal, na.rm = TRUE)
+  desvio_padrao_custo <- sd(empresa_data$VlrCustoTotal, na.rm = TRUE)
+
+  # Exibir os resultados
+  cat("Média do Custo Total dos Projetos: R$", round(media_custo, 2), "\n")
+  cat("Mediana do Custo Total dos Projetos: R$", round(mediana_custo, 2), "\n")
+  cat("Variância do Custo Total dos Projetos: R$", round(variancia_custo, 2), "\n")
+  cat("Desvio Padrão do Custo Total dos Projetos: R$", round(desvio_padrao_custo, 2), "\n")
+
+  # Salvar as estatísticas para comparação com o motor Python (scr/engine.py)
+  write.csv(
+    data.frame(
+      estatistica = c("media", "mediana", "variancia", "desvio_padrao"),
+      valor = c(media_custo, mediana_custo, variancia_custo, desvio_padrao_custo)
+    ),
+    file.path(dir_saida, "estatisticas.csv"),
+    row.names = FALSE
+  )
 
-# Gráfico de barras: Investimento Total por Empresa (com iniciais no eixo x)
-grafico_investimento <- ggplot(data = projetos_por_empresa, aes(x = reorder(NomAgente, -TotalCusto), y = TotalCusto, fill = NomAgente)) +
-  geom_bar(stat = "identity") +
-  theme_minimal() +
-  labs(
-    title = "Investimento Total por Empresa (Top 10)",
-    x = "Empresa (Iniciais)", y = "Investimento Total (R$)"
-  ) +
-  theme(axis.text.x = element_text(angle = 45, hjust = 1)) +
-  guides(fill = FALSE)
-
-# Exibir e salvar gráfico
-print(grafico_investimento)
-ggsave("scr/outputs/investimento_total_por_empresa.png", plot = grafico_investimento, width = 10, height = 6)
-
-# Análise de Correlação entre Investimento e Economia de Energia
-correlacao <- cor(empresa_data[, c("VlrCustoTotal", "VlrEnergiaEconomizadaTotal", "VlrRetiradaDemandaPontaTotal")], use = "complete.obs")
-cat("Correlação entre Investimento e Economia de Energia: \n")
-print(round(correlacao, 2))
-
-# Visualizar matriz de correlação
-png("scr/outputs/matriz_de_correlacao.png", width = 800, height = 800)
-corrplot(correlacao, method = "circle")
-dev.off()
-
-# Gráfico de dispersão: Investimento vs. Economia de Energia
-grafico_dispersao <- ggplot(empresa_data, aes(x = VlrCustoTotal, y = VlrEnergiaEconomizadaTotal)) +
-  geom_point(alpha = 0.5) +
-  geom_smooth(method = "lm", col = "red") +
-  theme_minimal() +
-  labs(
-    title = "Investimento vs Economia de Energia por Empresa",
-    x = "Investimento Total (R$)", y = "Energia Economizada (kWh)"
+  # Análise descritiva dos dados adicionais
+  print(summary(empresa_data))
+
+  # Agrupar por empresa e somar valores
+  projetos_por_empresa <- empresa_data %>%
+    group_by(NomAgente) %>%
+    summarise(
+      TotalCusto = sum(VlrCustoTotal, na.rm = TRUE),
+      EnergiaEconomizada = sum(VlrEnergiaEconomizadaTotal, na.rm = TRUE),
+      TotalProjetos = n()
+    ) %>%
+    arrange(desc(TotalCusto))
+
+  # Visualizar os primeiros resultados
+  df_head <- head(projetos_por_empresa, 10)
+  print(df_head)
+  write.csv(projetos_por_empresa, file.path(dir_saida, "projetos_por_empresa.csv"), row.names = FALSE, fileEncoding = "UTF-8")
+
+  # Visualização dos Dados
+  # Alterar NomAgente para conter apenas as iniciais
+  projetos_por_empresa$NomAgente <- sapply(
+    strsplit(projetos_por_empresa$NomAgente, " "),
+    function(x) paste(toupper(substring(x, 1, 1)), collapse = "")
   )
 
-# Exibir e salvar gráfico
-print(grafico_dispersao)
-ggsave("scr/outputs/investimento_vs_economia_energia.png", plot = grafico_dispersao, width = 10, height = 6)
+  # Gráfico de barras: Investimento Total por Empresa (com iniciais no eixo x)
+  grafico_investimento <- ggplot(data = projetos_por_empresa, aes(x = reorder(NomAgente, -TotalCusto), y = TotalCusto, fill = NomAgente)) +
+    geom_bar(stat = "identity") +
+    theme_minimal() +
+    labs(
+      title = "Investimento Total por Empresa (Top 10)",
+      x = "Empresa (Iniciais)", y = "Investimento Total (R$)"
+    ) +
+    theme(axis.text.x = element_text(angle = 45, hjust = 1)) +
+    guides(fill = FALSE)
+
+  # Exibir e salvar gráfico
+  if ("investimento_total_por_empresa" %in% graficos) {
+    print(grafico_investimento)
+    ggsave(file.path(dir_saida, "investimento_total_por_empresa.png"), plot = grafico_investimento, width = 10, height = 6)
+    grafico_concluido("investimento_total_por_empresa")
+  }
+
+  # Análise de Correlação entre Investimento e Economia de Energia
+  correlacao <- cor(empresa_data[, c("VlrCustoTotal", "VlrEnergiaEconomizadaTotal", "VlrRetiradaDemandaPontaTotal")], use = "complete.obs")
+  cat("Correlação entre Investimento e Economia de Energia: \n")
+  print(round(correlacao, 2))
+  write.csv(correlacao, file.path(dir_saida, "correlacao.csv"))
+
+  # Visualizar matriz de correlação
+  if ("matriz_de_correlacao" %in% graficos) {
+    png(file.path(dir_saida, "matriz_de_correlacao.png"), width = 800, height = 800)
+    corrplot(correlacao, method = "circle")
+    dev.off()
+    grafico_concluido("matriz_de_correlacao")
+  }
+
+  # Gráfico de dispersão: Investimento vs. Economia de Energia
+  grafico_dispersao <- ggplot(empresa_data, aes(x = VlrCustoTotal, y = VlrEnergiaEconomizadaTotal)) +
+    geom_point(alpha = 0.5) +
+    geom_smooth(method = "lm", col = "red") +
+    theme_minimal() +
+    labs(
+      title = "Investimento vs Economia de Energia por Empresa",
+      x = "Investimento Total (R$)", y = "Energia Economizada (kWh)"
+    )
+
+  # Exibir e salvar gráfico
+  if ("investimento_vs_economia_energia" %in% graficos) {
+    print(grafico_dispersao)
+    ggsave(file.path(dir_saida, "investimento_vs_economia_energia.png"), plot = grafico_dispersao, width = 10, height = 6)
+    grafico_concluido("investimento_vs_economia_energia")
+  }
+}
 
 # Análise de Frequência de Uso por Tipo de Equipamento
-equipamento_frequencia <- equipamento_data %>%
-  count(DscTipoEquipamento) %>%
-  arrange(desc(n))
-
-# Gráfico de barras para frequência de uso de tipos de equipamento
-grafico_frequencia <- ggplot(equipamento_frequencia, aes(x = reorder(DscTipoEquipamento, -n), y = n, fill = DscTipoEquipamento)) +
-  geom_bar(stat = "identity") +
-  theme_minimal() +
-  labs(
-    title = "Frequência de Uso por Tipo de Equipamento",
-    x = "Tipo de Equipamento", y = "Frequência de Uso"
-  ) +
-  theme(axis.text.x = element_text(angle = 45, hjust = 1)) +
-  guides(fill = FALSE)
-
-# Exibir e salvar gráfico
-print(grafico_frequencia)
-ggsave("scr/outputs/frequencia_tipo_equipamento.png", plot = grafico_frequencia, width = 10, height = 6)
+if ("frequencia_tipo_equipamento" %in% graficos) {
+  equipamento_data <- read.csv(file.path(dir_dados, "projetos-eficiencia-energetica-equipamento.csv"), sep = ";", encoding = "latin1", stringsAsFactors = FALSE)
+  equipamento_frequencia <- equipamento_data %>%
+    count(DscTipoEquipamento) %>%
+    arrange(desc(n))
+  write.csv(equipamento_frequencia, file.path(dir_saida, "frequencia_tipo_equipamento.csv"), row.names = FALSE, fileEncoding = "UTF-8")
+
+  # Gráfico de barras para frequência de uso de tipos de equipamento
+  grafico_frequencia <- ggplot(equipamento_frequencia, aes(x = reorder(DscTipoEquipamento, -n), y = n, fill = DscTipoEquipamento)) +
+    geom_bar(stat = "identity") +
+    theme_minimal() +
+    labs(
+      title = "Frequência de Uso por Tipo de Equipamento",
+      x = "Tipo de Equipamento", y = "Frequência de Uso"
+    ) +
+    theme(axis.text.x = element_text(angle = 45, hjust = 1)) +
+    guides(fill = FALSE)
+
+  # Exibir e salvar gráfico
+  print(grafico_frequencia)
+  ggsave(file.path(dir_saida, "frequencia_tipo_equipamento.png"), plot = grafico_frequencia, width = 10, height = 6)
+  grafico_concluido("frequencia_tipo_equipamento")
+}
@@ -0,0 +1,215 @@
+"""Benchmark of the Python (scr/engine.py) and R (scr/analysis.r) SCR engines.
+
+Times each stage of the Python engine and, when Rscript is installed, the
+whole R script on the same data. Without --data-dir, synthetic CSVs in the
+ANEEL layout are generated with the given number of rows.
+
+Usage (from the project root):
+    python -m scr.benchmark --rows 10000 100000 --output bench.json
+    python -m scr.benchmark --data-dir scr
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+
+import scr.engine as engine
+
+REPEAT = 3
+EMPRESA_COLUMNS = (
+    "DatGeracaoConjuntoDados",
+    "NomAgente",
+    "IdeEmpresaProponenteProjeto",
+    "DscCodProjeto",
+    "DscTituloProjeto",
+    "DscTipologia",
+    "VlrCustoTotal",
+    "VlrRcbGlobal",
+    "VlrEnergiaEconomizadaTotal",
+    "VlrRetiradaDemandaPontaTotal",
+    "DscObjetivo",
+    "DscJustificativa",
+    "DatInicioProjeto",
+    "DatConclusaoProjeto",
+    "DscMetodologiaMv",
+)
+AGENTES = (
+    "Cemig Distribuição S.A.",
+    "Copel Distribuição S.A",
+    "Companhia de Eletricidade do Estado da Bahia",
+    "COMPANHIA PAULISTA DE FORÇA E LUZ",
+    "ELETROPAULO METROPOLITANA ELETRICIDADE DE SÃO PAULO S.A.",
+    "Light Serviços de Eletricidade S.A.",
+    "Energisa Mato Grosso - Distribuidora de Energia S.A.",
+    "Equatorial Pará Distribuidora de Energia S.A.",
+)
+TIPOLOGIAS = ("Residencial", "Industrial", "Comercial", "Poder Público", "Rural")
+EQUIPAMENTOS = (
+    "Lâmpada LED",
+    "Refrigerador",
+    "Motor",
+    "Ar Condicionado",
+    "Aquecedor Solar",
+    "Chuveiro",
+)
+MISSING_SHARE = 0.05  # Share of rows with a blank financial value
+
+
+def decimal_comma(value):
+    return f"{value:.2f}".replace(".", ",")
+
+
+def write_synthetic_data(data_dir, rows, seed=42):
+    """Write synthetic company and equipment CSVs (latin1, ";") to data_dir."""
+    rng = random.Random(seed)
+    empresa_path, equipamento_path = engine.data_paths(data_dir)
+    with open(empresa_path, "w", encoding="latin1", newline="") as empresa_file:
+        empresa_file.write(";".join(EMPRESA_COLUMNS) + "\n")
+        for row in range(rows):
+            cost = rng.lognormvariate(12.5, 1.5)
+            values = [
+                decimal_comma(cost),
+                decimal_comma(cost * rng.uniform(0.5, 1.5)),
+                decimal_comma(cost / 1000 * rng.uniform(0.2, 2.0)),
+                decimal_comma(rng.uniform(0, 500)),
+            ]
+            if rng.random() < MISSING_SHARE:
+                values[rng.choice((0, 2, 3))] = ""
+            fields = [
+                "2024-11-01",
+                rng.choice(AGENTES),
+                str(rng.randint(1, 99)),
+                f"PE-{row:06d}",
+                f"Projeto de eficiência {row}",
+                rng.choice(TIPOLOGIAS),
+                values[0],
+                values[1] if rng.random() > 0.15 else "",
+                values[2],
+                values[3],
+                "Reduzir o consumo" if rng.random() > 0.5 else "",
+                "Substituição de equipamentos ineficientes",
+                "2020-01-01",
+                "2021-06-30",
+                "Opção A" if rng.random() > 0.3 else "",
+            ]
+            empresa_file.write(";".join(fields) + "\n")
+    with open(equipamento_path, "w", encoding="latin1", newline="") as equipamento_file:
+        equipamento_file.write("DscCodProjeto;DscTipoEquipamento;QtdEquipamento\n")
+        for row in range(rows * 3):
+            equipamento_file.write(
+                f"PE-{rng.randrange(rows):06d};{rng.choice(EQUIPAMENTOS)};"
+                f"{rng.randint(1, 500)}\n"
+            )
+
+
+def time_call(function, repeat=REPEAT):
+    """Return (median ms, last result) of repeated calls."""
+    samples = []
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        result = function()
+        samples.append((time.perf_counter() - started_at) * 1000)
+    return round(statistics.median(samples), 3), result
+
+
+def run_r(data_dir, output_dir):
+    """Run the R script on data_dir, returning the elapsed ms (None without R)."""
+    if shutil.which("Rscript") is None:
+        return None
+    environment = dict(os.environ, SCR_DATA_DIR=data_dir, SCR_OUTPUT_DIR=output_dir)
+    started_at = time.perf_counter()
+    subprocess.run(
+        ["Rscript", "scr/analysis.r"],
+        env=environment,
+        check=True,
+        capture_output=True,
+    )
+    return round((time.perf_counter() - started_at) * 1000, 3)
+
+
+def benchmark(data_dir, repeat=REPEAT):
+    empresa_path, equipamento_path = engine.data_paths(data_dir)
+    read_ms, empresa_data = time_call(
+        lambda: engine.read_empresa_data(empresa_path), repeat
+    )
+    frequencia_ms, frequencia = time_call(
+        lambda: engine.read_equipamento_frequencia(equipamento_path), repeat
+    )
+    statistics_ms, results = time_call(
+        lambda: engine.compute_statistics(empresa_data), repeat
+    )
+    figures_ms, _ = time_call(
+        lambda: (
+            engine.figure_investimento(results["projetos_por_empresa"]),
+            engine.figure_correlacao(results["correlacao"]),
+            engine.figure_dispersao(empresa_data),
+            engine.figure_frequencia(frequencia),
+        ),
+        repeat,
+    )
+    total_ms, _ = time_call(lambda: engine.run_analysis(data_dir), repeat)
+    with tempfile.TemporaryDirectory() as output_dir:
+        r_ms = run_r(data_dir, output_dir)
+    with open(empresa_path, encoding="latin1") as empresa_file:
+        empresa_rows = sum(1 for _ in empresa_file) - 1
+    return {
+        "empresa_rows": empresa_rows,
+        "clean_rows": len(empresa_data),
+        "empresa_memory_bytes": int(empresa_data.memory_usage(deep=True).sum()),
+        "python": {
+            "read_empresa_ms": read_ms,
+            "read_equipamento_ms": frequencia_ms,
+            "statistics_ms": statistics_ms,
+            "figures_ms": figures_ms,
+            "total_ms": total_ms,
+        },
+        "r_total_ms": r_ms,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the Python and R engines of the SCR analysis."
+    )
+    parser.add_argument("--data-dir", help="folder with the ANEEL CSVs")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write the JSON results to this file")
+    args = parser.parse_args()
+
+    results = {
+        "environment": {
+            "python": platform.python_version(),
+            "pandas": engine.pd.__version__,
+            "platform": platform.platform(),
+            "rscript": shutil.which("Rscript"),
+        },
+        "runs": [],
+    }
+    if args.data_dir:
+        results["runs"].append(benchmark(args.data_dir, args.repeat))
+    else:
+        for rows in args.rows:
+            with tempfile.TemporaryDirectory() as data_dir:
+                write_synthetic_data(data_dir, rows, args.seed)
+                results["runs"].append(benchmark(data_dir, args.repeat))
+            print(f"{rows} rows: {results['runs'][-1]['python']}", flush=True)
+
+    output = json.dumps(results, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+"""Python port of the SCR analysis (scr/analysis.r), using pandas and Plotly.
+
+Reads the ANEEL CSVs in typed chunks, computes the same statistics as the R
+script and builds its four charts as interactive Plotly figures, so the SCR
+section works without an R toolchain. See scr/parity.py for the comparison
+with the R outputs and scr/benchmark.py for timings.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+from common.cache import QueryCache
+
+DATA_DIR = "scr"
+EMPRESA_FILE = "projetos-eficiencia-energetica-empresa.csv"
+EQUIPAMENTO_FILE = "projetos-eficiencia-energetica-equipamento.csv"
+CSV_OPTIONS = {"sep": ";", "encoding": "latin1"}
+CHUNK_SIZE = 5000  # CSV rows parsed at a time
+# Financial columns stored with a decimal comma, converted like the R script
+VALUE_COLUMNS = (
+    "VlrCustoTotal",
+    "VlrEnergiaEconomizadaTotal",
+    "VlrRetiradaDemandaPontaTotal",
+)
+ANALYSIS_CACHE_TTL = 3600.0  # The CSVs are only replaced by a new ANEEL download
+
+
+def data_paths(data_dir=DATA_DIR):
+    return (
+        os.path.join(data_dir, EMPRESA_FILE),
+        os.path.join(data_dir, EQUIPAMENTO_FILE),
+    )
+
+
+def parse_decimal(values):
+    """as.numeric(gsub(",", ".", values)): invalid values become NaN."""
+    return pd.to_numeric(values.str.replace(",", ".", regex=False), errors="coerce")
+
+
+def read_csv_chunks(path, chunk_size=CHUNK_SIZE, usecols=None):
+    """Read a CSV as strings, in chunks. Like R's read.csv, only "NA" is missing."""
+    return pd.read_csv(
+        path,
+        dtype=str,
+        keep_default_na=False,
+        na_values=["NA"],
+        usecols=usecols,
+        chunksize=chunk_size,
+        **CSV_OPTIONS,
+    )
+
+
+def read_empresa_data(path, chunk_size=CHUNK_SIZE):
+    """Read the projects by company, cleaned like the R script.
+
+    Only the company name and the converted VALUE_COLUMNS are kept. Rows are
+    dropped as na.omit does after read.csv: when a value column does not
+    parse, a field is "NA", or a field is blank in a column read.csv types
+    as numeric (all of its non-blank fields are numbers).
+    """
+    frames = []
+    missing = []  # Per chunk: rows with a missing field regardless of the type
+    blanks = []  # Per chunk: blank fields of every other column
+    non_numeric = set()  # Columns read.csv keeps as text
+    for chunk in read_csv_chunks(path, chunk_size):
+        values = pd.DataFrame(
+            {column: parse_decimal(chunk[column]) for column in VALUE_COLUMNS}
+        )
+        other_columns = chunk.columns.difference(VALUE_COLUMNS)
+        text = chunk[other_columns]
+        blank = text == ""
+        non_numeric.update(
+            column
+            for column in other_columns.difference(non_numeric)
+            if pd.to_numeric(text[column][~blank[column]], errors="coerce").isna().any()
+        )
+        missing.append(chunk.isna().any(axis=1) | values.isna().any(axis=1))
+        blanks.append(blank)
+        frames.append(pd.concat([chunk[["NomAgente"]], values], axis=1))
+
+    if not frames:
+        return pd.DataFrame(columns=["NomAgente", *VALUE_COLUMNS])
+    data = pd.concat(frames, ignore_index=True)
+    dropped = pd.concat(missing, ignore_index=True)
+    blank = pd.concat(blanks, ignore_index=True)
+    numeric_columns = [column for column in blank.columns if column not in non_numeric]
+    if numeric_columns:
+        dropped |= blank[numeric_columns].any(axis=1)
+    data = data[~dropped.to_numpy()].reset_index(drop=True)
+    data["NomAgente"] = data["NomAgente"].astype("category")
+    return data
+
+
+def read_equipamento_frequencia(path, chunk_size=CHUNK_SIZE):
+    """Count the projects per equipment type, most frequent first."""
+    counts = None
+    for chunk in read_csv_chunks(path, chunk_size, usecols=["DscTipoEquipamento"]):
+        chunk_counts = chunk["DscTipoEquipamento"].value_counts(dropna=False)
+        counts = (
+            chunk_counts if counts is None else counts.add(chunk_counts, fill_value=0)
+        )
+    if counts is None:
+        return pd.DataFrame({"DscTipoEquipamento": [], "n": []})
+    frequencia = counts.astype("int64").rename("n").reset_index()
+    frequencia.columns = ["DscTipoEquipamento", "n"]
+    # Ties ordered by type, as dplyr's count() and arrange() do
+    return frequencia.sort_values(
+        ["n", "DscTipoEquipamento"], ascending=[False, True], na_position="last"
+    ).reset_index(drop=True)
+
+
+def compute_statistics(empresa_data):
+    """Descriptive statistics, correlation matrix and totals per company."""
+    custo = empresa_data["VlrCustoTotal"]
+    projetos_por_empresa = (
+        empresa_data.groupby("NomAgente", observed=True)
+        .agg(
+            TotalCusto=("VlrCustoTotal", "sum"),
+            EnergiaEconomizada=("VlrEnergiaEconomizadaTotal", "sum"),
+            TotalProjetos=("VlrCustoTotal", "size"),
+        )
+        .reset_index()
+        .sort_values("TotalCusto", ascending=False, kind="stable")
+        .reset_index(drop=True)
+    )
+    projetos_por_empresa["NomAgente"] = projetos_por_empresa["NomAgente"].astype(str)
+    return {
+        "media": custo.mean(),
+        "mediana": custo.median(),
+        "variancia": custo.var(),
+        "desvio_padrao": custo.std(),
+        "correlacao": empresa_data[list(VALUE_COLUMNS)].corr(),
+        "projetos_por_empresa": projetos_por_empresa,
+    }
+
+
+def initials(name):
+    """Upper-cased first letters of the words of a name, as in the R script."""
+    return "".join(word[:1].upper() for word in name.split(" "))
+
+
+def figure_investimento(projetos_por_empresa):
+    import plotly.express as px
+
+    # Companies with the same initials share a bar, as in the ggplot chart
+    data = projetos_por_empresa.assign(
+        NomAgente=projetos_por_empresa["NomAgente"].map(initials)
+    )
+    order = data.groupby("NomAgente")["TotalCusto"].mean().sort_values(ascending=False)
+    data = data.groupby("NomAgente", as_index=False)["TotalCusto"].sum()
+    figure = px.bar(
+        data,
+        x="NomAgente",
+        y="TotalCusto",
+        color="NomAgente",
+        category_orders={"NomAgente": list(order.index)},
+        title="Investimento Total por Empresa (Top 10)",
+        labels={
+            "NomAgente": "Empresa (Iniciais)",
+            "TotalCusto": "Investimento Total (R$)",
+        },
+    )
+    figure.update_layout(showlegend=False, xaxis_tickangle=-45)
+    return figure
+
+
+def figure_correlacao(correlacao):
+    import plotly.express as px
+
+    figure = px.imshow(
+        correlacao,
+        text_auto=".2f",
+        zmin=-1,
+        zmax=1,
+        color_continuous_scale="RdBu",
+        title="Matriz de Correlação",
+    )
+    return figure
+
+
+def figure_dispersao(empresa_data):
+    import plotly.express as px
+
+    x = empresa_data["VlrCustoTotal"].to_numpy()
+    y = empresa_data["VlrEnergiaEconomizadaTotal"].to_numpy()
+    figure = px.scatter(
+        empresa_data,
+        x="VlrCustoTotal",
+        y="VlrEnergiaEconomizadaTotal",
+        opacity=0.5,
+        title="Investimento vs Economia de Energia por Empresa",
+        labels={
+            "VlrCustoTotal": "Investimento Total (R$)",
+            "VlrEnergiaEconomizadaTotal": "Energia Economizada (kWh)",
+        },
+    )
+    if len(x) > 1:
+        # Least squares line, like geom_smooth(method = "lm")
+        slope, intercept = np.polyfit(x, y, 1)
+        line_x = np.array([x.min(), x.max()])
+        figure.add_scatter(
+            x=line_x,
+            y=slope * line_x + intercept,
+            mode="lines",
+            line={"color": "red"},
+            name="Tendência linear",
+        )
+    return figure
+
+
+def figure_frequencia(equipamento_frequencia):
+    import plotly.express as px
+
+    figure = px.bar(
+        equipamento_frequencia,
+        x="DscTipoEquipamento",
+        y="n",
+        color="DscTipoEquipamento",
+        title="Frequência de Uso por Tipo de Equipamento",
+        labels={"DscTipoEquipamento": "Tipo de Equipamento", "n": "Frequência de Uso"},
+    )
+    figure.update_layout(showlegend=False, xaxis_tickangle=-45)
+    return figure
+
+
+def run_analysis(data_dir=DATA_DIR, figures=True):
+    """Run the whole analysis, returning its statistics and (optionally) figures.
+
+    The figures are keyed by the names of the charts of the R script.
+    """
+    empresa_path, equipamento_path = data_paths(data_dir)
+    empresa_data = read_empresa_data(empresa_path)
+    statistics = compute_statistics(empresa_data)
+    statistics["equipamento_frequencia"] = read_equipamento_frequencia(equipamento_path)
+    result = {"statistics": statistics, "rows": len(empresa_data)}
+    if figures:
+        result["figures"] = {
+            "investimento_total_por_empresa": figure_investimento(
+                statistics["projetos_por_empresa"]
+            ),
+            "matriz_de_correlacao": figure_correlacao(statistics["correlacao"]),
+            "investimento_vs_economia_energia": figure_dispersao(empresa_data),
+            "frequencia_tipo_equipamento": figure_frequencia(
+                statistics["equipamento_frequencia"]
+            ),
+        }
+    return result
+
+
+def data_version():
+    """Size and mtime of the CSVs in DATA_DIR, which change when they are replaced."""
+    version = []
+    for path in data_paths():
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            version.append(None)
+        else:
+            version.append((stat.st_size, stat.st_mtime))
+    return tuple(version)
+
+
+ANALYSIS_CACHE = QueryCache(data_version, ttl=ANALYSIS_CACHE_TTL, name="scr")
+
+
+@ANALYSIS_CACHE.cached
+def load_analysis():
+    """run_analysis() on DATA_DIR, cached until the CSVs change."""
+    return run_analysis()
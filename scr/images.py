@@ -0,0 +1,86 @@
+import hashlib
+import os
+import tempfile
+from functools import lru_cache
+
+from PIL import Image
+
+THUMBNAIL_DIR = "scr/outputs/thumbnails"
+THUMBNAIL_WIDTH = 480  # Grid previews; the R charts are saved 3000 px wide
+# Expanded view; Streamlit re-encodes images wider than its 1460 px content width
+PREVIEW_WIDTH = 1460
+# Streamlit serves PNG and JPEG bytes as they are but re-encodes any other
+# format; the charts have few colours, so a palette PNG is the smallest
+IMAGE_FORMAT = "PNG"
+PALETTE_COLORS = 256
+MEMORY_CACHE_SIZE = 64  # Encoded variants kept in memory, by variant path
+
+
+def image_key(path):
+    """Short fingerprint of an image file, from its size and mtime."""
+    stat = os.stat(path)
+    fingerprint = f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+    return hashlib.sha256(fingerprint.encode("utf-8")).hexdigest()[:16]
+
+
+def variant_path(path, width, key):
+    name = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(THUMBNAIL_DIR, f"{name}-{width}-{key}.png")
+
+
+def build_variant(path, width, target):
+    """Resize an image to width (never enlarging it) and save it as a palette PNG."""
+    with Image.open(path) as image:
+        if image.width > width:
+            height = round(image.height * width / image.width)
+            image = image.resize((width, height), Image.Resampling.LANCZOS)
+        image = image.quantize(PALETTE_COLORS, method=Image.Quantize.FASTOCTREE)
+        # A file of its own, as sessions may build the same variant at once
+        with tempfile.NamedTemporaryFile(
+            dir=THUMBNAIL_DIR, suffix=".tmp", delete=False
+        ) as temporary_file:
+            image.save(temporary_file, IMAGE_FORMAT, optimize=True)
+    os.replace(temporary_file.name, target)
+
+
+def remove_stale_variants(path, width, current):
+    """Delete the variants of older versions of an image."""
+    name = os.path.splitext(os.path.basename(path))[0]
+    prefix = f"{name}-{width}-"
+    for file_name in os.listdir(THUMBNAIL_DIR):
+        file_path = os.path.join(THUMBNAIL_DIR, file_name)
+        if file_name.startswith(prefix) and file_path != current:
+            os.remove(file_path)
+
+
+def image_variant(path, width):
+    """Return the path of a resized variant of an image, generating it if needed.
+
+    Variants are named after the image's size and mtime, so a regenerated
+    chart gets a new variant and unchanged charts are never resized again.
+    """
+    target = variant_path(path, width, image_key(path))
+    if not os.path.exists(target):
+        os.makedirs(THUMBNAIL_DIR, exist_ok=True)
+        build_variant(path, width, target)
+        remove_stale_variants(path, width, target)
+    return target
+
+
+@lru_cache(maxsize=MEMORY_CACHE_SIZE)
+def read_variant(target):
+    # Variant files never change once written, so their path is a safe key
+    with open(target, "rb") as variant_file:
+        return variant_file.read()
+
+
+def load_variant(path, width):
+    """Return the encoded bytes of a resized variant of an image."""
+    return read_variant(image_variant(path, width))
+
+
+def list_images(output_dir, order=()):
+    """PNG files of output_dir: the names in order first, then alphabetically."""
+    names = [name for name in os.listdir(output_dir) if name.endswith(".png")]
+    rank = {f"{name}.png": index for index, name in enumerate(order)}
+    return sorted(names, key=lambda name: (rank.get(name, len(rank)), name))
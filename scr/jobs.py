@@ -0,0 +1,195 @@
+import hashlib
+import json
+import os
+import subprocess
+import threading
+import time
+from collections import deque
+
+from scr import images
+
+SCRIPT_PATH = "scr/analysis.r"
+OUTPUT_DIR = "scr/outputs"
+MANIFEST_PATH = "scr/outputs/manifest.json"
+RSCRIPT_COMMAND = ("Rscript",)
+EMPRESA_CSV = "scr/projetos-eficiencia-energetica-empresa.csv"
+EQUIPAMENTO_CSV = "scr/projetos-eficiencia-energetica-equipamento.csv"
+# Source files of each chart generated by the R script, besides the script
+CHART_INPUTS = {
+    "investimento_total_por_empresa": (EMPRESA_CSV,),
+    "matriz_de_correlacao": (EMPRESA_CSV,),
+    "investimento_vs_economia_energia": (EMPRESA_CSV,),
+    "frequencia_tipo_equipamento": (EQUIPAMENTO_CSV,),
+}
+LOG_LINES = 50  # Last lines of the R output kept for the status
+CHART_DONE_PREFIX = "CHART_DONE "  # Printed by the R script after saving a chart
+
+
+def chart_path(chart):
+    return os.path.join(OUTPUT_DIR, f"{chart}.png")
+
+
+def load_manifest():
+    """Return the manifest of the last runs: source fingerprints and chart hashes."""
+    try:
+        with open(MANIFEST_PATH, "r") as manifest_file:
+            return json.load(manifest_file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {"sources": {}, "charts": {}}
+
+
+def save_manifest(manifest):
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    temporary_path = MANIFEST_PATH + ".tmp"
+    with open(temporary_path, "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+    os.replace(temporary_path, MANIFEST_PATH)
+
+
+def source_hash(path, manifest):
+    """SHA-256 of a source file, reusing the manifest's while size and mtime match."""
+    if not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    known = manifest["sources"].get(path)
+    if known and known["size"] == stat.st_size and known["mtime"] == stat.st_mtime:
+        return known["sha256"]
+    digest = hashlib.sha256()
+    with open(path, "rb") as source_file:
+        for block in iter(lambda: source_file.read(1024 * 1024), b""):
+            digest.update(block)
+    manifest["sources"][path] = {
+        "size": stat.st_size,
+        "mtime": stat.st_mtime,
+        "sha256": digest.hexdigest(),
+    }
+    return digest.hexdigest()
+
+
+def chart_hash(chart, manifest):
+    """Hash of the inputs of a chart: the R script and the chart's sources."""
+    digest = hashlib.sha256()
+    for path in (SCRIPT_PATH,) + CHART_INPUTS[chart]:
+        digest.update(f"{path}={source_hash(path, manifest)};".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def stale_charts(manifest=None):
+    """Return {chart: input hash} of the charts that are missing or out of date."""
+    manifest = manifest or load_manifest()
+    stale = {}
+    for chart in CHART_INPUTS:
+        current = chart_hash(chart, manifest)
+        if manifest["charts"].get(chart) != current or not os.path.exists(
+            chart_path(chart)
+        ):
+            stale[chart] = current
+    return stale
+
+
+class AnalysisRunner:
+    """Runs the R analysis in a background thread, one job at a time.
+
+    start() only regenerates the charts whose inputs changed since they were
+    last generated (or every chart when forced) and returns immediately;
+    status() reports the progress, fed by the CHART_DONE lines of the script.
+    A chart's hash is recorded as soon as it is saved, so a failed run keeps
+    the charts it completed.
+    """
+
+    def __init__(self, command=RSCRIPT_COMMAND, script_path=SCRIPT_PATH):
+        self.command = command
+        self.script_path = script_path
+        self._lock = threading.Lock()
+        self._thread = None
+        self._status = {"state": "idle", "charts": [], "done": []}
+
+    def start(self, force=False):
+        """Start a job for the stale charts, unless one is already running."""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._start(force)
+        return self.status()
+
+    def _start(self, force):
+        manifest = load_manifest()
+        stale = stale_charts(manifest)
+        if force:
+            stale = {chart: chart_hash(chart, manifest) for chart in CHART_INPUTS}
+        # Keep the source fingerprints, so unchanged files are not hashed again
+        save_manifest(manifest)
+        now = time.time()
+        self._status = {
+            "state": "running" if stale else "skipped",
+            "charts": sorted(stale),
+            "done": [],
+            "started_at": now,
+            "finished_at": None if stale else now,
+            "error": None,
+            "log": deque(maxlen=LOG_LINES),
+        }
+        if stale:
+            self._thread = threading.Thread(
+                target=self._run,
+                args=(stale, manifest),
+                name="r-analysis",
+                daemon=True,
+            )
+            self._thread.start()
+
+    def _run(self, stale, manifest):
+        command = list(self.command) + [self.script_path] + sorted(stale)
+        try:
+            process = subprocess.Popen(
+                command,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                text=True,
+            )
+            for line in process.stdout:
+                line = line.rstrip("\n")
+                with self._lock:
+                    self._status["log"].append(line)
+                chart = line[len(CHART_DONE_PREFIX) :].strip()
+                if line.startswith(CHART_DONE_PREFIX) and chart in stale:
+                    manifest["charts"][chart] = stale[chart]
+                    save_manifest(manifest)
+                    try:
+                        # Resize while the script renders the next charts
+                        images.image_variant(chart_path(chart), images.THUMBNAIL_WIDTH)
+                    except OSError:
+                        pass  # Generated when the chart is first displayed
+                    with self._lock:
+                        self._status["done"].append(chart)
+            returncode = process.wait()
+            error = None if returncode == 0 else self._log_tail()
+        except Exception as e:
+            error = str(e)
+        with self._lock:
+            self._status["state"] = "failed" if error else "succeeded"
+            self._status["error"] = error
+            self._status["finished_at"] = time.time()
+
+    def _log_tail(self):
+        with self._lock:
+            return "\n".join(self._status["log"])
+
+    def status(self):
+        """Return a snapshot of the current or last job."""
+        with self._lock:
+            status = dict(self._status)
+            status["done"] = list(status["done"])
+            status["log"] = list(status.get("log", ()))
+            total = len(status["charts"])
+            status["progress"] = len(status["done"]) / total if total else 1.0
+            if status.get("started_at"):
+                status["elapsed_seconds"] = round(
+                    (status["finished_at"] or time.time()) - status["started_at"], 1
+                )
+            return status
+
+    def is_running(self):
+        return self.status()["state"] == "running"
+
+
+RUNNER = AnalysisRunner()
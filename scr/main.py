@@ -1,25 +1,53 @@
 import streamlit as st
 import os
-import subprocess
-from PIL import Image
+from scr import engine, images
+from scr.jobs import CHART_INPUTS, RUNNER
 
+# Seconds between the status updates while the R script runs
+STATUS_REFRESH_SECONDS = 2
+# Engines of the analysis; the Python one runs in-process, without R
+ENGINES = ("Python (pandas/Plotly)", "R (script)")
+THUMBNAIL_COLUMNS = 2  # Chart thumbnails per row
 
-def execute_r_script():
-    """Executes the R script using subprocess."""
-    try:
-        result = subprocess.run(
-            ["Rscript", "scr/analysis.r"], capture_output=True, text=True
+
+def render_job_status():
+    """Shows the progress of the R analysis job, rerunning the page when it ends."""
+    status = RUNNER.status()
+    if status["state"] == "running":
+        st.progress(
+            status["progress"],
+            text=f"Executando script R: {len(status['done'])} de "
+            f"{len(status['charts'])} gráficos ({status['elapsed_seconds']} s)",
+        )
+        st.session_state["scr_job_running"] = True
+        return
+    if st.session_state.pop("scr_job_running", False):
+        # The job finished since the last run: show the new charts
+        st.rerun()
+    if status["state"] == "succeeded":
+        st.success(
+            f"Script R executado com sucesso! Gráficos atualizados: "
+            f"{', '.join(status['done'])} ({status['elapsed_seconds']} s)"
         )
-        if result.returncode == 0:
-            st.success("Script R executado com sucesso!")
-        else:
-            st.error(f"Erro ao executar o script R: {result.stderr}")
-    except Exception as e:
-        st.error(f"Ocorreu um erro ao executar o script R: {e}")
+    elif status["state"] == "skipped":
+        st.info("Os gráficos já estão atualizados; nenhuma entrada do script mudou.")
+    elif status["state"] == "failed":
+        st.error(f"Erro ao executar o script R: {status['error']}")
+
+
+@st.dialog("Gráfico", width="large")
+def show_image(path):
+    """Shows a larger variant of a chart, only sent when its thumbnail is clicked."""
+    st.image(
+        images.load_variant(path, images.PREVIEW_WIDTH),
+        caption=os.path.basename(path),
+        use_container_width=True,
+        output_format=images.IMAGE_FORMAT,
+    )
 
 
 def display_images():
-    """Displays images from the 'outputs' folder."""
+    """Displays thumbnails of the charts in the 'outputs' folder."""
     output_dir = "scr/outputs"
     if not os.path.exists(output_dir):
         st.warning(
@@ -27,7 +55,7 @@ def display_images():
         )
         return
 
-    image_files = [f for f in os.listdir(output_dir) if f.endswith(".png")]
+    image_files = images.list_images(output_dir, order=CHART_INPUTS)
 
     if not image_files:
         st.warning(
@@ -35,28 +63,72 @@ def display_images():
         )
         return
 
-    for i, image_file in enumerate(image_files):
-        st.image(
-            os.path.join(output_dir, image_file),
-            caption=image_file,
-            use_container_width=True,
+    # Cached thumbnails in a grid, sent as they are stored; the larger variant
+    # is loaded on click
+    for start in range(0, len(image_files), THUMBNAIL_COLUMNS):
+        columns = st.columns(THUMBNAIL_COLUMNS)
+        for column, image_file in zip(
+            columns, image_files[start : start + THUMBNAIL_COLUMNS]
+        ):
+            path = os.path.join(output_dir, image_file)
+            with column:
+                st.image(
+                    images.load_variant(path, images.THUMBNAIL_WIDTH),
+                    caption=image_file,
+                    use_container_width=True,
+                    output_format=images.IMAGE_FORMAT,
+                )
+                if st.button("Ampliar", key=f"scr_image_{image_file}"):
+                    show_image(path)
+
+
+def display_python_analysis():
+    """Displays the statistics and interactive charts of the Python engine."""
+    missing = [path for path in engine.data_paths() if not os.path.exists(path)]
+    if missing:
+        st.warning(
+            f"Arquivos de dados não encontrados: {', '.join(missing)}. "
+            "Baixe os CSVs da ANEEL para a pasta 'scr'."
         )
-        if i < len(image_files) - 1:  # Add separator except after the last image
-            st.markdown("---")
+        return
 
+    analysis = engine.load_analysis()
+    statistics = analysis["statistics"]
+    st.subheader("Custo Total dos Projetos")
+    columns = st.columns(4)
+    columns[0].metric("Média", f"R$ {statistics['media']:,.2f}")
+    columns[1].metric("Mediana", f"R$ {statistics['mediana']:,.2f}")
+    columns[2].metric("Desvio Padrão", f"R$ {statistics['desvio_padrao']:,.2f}")
+    columns[3].metric("Projetos", analysis["rows"])
 
-def dashboard():
-    """Main dashboard layout."""
-    st.title("SCR")
-    st.write(
-        "Este dashboard exibe gráficos gerados pelo script R para análise de eficiência energética."
-    )
+    st.subheader("Gráficos")
+    for figure in analysis["figures"].values():
+        st.plotly_chart(figure, use_container_width=True)
 
-    # Button to execute the R script
+
+def display_r_analysis():
+    """Runs the R script in the background and displays the charts it saved."""
+    # Button to execute the R script in the background, only for stale charts
+    force = st.checkbox("Regenerar todos os gráficos", value=False)
     if st.button("Executar Script R"):
-        with st.spinner("Executando script R..."):
-            execute_r_script()
+        RUNNER.start(force=force)
+
+    # Job status, refreshed periodically while the script runs
+    refresh = STATUS_REFRESH_SECONDS if RUNNER.is_running() else None
+    st.fragment(render_job_status, run_every=refresh)()
 
     # Display generated charts
     st.subheader("Gráficos Gerados")
     display_images()
+
+
+def dashboard():
+    """Main dashboard layout."""
+    st.title("SCR")
+    st.write("Este dashboard exibe a análise de eficiência energética dos projetos.")
+
+    selected_engine = st.radio("Motor da análise", ENGINES, horizontal=True)
+    if selected_engine == ENGINES[0]:
+        display_python_analysis()
+    else:
+        display_r_analysis()
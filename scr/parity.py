@@ -0,0 +1,145 @@
+"""Parity test of the Python engine (scr/engine.py) against the R script.
+
+Runs scr/analysis.r into a temporary folder and compares the statistics it
+saves (estatisticas.csv, correlacao.csv, projetos_por_empresa.csv and
+frequencia_tipo_equipamento.csv) with the ones computed by the engine.
+Exits with 0 on parity, 1 on a mismatch and 2 when it cannot run (no
+Rscript or no data).
+
+Usage (from the project root):
+    python -m scr.parity                   # the ANEEL CSVs in scr/
+    python -m scr.parity --synthetic 5000  # generated data (scr/benchmark.py)
+"""
+
+import argparse
+import math
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import pandas as pd
+
+import scr.engine as engine
+from scr.benchmark import write_synthetic_data
+from scr.jobs import SCRIPT_PATH
+
+RELATIVE_TOLERANCE = 1e-9  # write.csv keeps 15 significant digits
+
+
+def close(expected, actual):
+    if pd.isna(expected) or pd.isna(actual):
+        return pd.isna(expected) and pd.isna(actual)
+    return math.isclose(expected, actual, rel_tol=RELATIVE_TOLERANCE, abs_tol=1e-12)
+
+
+def compare_statistics(r_dir, statistics):
+    mismatches = []
+    expected = pd.read_csv(os.path.join(r_dir, "estatisticas.csv"))
+    for name, value in zip(expected["estatistica"], expected["valor"]):
+        if not close(value, statistics[name]):
+            mismatches.append(f"{name}: R={value!r} Python={statistics[name]!r}")
+
+    correlacao = pd.read_csv(os.path.join(r_dir, "correlacao.csv"), index_col=0)
+    for row in correlacao.index:
+        for column in correlacao.columns:
+            expected_value = correlacao.loc[row, column]
+            actual_value = statistics["correlacao"].loc[row, column]
+            if not close(expected_value, actual_value):
+                mismatches.append(
+                    f"correlacao[{row}, {column}]: R={expected_value!r} "
+                    f"Python={actual_value!r}"
+                )
+    return mismatches
+
+
+def compare_frames(name, expected, actual, text_columns):
+    if list(expected.columns) != list(actual.columns):
+        return [f"{name}: columns {list(expected.columns)} != {list(actual.columns)}"]
+    if len(expected) != len(actual):
+        return [f"{name}: {len(expected)} rows in R, {len(actual)} in Python"]
+    mismatches = []
+    for index, (expected_row, actual_row) in enumerate(
+        zip(expected.itertuples(index=False), actual.itertuples(index=False))
+    ):
+        for column, expected_value, actual_value in zip(
+            expected.columns, expected_row, actual_row
+        ):
+            if column in text_columns:
+                equal = str(expected_value) == str(actual_value)
+            else:
+                equal = close(float(expected_value), float(actual_value))
+            if not equal:
+                mismatches.append(
+                    f"{name}[{index}].{column}: R={expected_value!r} "
+                    f"Python={actual_value!r}"
+                )
+    return mismatches
+
+
+def run_parity(data_dir):
+    """Run both engines on data_dir and return the list of mismatches."""
+    statistics = engine.run_analysis(data_dir, figures=False)["statistics"]
+    with tempfile.TemporaryDirectory() as r_dir:
+        subprocess.run(
+            ["Rscript", SCRIPT_PATH],
+            env=dict(os.environ, SCR_DATA_DIR=data_dir, SCR_OUTPUT_DIR=r_dir),
+            check=True,
+            capture_output=True,
+        )
+        mismatches = compare_statistics(r_dir, statistics)
+        read_options = {"keep_default_na": False, "na_values": ["NA"]}
+        mismatches += compare_frames(
+            "projetos_por_empresa",
+            pd.read_csv(
+                os.path.join(r_dir, "projetos_por_empresa.csv"), **read_options
+            ),
+            statistics["projetos_por_empresa"],
+            text_columns={"NomAgente"},
+        )
+        mismatches += compare_frames(
+            "frequencia_tipo_equipamento",
+            pd.read_csv(
+                os.path.join(r_dir, "frequencia_tipo_equipamento.csv"), **read_options
+            ),
+            statistics["equipamento_frequencia"],
+            text_columns={"DscTipoEquipamento"},
+        )
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the Python engine of the SCR analysis with the R script."
+    )
+    parser.add_argument("--data-dir", default=engine.DATA_DIR)
+    parser.add_argument(
+        "--synthetic", type=int, metavar="ROWS", help="use generated data instead"
+    )
+    args = parser.parse_args()
+
+    if shutil.which("Rscript") is None:
+        print("Rscript not found: install R to run the parity test.")
+        sys.exit(2)
+    with tempfile.TemporaryDirectory() as synthetic_dir:
+        data_dir = args.data_dir
+        if args.synthetic:
+            data_dir = synthetic_dir
+            write_synthetic_data(data_dir, args.synthetic)
+        missing = [
+            path for path in engine.data_paths(data_dir) if not os.path.exists(path)
+        ]
+        if missing:
+            print(f"Missing data files: {', '.join(missing)}")
+            sys.exit(2)
+        mismatches = run_parity(data_dir)
+
+    for mismatch in mismatches:
+        print(mismatch)
+    print("Parity OK." if not mismatches else f"{len(mismatches)} mismatches.")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()